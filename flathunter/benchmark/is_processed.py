@@ -0,0 +1,58 @@
+"""Benchmark IdMaintainer.is_processed latency as the 'processed' table grows.
+
+Compares the current schema (indexed primary key) against the legacy schema,
+which had no index on the processed ids.
+
+Usage: python benchmark/is_processed.py [max_rows]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from flathunter.idmaintainer import IdMaintainer
+
+LOOKUPS = 500
+
+class LegacyIdMaintainer(IdMaintainer):
+    """IdMaintainer with the schema from before the migrations were introduced"""
+    MIGRATIONS = IdMaintainer.MIGRATIONS[:1]
+
+def fill(id_watch, rows):
+    """Make sure the processed table holds 'rows' ids"""
+    connection = id_watch.get_connection()
+    current = connection.execute('SELECT COUNT(*) FROM processed').fetchone()[0]
+    with connection:
+        connection.executemany('INSERT INTO processed VALUES(?)',
+                               ((expose_id,) for expose_id in range(current, rows)))
+
+def time_lookups(id_watch, rows):
+    """Average is_processed latency in microseconds, for half hits and half misses"""
+    ids = [random.randrange(rows * 2) for _ in range(LOOKUPS)]
+    start = time.perf_counter()
+    for expose_id in ids:
+        id_watch.is_processed(expose_id)
+    return (time.perf_counter() - start) / LOOKUPS * 1e6
+
+def main():
+    """Run the benchmark"""
+    max_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    sizes = [size for size in (1000, 10000, 100000, 1000000) if size <= max_rows]
+    with tempfile.TemporaryDirectory() as directory:
+        current = IdMaintainer(os.path.join(directory, 'current.db'))
+        legacy = LegacyIdMaintainer(os.path.join(directory, 'legacy.db'))
+        print(f"{'rows':>10} {'indexed (us)':>14} {'legacy (us)':>14}")
+        for size in sizes:
+            fill(current, size)
+            fill(legacy, size)
+            print(f"{size:>10} {time_lookups(current, size):>14.1f} "
+                  f"{time_lookups(legacy, size):>14.1f}")
+        for id_watch in (current, legacy):
+            id_watch.get_connection().close()
+
+if __name__ == '__main__':
+    main()
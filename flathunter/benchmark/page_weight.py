@@ -0,0 +1,57 @@
+"""Benchmark browser page loads with and without resource blocking.
+
+Loads the given URL repeatedly in ChromeDriver, once with the blocking profile
+of the crawler for that URL and once with blocking disabled, and reports the
+average load time, bytes transferred and number of requests.
+
+Usage: python benchmark/page_weight.py <chromedriver path> <url> [runs]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from flathunter.config import Config
+
+DRIVER_ARGUMENTS = ["--headless", "--no-sandbox"]
+
+PAGE_WEIGHT_SCRIPT = """
+const nav = performance.getEntriesByType('navigation')[0];
+const resources = performance.getEntriesByType('resource');
+return [nav.loadEventEnd - nav.startTime,
+        nav.transferSize + resources.reduce((sum, r) => sum + r.transferSize, 0),
+        resources.length + 1];
+"""
+
+def measure(driver_path, url, runs, blocking):
+    """Average load time (ms), transferred bytes and requests over 'runs' loads"""
+    config = Config(string=f"urls:\n  - {url}\nblock_resources:\n  enabled: {blocking}\n")
+    searcher = config.searcher_for_url(url)
+    if searcher is None:
+        sys.exit(f"No crawler for {url}")
+    driver = searcher.configure_driver(driver_path, DRIVER_ARGUMENTS)
+    driver.execute_cdp_cmd('Network.setCacheDisabled', {'cacheDisabled': True})
+    totals = [0, 0, 0]
+    try:
+        for _ in range(runs):
+            driver.get(url)
+            for idx, value in enumerate(driver.execute_script(PAGE_WEIGHT_SCRIPT)):
+                totals[idx] += value
+    finally:
+        driver.quit()
+    return [total / runs for total in totals]
+
+def main():
+    """Run the benchmark"""
+    if len(sys.argv) < 3:
+        sys.exit(__doc__)
+    driver_path, url = sys.argv[1], sys.argv[2]
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    print(f"{'profile':>10} {'load (ms)':>10} {'kB':>10} {'requests':>10}")
+    for name, blocking in (('full', False), ('blocking', True)):
+        load_time, size, requests = measure(driver_path, url, runs, blocking)
+        print(f"{name:>10} {load_time:>10.0f} {size / 1024:>10.0f} {requests:>10.0f}")
+
+if __name__ == "__main__":
+    main()
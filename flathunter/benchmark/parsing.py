@@ -0,0 +1,148 @@
+"""Benchmark parsing and extraction of the saved result pages in test/fixtures.
+
+Compares the old approach (html.parser on the full document, and the lambda
+predicates of the old extract_data) against the crawler's parser with its
+result strainer and its compiled selectors, and reports the time per page for
+parsing and for extraction.
+
+Usage: python benchmark/parsing.py [runs]
+"""
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from flathunter.config import Config
+from flathunter.crawl_immobilienscout import CrawlImmobilienscout
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test', 'fixtures')
+
+class BaselineImmobilienscout(CrawlImmobilienscout):
+    """ImmoScout crawler with the extraction code before the result strainer
+       and the compiled selectors, kept unchanged for comparison"""
+    # pylint: disable=too-many-locals,too-many-branches
+
+    def extract_data(self, soup):
+        """Extracts all exposes from a provided Soup object"""
+        entries = []
+
+        results_list = soup.find(id="resultListItems")
+        title_elements = results_list.find_all(
+            lambda e: e.name == 'a' and e.has_attr('class') and \
+                      'result-list-entry__brand-title-container' in e['class']
+        ) if results_list else []
+        expose_ids = []
+        expose_urls = []
+        for link in title_elements:
+            expose_id = int(link.get('href').split('/')[-1].replace('.html', ''))
+            expose_ids.append(expose_id)
+            if len(str(expose_id)) > 5:
+                expose_urls.append('https://www.immobilienscout24.de/expose/' + str(expose_id))
+            else:
+                expose_urls.append(link.get('href'))
+        self.__log__.debug(expose_ids)
+
+        attr_container_els = soup.find_all(
+          lambda e: e.has_attr('data-is24-qa') and \
+                    e['data-is24-qa'] == "attributes"
+          )
+        address_fields = soup.find_all(
+          lambda e: e.has_attr('class') and \
+                    'result-list-entry__address' in e['class']
+          )
+        gallery_elements = soup.find_all(
+          lambda e: e.has_attr('class') and \
+                    'result-list-entry__gallery-container' in e['class']
+        )
+        for idx, title_el in enumerate(title_elements):
+            attr_els = attr_container_els[idx].find_all('dd')
+            try:
+                address = address_fields[idx].text.strip()
+            except AttributeError:
+                address = "No address given"
+
+            gallery_tag = gallery_elements[idx].find("div", {"class": "gallery-container"})
+            if gallery_tag is not None:
+                image_tag = gallery_tag.find("img")
+                try:
+                    image = image_tag["src"]
+                except KeyError:
+                    image = image_tag["data-lazy-src"]
+            else:
+                image = None
+
+            details = {
+                'id': expose_ids[idx],
+                'url': expose_urls[idx],
+                'image': image,
+                'title': title_el.text.strip().replace('NEU', ''),
+                'address': address,
+                'crawler': self.get_name()
+            }
+            if len(attr_els) > 2:
+                details['price'] = attr_els[0].text.strip().split(' ')[0].strip()
+                details['size'] = attr_els[1].text.strip().split(' ')[0].strip() + " qm"
+                details['rooms'] = attr_els[2].text.strip().split(' ')[0].strip()
+            else:
+                # If there are less than three elements, it is unclear which is what.
+                details['price'] = ''
+                details['size'] = ''
+                details['rooms'] = ''
+
+            exist = False
+            for expose in entries:
+                if expose_id == expose["id"]:
+                    exist = True
+                    break
+            if not exist:
+                entries.append(details)
+
+        self.__log__.debug('extracted: %d', len(entries))
+        return entries
+
+
+# Saved result pages, with the crawler that extracts them and its baseline
+RESULT_PAGES = {
+    'immo-scout-resultlist.html': (CrawlImmobilienscout, BaselineImmobilienscout),
+}
+
+def time_per_page(func, runs):
+    """Average time of func() in milliseconds, and its last result"""
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = func()
+    return (time.perf_counter() - start) / runs * 1000, result
+
+def read_fixture(fixture):
+    """The raw content of a saved page"""
+    with open(os.path.join(FIXTURES, fixture), 'rb') as page:
+        return page.read()
+
+def main():
+    """Run the benchmark"""
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    config = Config(string="urls: []")
+    print(f"{'fixture':>28} {'mode':>8} {'parse (ms)':>11} {'extract (ms)':>13} {'exposes':>8}")
+    for fixture, (crawler_class, baseline_class) in RESULT_PAGES.items():
+        content = read_fixture(fixture)
+        crawler, baseline = crawler_class(config), baseline_class(config)
+        modes = (
+            ('full', baseline,
+             lambda content=content: BeautifulSoup(content, 'html.parser')),
+            ('scoped', crawler,
+             lambda content=content, crawler=crawler:
+             crawler.parse(content, crawler.RESULT_STRAINER)),
+        )
+        for mode, extractor, parse in modes:
+            parse_time, soup = time_per_page(parse, runs)
+            extract_time, entries = time_per_page(
+                lambda soup=soup, extractor=extractor: extractor.extract_data(soup), runs)
+            print(f"{fixture:>28} {mode:>8} {parse_time:>11.2f} {extract_time:>13.2f} "
+                  f"{len(entries):>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark extraction of exposes from the IS24 result JSON.
+
+Compares the old approach (jsonpath expressions parsed on every call, and a
+recursive search over the whole document) against the precompiled expressions
+and the direct walk of the resultlistEntries structure, on the saved result
+JSON files.
+
+Usage: python benchmark/result_json.py [runs]
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+from jsonpath_ng import parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from flathunter.config import Config
+from flathunter.crawl_immobilienscout import CrawlImmobilienscout
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+RESULT_FILES = [
+    os.path.join(ROOT, 'result.json'),
+    os.path.join(ROOT, 'test', 'fixtures', 'immo-scout-IS24-object.json'),
+]
+
+def find_with_jsonpath(data):
+    """The old lookup: parse both expressions per call and per entry"""
+    real_estates = [match.value for match in parse("$..['resultlist.realEstate']").find(data)]
+    for entry in real_estates:
+        image_path = parse("$..galleryAttachments..['@xlink.href']")
+        next(iter([image.value for image in image_path.find(entry)]), None)
+    return real_estates
+
+def find_direct(data):
+    """The new lookup: walk the known structure"""
+    real_estates = CrawlImmobilienscout.find_real_estates(data)
+    for entry in real_estates:
+        CrawlImmobilienscout.find_gallery_image(entry)
+    return real_estates
+
+def time_per_call(func, runs):
+    """Average time of func() in milliseconds, and its last result"""
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = func()
+    return (time.perf_counter() - start) / runs * 1000, result
+
+def main():
+    """Run the benchmark"""
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    # Missing optional fields are logged for every entry
+    logging.getLogger('flathunt').setLevel(logging.ERROR)
+    crawler = CrawlImmobilienscout(Config(string="urls: []"))
+    print(f"{'file':>30} {'mode':>10} {'time (ms)':>10} {'exposes':>8}")
+    for path in RESULT_FILES:
+        with open(path, encoding='utf-8') as result_file:
+            data = json.load(result_file)
+        modes = (
+            ('jsonpath', lambda data=data: find_with_jsonpath(data)),
+            ('direct', lambda data=data: find_direct(data)),
+            ('extract', lambda data=data: crawler.get_entries_from_json(data)),
+        )
+        for mode, func in modes:
+            elapsed, entries = time_per_call(func, runs)
+            print(f"{os.path.basename(path):>30} {mode:>10} {elapsed:>10.2f} {len(entries):>8}")
+
+if __name__ == "__main__":
+    main()
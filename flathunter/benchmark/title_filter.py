@@ -0,0 +1,73 @@
+"""Benchmark the title filter with a long exclusion list.
+
+Compares the old approach (joining the patterns and searching the uncompiled
+regex for every expose) against a precompiled alternation of all patterns and
+against TitleFilter, which merges plain keywords into a trie. Most titles do
+not match, as in a real crawl.
+
+Usage: python benchmark/title_filter.py [titles]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from flathunter.filter import TitleFilter
+
+KEYWORDS = [
+    "wg", "wohngemeinschaft", "mitbewohner", "mitbewohnerin", "zimmer in", "tausch",
+    "wohnungstausch", "tauschwohnung", "zwischenmiete", "zwischenmieter", "untermiete",
+    "untermieter", "befristet", "möbliert", "moebliert", "furnished", "temporary",
+    "sublet", "senioren", "seniorenwohnung", "betreutes wohnen", "wbs", "wohnberechtigungsschein",
+    "ferienwohnung", "monteur", "monteurzimmer", "boardinghouse", "business apartment",
+    "studentenwohnung", "studentenapartment", "azubi", "kurzzeit", "kurzzeitmiete",
+    "nur für frauen", "nachmieter", "abstand", "ablöse", "gewerbe", "büro", "praxis",
+    "laden", "stellplatz", "garage", "tiefgarage", "lager", "kaufen", "eigentum",
+    "provision", "makler", "anlage", "kapitalanlage", "rendite", "vermietet",
+    "erbpacht", "versteigerung", "zwangsversteigerung", "genossenschaft", "anteile",
+    "coliving", "co-living", "shared", "room", "bed", "bett", "schlafplatz",
+    "sommer", "winter", "semester", "urlaub", "messe", "expat", "relocation",
+    "all inclusive", "inklusive", "pauschal", "warmmiete pauschal", "probewohnen",
+]
+PATTERNS = KEYWORDS + [r"\d+\s*monate", r"ab\s+sofort\s+befristet", r"wg[- ]?zimmer"]
+
+WORDS = ["Schöne", "helle", "ruhige", "Altbauwohnung", "Neubau", "mit", "Balkon",
+         "Garten", "Erstbezug", "nach", "Sanierung", "in", "Mitte", "Kreuzberg",
+         "2-Zimmer-Wohnung", "3", "Zimmer", "Dachgeschoss", "Einbauküche", "Lift"]
+
+def old_is_interesting(patterns, title):
+    """TitleFilter.is_interesting before the patterns were precompiled"""
+    combined_excludes = "(" + ")|(".join(patterns) + ")"
+    return not re.search(combined_excludes, title, re.IGNORECASE)
+
+def time_per_title(func, titles):
+    """Average time of func(title) in microseconds, and the number of matches"""
+    start = time.perf_counter()
+    kept = sum(1 for title in titles if func(title))
+    return (time.perf_counter() - start) / len(titles) * 1e6, len(titles) - kept
+
+def main():
+    """Run the benchmark"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    random.seed(0)
+    titles = [" ".join(random.choices(WORDS, k=8)) for _ in range(count)]
+    titles += [f"Helle Wohnung zur {keyword}" for keyword in KEYWORDS[:count // 100]]
+    alternation = re.compile("(" + ")|(".join(PATTERNS) + ")", re.IGNORECASE)
+    title_filter = TitleFilter(PATTERNS)
+    modes = (
+        ('uncompiled', lambda title: old_is_interesting(PATTERNS, title)),
+        ('alternation', lambda title: not alternation.search(title)),
+        ('trie', lambda title: title_filter.is_interesting({'title': title})),
+    )
+    print(f"{len(PATTERNS)} patterns, {len(titles)} titles")
+    print(f"{'mode':>12} {'us/title':>10} {'excluded':>9}")
+    for mode, func in modes:
+        elapsed, excluded = time_per_title(func, titles)
+        print(f"{mode:>12} {elapsed:>10.2f} {excluded:>9}")
+
+if __name__ == "__main__":
+    main()
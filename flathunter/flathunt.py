@@ -10,10 +10,11 @@ import logging
 import time
 from pprint import pformat
 
-from flathunter.idmaintainer import IdMaintainer
+from flathunter.idmaintainer import IdMaintainer, ProcessedIdCache
 from flathunter.hunter import Hunter
 from flathunter.config import Config
 from flathunter.heartbeat import Heartbeat
+from flathunter.sender_telegram import TelegramPublisher
 
 __author__ = "Jan Harrie"
 __version__ = "1.0"
@@ -41,17 +42,26 @@ __log__ = logging.getLogger('flathunt')
 
 def launch_flat_hunt(config, heartbeat=None):
     """Starts the crawler / notification loop"""
-    id_watch = IdMaintainer(f'{config.database_location()}/processed_ids.db')
+    id_watch = IdMaintainer(f'{config.database_location()}/processed_ids.db',
+                            batch_size=config.database_batch_size(),
+                            flush_interval=config.database_flush_interval())
+    if config.cache_processed_ids():
+        id_watch = ProcessedIdCache(id_watch)
 
     hunter = Hunter(config, id_watch)
-    hunter.hunt_flats()
-    counter = 0
-
-    while config.get('loop', {}).get('active', False):
-        counter += 1
-        counter = heartbeat.send_heartbeat(counter)
-        time.sleep(config.get('loop', {}).get('sleeping_time', 60 * 10))
+    try:
         hunter.hunt_flats()
+        counter = 0
+
+        while config.get('loop', {}).get('active', False):
+            counter += 1
+            counter = heartbeat.send_heartbeat(counter)
+            time.sleep(config.get('loop', {}).get('sleeping_time', 60 * 10))
+            hunter.hunt_flats()
+    finally:
+        hunter.close()
+        # Telegram messages are published in the background - send the last ones
+        TelegramPublisher.get_instance(config).close()
 
 
 def main():
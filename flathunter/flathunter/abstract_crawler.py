@@ -1,12 +1,18 @@
 """Interface for webcrawlers. Crawler implementations should subclass this"""
+import os
 import re
 import logging
+import threading
 from time import sleep
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import backoff
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import selenium
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
@@ -15,14 +21,288 @@ from bs4 import BeautifulSoup
 from random_user_agent.user_agent import UserAgent
 from random_user_agent.params import HardwareType, Popularity
 
-from flathunter import proxies
 from flathunter.captcha.captcha_solver import CaptchaUnsolvableError
+from flathunter.fetch_strategies import DirectFetchStrategy
+from flathunter.fetch_strategies import ProxyFetchStrategy
+from flathunter.fetch_strategies import BrowserFetchStrategy
+from flathunter.parse_pool import ParsePool
+from flathunter.http_cache import HttpCache
+
+# Returned for a result page that did not change since the last successful crawl.
+# Unlike an empty page, it does not mark the end of the results
+UNCHANGED_PAGE = object()
+
+class SessionPool:
+    """Holds one keep-alive HTTP session per portal, so that repeated requests
+       to the same host reuse their connections instead of opening new ones"""
+
+    RETRY_STATUSES = (500, 502, 503, 504)
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get_session(self, name, pool_size=10, retries=3):
+        """Returns the session for the named portal, creating it on first use"""
+        with self.lock:
+            session = self.sessions.get(name)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=pool_size,
+                    pool_maxsize=pool_size,
+                    max_retries=Retry(total=retries,
+                                      backoff_factor=0.5,
+                                      status_forcelist=self.RETRY_STATUSES,
+                                      raise_on_status=False)
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self.sessions[name] = session
+            return session
+
+    def close(self):
+        """Closes all sessions and their pooled connections"""
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+class ExposeCollection:
+    """Ordered collection of exposes, indexed by their id. Adding an expose whose
+       id is already in the collection does nothing, so duplicates (e.g. listings
+       shown twice on a result page, or moving to the next page during a crawl)
+       are dropped in constant time"""
+
+    def __init__(self, exposes=()):
+        self.exposes = {}
+        self.extend(exposes)
+
+    def add(self, expose):
+        """Add an expose, returning False if one with the same id was present"""
+        if expose['id'] in self.exposes:
+            return False
+        self.exposes[expose['id']] = expose
+        return True
+
+    def extend(self, exposes):
+        """Add several exposes, keeping their order"""
+        for expose in exposes:
+            self.add(expose)
+
+    def to_list(self):
+        """Returns the exposes in the order they were added"""
+        return list(self.exposes.values())
+
+    def __contains__(self, expose_id):
+        return expose_id in self.exposes
+
+    def __len__(self):
+        return len(self.exposes)
+
+    def __iter__(self):
+        return iter(self.exposes.values())
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+class PooledDriver:
+    """A browser held by a DriverPool, with the number of pages loaded in it"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+class DriverPool:
+    """Keeps up to 'size' warm Selenium drivers, which are checked out for a crawl
+       and checked in afterwards. Drivers are probed before use and replaced if they
+       crashed, and recycled after 'max_pages' pages or once the chromedriver and
+       browser processes use more than 'max_memory_mb'. Cookies are kept across
+       recycling, so a new driver continues the session (e.g. a solved captcha)
+       of the old one"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, factory, size=1, max_pages=100, max_memory_mb=None, home_url=None):
+        self.factory = factory
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.home_url = home_url
+        self.idle = []
+        self.created = 0
+        self.cookies = []
+        self.condition = threading.Condition()
+
+    def _create(self):
+        driver = self.factory()
+        if self.cookies and self.home_url is not None:
+            # Cookies can only be set for the domain of the current page
+            driver.get(self.home_url)
+            for cookie in self.cookies:
+                try:
+                    driver.add_cookie(cookie)
+                except WebDriverException:
+                    self.__log__.debug("Unable to restore cookie %s", cookie.get('name'))
+        return PooledDriver(driver)
+
+    def _quit(self, pooled):
+        try:
+            pooled.driver.quit()
+        except WebDriverException:
+            self.__log__.debug("Driver was already gone")
+
+    @staticmethod
+    def is_healthy(pooled):
+        """Probe the driver with a trivial script"""
+        try:
+            return pooled.driver.execute_script('return 1;') == 1
+        except WebDriverException:
+            return False
+
+    def checkout(self):
+        """Take a healthy driver from the pool, starting a new one if there is room.
+           Blocks while all drivers are in use"""
+        with self.condition:
+            while not self.idle and self.created >= self.size:
+                self.condition.wait()
+            pooled = self.idle.pop() if self.idle else None
+            if pooled is None:
+                self.created += 1
+        if pooled is not None and not self.is_healthy(pooled):
+            self.__log__.warning("Browser is not responding, restarting it")
+            self._quit(pooled)
+            pooled = None
+        if pooled is None:
+            try:
+                pooled = self._create()
+            except Exception:
+                with self.condition:
+                    self.created -= 1
+                    self.condition.notify()
+                raise
+        pooled.pages += 1
+        return pooled
+
+    @staticmethod
+    def driver_pid(driver):
+        """Process id of the chromedriver of a local driver, or None"""
+        try:
+            return driver.service.process.pid
+        except AttributeError:
+            return None
+
+    @staticmethod
+    def process_memory(pid):
+        """Resident memory in bytes of a process and all of its descendants - for
+           chromedriver, these are the browser processes. Read from /proc, so
+           None is returned where that is not available"""
+        if not os.path.isdir('/proc'):
+            return None
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat', encoding='utf-8') as stat:
+                    parent = int(stat.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        total, pids = 0, [pid]
+        while pids:
+            current = pids.pop()
+            try:
+                with open(f'/proc/{current}/statm', encoding='utf-8') as statm:
+                    total += int(statm.read().split()[1]) * page_size
+            except (OSError, ValueError, IndexError):
+                continue
+            pids.extend(children.get(current, []))
+        return total
+
+    def needs_recycling(self, pooled):
+        """Returns true if the driver loaded too many pages or uses too much memory"""
+        if self.max_pages is not None and pooled.pages >= self.max_pages:
+            return True
+        if self.max_memory_mb is not None:
+            pid = self.driver_pid(pooled.driver)
+            memory = self.process_memory(pid) if pid is not None else None
+            return memory is not None and memory > self.max_memory_mb * 1024 * 1024
+        return False
+
+    def checkin(self, pooled):
+        """Return a driver to the pool, saving its cookies. Worn-out drivers are quit"""
+        try:
+            cookies = pooled.driver.get_cookies()
+            if cookies:
+                self.cookies = cookies
+        except WebDriverException:
+            pass
+        if self.needs_recycling(pooled):
+            self.__log__.debug("Recycling browser after %d pages", pooled.pages)
+            self._quit(pooled)
+            with self.condition:
+                self.created -= 1
+                self.condition.notify()
+            return
+        with self.condition:
+            self.idle.append(pooled)
+            self.condition.notify()
+
+    @contextmanager
+    def driver(self):
+        """Context manager to check out a driver, and check it in again afterwards"""
+        pooled = self.checkout()
+        try:
+            yield pooled
+        finally:
+            self.checkin(pooled)
+
+    def close(self):
+        """Quit all idle drivers"""
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.created -= len(idle)
+        for pooled in idle:
+            self._quit(pooled)
 
 class Crawler:
     """Defines the Crawler interface"""
 
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = None
+    session_pool = SessionPool()
+    fetch_strategies = None
+    # Set by the hunter in incremental mode, to stop paginating at known exposes
+    id_watch = None
+    # Pool of browsers kept between crawls, for crawlers that need one
+    driver_pool = None
+    # HTML parser used for all pages, and the part of a result page that is
+    # parsed at all. Crawlers should narrow this down to their result list
+    PARSER = 'lxml'
+    RESULT_STRAINER = None
+    # Worker processes for extracting result pages, shared by all crawlers
+    parse_pool = None
+    parse_pool_lock = threading.Lock()
+    # On-disk cache of pages fetched over plain HTTP, shared by all crawlers
+    http_cache = None
+    http_cache_lock = threading.Lock()
+    # Hashes of the result pages extracted by the crawl running in each thread
+    crawl_digests = threading.local()
+    # Resources the browser skips when loading pages, as Network.setBlockedURLs
+    # patterns. Crawlers can extend these with portal-specific patterns
+    BLOCKED_URL_PATTERNS = [
+        "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.svg", "*.ico",
+        "*.woff", "*.woff2", "*.ttf", "*.otf", "*.mp4", "*.webm",
+        "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+        "*googlesyndication.com*", "*facebook.net*", "*hotjar.com*",
+    ]
+
+    DIRECT_FETCH_STRATEGY = DirectFetchStrategy
+    PROXY_FETCH_STRATEGY = ProxyFetchStrategy
+    BROWSER_FETCH_STRATEGY = BrowserFetchStrategy
 
     def __init__(self, config):
         self.config = config
@@ -48,19 +328,41 @@ class Crawler:
         'Accept-Language': 'en-US,en;q=0.9',
     }
 
+    def get_blocked_urls(self):
+        """URL patterns the browser should not load. Unless resource blocking is
+           disabled, this includes images, fonts and trackers we never read"""
+        patterns = ["https://api.geetest.com/get.*"]
+        if self.config.block_resources():
+            patterns += self.BLOCKED_URL_PATTERNS + self.config.blocked_urls()
+        return patterns
+
     def configure_driver(self, driver_path, driver_arguments):
         """Configure ChromeDriver"""
         chrome_options = Options()
         if driver_arguments is not None:
             for driver_argument in driver_arguments:
                 chrome_options.add_argument(driver_argument)
+        if self.config.block_resources():
+            chrome_options.add_argument('--blink-settings=imagesEnabled=false')
         driver = webdriver.Chrome(executable_path=driver_path, options=chrome_options)
         driver.execute_cdp_cmd('Network.setBlockedURLs', {
-          "urls": ["https://api.geetest.com/get.*"]
+          "urls": self.get_blocked_urls()
         })
         driver.execute_cdp_cmd('Network.enable', {})
         return driver
 
+    def create_driver_pool(self, driver_path, driver_arguments, home_url=None):
+        """Create a pool of ChromeDrivers, with the settings from the 'driver_pool'
+           config section"""
+        return DriverPool(lambda: self.configure_driver(driver_path, driver_arguments),
+                          home_url=home_url, **self.config.driver_pool_settings())
+
+    def get_session(self):
+        """Returns the pooled HTTP session shared by all requests to this portal"""
+        return self.session_pool.get_session(self.get_name(),
+                                             pool_size=self.config.http_pool_size(),
+                                             retries=self.config.http_retries())
+
     def rotate_user_agent(self):
         """Choose a new random user agent"""
         self.HEADERS['User-Agent'] = self.user_agent_rotator.get_random_user_agent()
@@ -68,65 +370,141 @@ class Crawler:
     # pylint: disable=unused-argument
     def get_page(self, search_url, driver=None, page_no=None):
         """Applies a page number to a formatted search URL and fetches the exposes at that page"""
-        return self.get_soup_from_url(search_url)
+        return self.get_soup_from_url(search_url, strainer=self.RESULT_STRAINER)
 
-    def get_soup_from_url(self, url, driver=None, checkbox=None, afterlogin_string=None):
-        """Creates a Soup object from the HTML at the provided URL"""
-
-        self.rotate_user_agent()
-        resp = requests.get(url, headers=self.HEADERS)
-        if resp.status_code not in (200, 405):
-            self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
+    def get_fetch_strategy(self, driver=None):
+        """Chooses how to fetch a page: through proxies if configured, with the
+           browser if a driver is given, and with a plain HTTP request otherwise"""
         if self.config.use_proxy():
-            return self.get_soup_with_proxy(url)
-        if driver is not None:
-            driver.get(url)
-            if re.search("initGeetest", driver.page_source):
-                self.resolve_geetest(driver)
-            elif re.search("g-recaptcha", driver.page_source):
-                self.resolve_recaptcha(driver, checkbox, afterlogin_string)
-            return BeautifulSoup(driver.page_source, 'html.parser')
-        return BeautifulSoup(resp.content, 'html.parser')
-
-    def get_soup_with_proxy(self, url):
-        """Will try proxies until it's possible to crawl and return a soup"""
-        resolved = False
-        resp = None
-
-        # We will keep trying to fetch new proxies until one works
-        while not resolved:
-            proxies_list = proxies.get_proxies()
-            for proxy in proxies_list:
-                self.rotate_user_agent()
-
-                try:
-                    # Very low proxy read timeout, or it will get stuck on slow proxies
-                    resp = requests.get(
-                      url,
-                      headers=self.HEADERS,
-                      proxies={"http": proxy, "https": proxy},
-                      timeout=(20, 0.1)
-                    )
-
-                    if resp.status_code != 200:
-                        self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
-                    else:
-                        resolved = True
-                        break
-
-                except requests.exceptions.ConnectionError:
-                    self.__log__.error("Connection failed for proxy %s. Trying new proxy...", proxy)
-                except requests.exceptions.Timeout:
-                    self.__log__.error(
-                      "Connection timed out for proxy %s. Trying new proxy...", proxy
-                    )
-                except requests.exceptions.RequestException:
-                    self.__log__.error("Some error occurred. Trying new proxy...")
-
-        if not resp:
-            raise Exception("An error occurred while fetching proxies or content")
-
-        return BeautifulSoup(resp.content, 'html.parser')
+            strategy_class = self.PROXY_FETCH_STRATEGY
+        elif driver is not None:
+            strategy_class = self.BROWSER_FETCH_STRATEGY
+        else:
+            strategy_class = self.DIRECT_FETCH_STRATEGY
+        return self._get_strategy(strategy_class)
+
+    def _get_strategy(self, strategy_class):
+        """Strategies are created once per crawler, so their metrics add up"""
+        if self.fetch_strategies is None:
+            self.fetch_strategies = {}
+        if strategy_class.NAME not in self.fetch_strategies:
+            self.fetch_strategies[strategy_class.NAME] = strategy_class(self)
+        return self.fetch_strategies[strategy_class.NAME]
+
+    def get_fetch_metrics(self):
+        """Returns the metrics of all fetch strategies used by this crawler"""
+        return [strategy.metrics for strategy in (self.fetch_strategies or {}).values()]
+
+    def get_content_from_url(self, url, driver=None, checkbox=None, afterlogin_string=None):
+        """Fetches the raw HTML at the provided URL"""
+        return self.get_fetch_strategy(driver).fetch(
+            url,
+            driver=driver,
+            checkbox=checkbox,
+            afterlogin_string=afterlogin_string
+        )
+
+    def parse(self, content, strainer=None):
+        """Creates a Soup object from HTML. With a strainer, only the matching
+           elements (and their children) are built"""
+        return BeautifulSoup(content, self.PARSER, parse_only=strainer)
+
+    # pylint: disable=too-many-arguments
+    def get_soup_from_url(self, url, driver=None, checkbox=None, afterlogin_string=None,
+                          strainer=None):
+        """Creates a Soup object from the HTML at the provided URL"""
+        return self.parse(self.get_content_from_url(url, driver, checkbox, afterlogin_string),
+                          strainer)
+
+    def get_parse_pool(self):
+        """Returns the shared parse pool, creating it on first use"""
+        with self.parse_pool_lock:
+            if Crawler.parse_pool is None:
+                Crawler.parse_pool = ParsePool.from_config(self.config)
+            return Crawler.parse_pool
+
+    @staticmethod
+    def close_parse_pool():
+        """Stop the worker processes of the shared parse pool. A later crawl
+           starts a new pool"""
+        with Crawler.parse_pool_lock:
+            parse_pool, Crawler.parse_pool = Crawler.parse_pool, None
+        if parse_pool is not None:
+            parse_pool.close()
+
+    def extract_from_content(self, content):
+        """Extracts the exposes from a raw result page - in a worker process,
+           if the parse pool is enabled and the page is large enough"""
+        return self.get_parse_pool().extract(self, content)
+
+    def get_http_cache(self):
+        """Returns the shared HTTP cache, or None if it is not enabled"""
+        if not self.config.http_cache():
+            return None
+        with self.http_cache_lock:
+            if Crawler.http_cache is None:
+                Crawler.http_cache = HttpCache.from_config(self.config)
+            return Crawler.http_cache
+
+    @contextmanager
+    def remember_extracted_pages(self):
+        """With the HTTP cache enabled, collects the hashes of the result pages
+           extracted while crawling, and stores them once the crawl succeeded"""
+        digests = {}
+        self.crawl_digests.pages = digests
+        try:
+            yield
+        finally:
+            self.crawl_digests.pages = None
+        if digests:
+            self.get_http_cache().mark_extracted(digests)
+
+    def is_unchanged_page(self, url, content, digests=None):
+        """With the HTTP cache enabled, returns true if the result page has not
+           changed since its exposes were extracted in a successful crawl - it
+           can hold no new ones. Otherwise, its hash is added to the digests of
+           the running crawl"""
+        cache = self.get_http_cache()
+        if cache is None:
+            return False
+        digest = cache.digest(content)
+        if cache.is_unchanged(url, digest):
+            self.__log__.debug("Result page %s is unchanged since the last crawl", url)
+            return True
+        if digests is None:
+            digests = getattr(self.crawl_digests, 'pages', None)
+        if digests is not None:
+            digests[url] = digest
+        return False
+
+    def get_result_entries(self, url, digests=None):
+        """Fetches a result page without a browser, and extracts its exposes.
+           Pages that did not change since the last crawl are not extracted,
+           UNCHANGED_PAGE is returned instead"""
+        content = self.get_content_from_url(url)
+        if self.is_unchanged_page(url, content, digests):
+            return UNCHANGED_PAGE
+        return self.extract_from_content(content)
+
+    def get_pages(self, urls):
+        """Fetch and extract several result pages without a browser, at most
+           'http.per_host' at a time. Returns the exposes of each page, in the
+           order of the URLs"""
+        workers = min(len(urls), self.config.http_per_host())
+        if workers <= 1:
+            return [self.get_result_entries(url) for url in urls]
+        # the workers add the hashes of their pages to the crawl of this thread
+        digests = getattr(self.crawl_digests, 'pages', None)
+        with ThreadPoolExecutor(max_workers=workers,
+                                thread_name_prefix=self.get_name()) as executor:
+            return list(executor.map(lambda url: self.get_result_entries(url, digests), urls))
+
+    def is_known_page(self, entries):
+        """In incremental mode, returns true if all exposes of a result page have
+           already been processed, so older pages need not be fetched"""
+        if self.id_watch is None or not entries:
+            return False
+        return not self.id_watch.filter_unprocessed([entry['id'] for entry in entries])
 
     def extract_data(self, soup):
         """Should be implemented in subclass"""
@@ -137,11 +515,10 @@ class Crawler:
         """Loads the exposes from the site, starting at the provided URL"""
         self.__log__.debug("Got search URL %s", search_url)
 
-        # load first page
-        soup = self.get_page(search_url)
-
-        # get data from first page
-        entries = self.extract_data(soup)
+        # load first page, and get data from it
+        entries = self.get_result_entries(search_url)
+        if entries is UNCHANGED_PAGE:
+            return []
         self.__log__.debug('Number of found entries: %d', len(entries))
 
         return entries
@@ -150,12 +527,18 @@ class Crawler:
         """Load as many exposes as possible from the provided URL"""
         if re.search(self.URL_PATTERN, url):
             try:
-                return self.get_results(url, max_pages)
+                with self.remember_extracted_pages():
+                    return self.get_results(url, max_pages)
             except requests.exceptions.ConnectionError:
                 self.__log__.warning("Connection to %s failed. Retrying.", url.split('/')[2])
                 return []
         return []
 
+    def close(self):
+        """Quit the browsers kept between crawls"""
+        if self.driver_pool is not None:
+            self.driver_pool.close()
+
     def get_name(self):
         """Returns the name of this crawler"""
         return type(self).__name__
@@ -164,6 +547,12 @@ class Crawler:
         """Loads additional detalis for an expose. Should be implemented in the subclass"""
         return expose
 
+    # pylint: disable=unused-argument
+    def load_descriptions(self, exposes, timeout):
+        """Loads the descriptions for a batch of exposes. Implemented by crawlers
+           that need to visit the expose pages for that"""
+        return exposes
+
     @backoff.on_exception(wait_gen=backoff.constant,
                           exception=CaptchaUnsolvableError,
                           max_tries=3)
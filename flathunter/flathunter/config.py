@@ -1,6 +1,8 @@
 """Wrap configuration options as an object"""
 import os
+import re
 import logging
+from urllib.parse import urlsplit
 import yaml
 
 from flathunter.captcha.imagetyperz_solver import ImageTyperzSolver
@@ -20,6 +22,14 @@ class Config:
 
     __log__ = logging.getLogger('flathunt')
 
+    SEARCHER_CLASSES = [CrawlImmobilienscout,
+                        CrawlWgGesucht,
+                        CrawlEbayKleinanzeigen,
+                        CrawlImmowelt,
+                        CrawlSubito,
+                        CrawlImmobiliare,
+                        CrawlIdealista]
+
     def __init__(self, filename=None, string=None):
         if string is not None:
             self.config = yaml.safe_load(string)
@@ -29,13 +39,8 @@ class Config:
             self.__log__.info("Using config %s", filename)
             with open(filename, encoding="utf-8") as file:
                 self.config = yaml.safe_load(file)
-        self.__searchers__ = [CrawlImmobilienscout(self),
-                              CrawlWgGesucht(self),
-                              CrawlEbayKleinanzeigen(self),
-                              CrawlImmowelt(self),
-                              CrawlSubito(self),
-                              CrawlImmobiliare(self),
-                              CrawlIdealista(self)]
+        self.__searchers__ = None
+        self.__routes__ = {}
 
     def __iter__(self):
         """Emulate dictionary"""
@@ -55,14 +60,57 @@ class Config:
             return self.config["database_location"]
         return os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/..")
 
+    def database_batch_size(self) -> int:
+        """Number of pending database writes that triggers a flush"""
+        return self.config.get("database", {}).get("batch_size", 1)
+
+    def database_flush_interval(self):
+        """Maximum time in seconds that database writes are held back, or None"""
+        interval_ms = self.config.get("database", {}).get("flush_interval_ms")
+        return None if interval_ms is None else interval_ms / 1000
+
+    def cache_processed_ids(self) -> bool:
+        """Keep all processed ids in memory, in front of the database"""
+        return self.config.get("database", {}).get("cache_processed_ids", True)
+
     def set_searchers(self, searchers):
         """Update the active search plugins"""
         self.__searchers__ = searchers
+        self.__routes__ = {}
 
     def searchers(self):
-        """Get the list of search plugins"""
+        """Get the list of search plugins. Plugins are only created on first use,
+           and only for the portals targeted by at least one configured URL"""
+        if self.__searchers__ is None:
+            urls = self.get('urls') or []
+            self.__searchers__ = [
+                searcher_class(self) for searcher_class in self.SEARCHER_CLASSES
+                if any(re.search(searcher_class.URL_PATTERN, url) for url in urls)
+            ]
         return self.__searchers__
 
+    def searcher_for_url(self, url):
+        """Get the search plugin responsible for the given URL, or None. Routes
+           are resolved once per site and then looked up from the index"""
+        parts = urlsplit(url)
+        site = f"{parts.scheme}://{parts.netloc}"
+        if site not in self.__routes__:
+            self.__routes__[site] = next(
+                (searcher for searcher in self.searchers()
+                 if re.search(searcher.URL_PATTERN, site + "/")), None)
+        return self.__routes__[site]
+
+    def crawl_targets(self):
+        """Get the (searcher, url) pairs to crawl for the configured URLs"""
+        targets = []
+        for url in self.get('urls') or []:
+            searcher = self.searcher_for_url(url)
+            if searcher is None:
+                self.__log__.warning("No crawler found for URL %s - skipping", url)
+                continue
+            targets.append((searcher, url))
+        return targets
+
     def get_filter(self):
         """Read the configured filter"""
         builder = Filter.builder()
@@ -115,7 +163,97 @@ class Config:
             return self.config["rabbitmq"]["port"]
         return 5672
 
+    def rabbitmq_batch_size(self) -> int:
+        """Maximum number of Telegram calls published to RabbitMQ at once"""
+        return self.config.get("rabbitmq", {}).get("batch_size", 50)
+
+    def rabbitmq_buffer_size(self) -> int:
+        """Number of Telegram calls buffered before senders have to wait"""
+        return self.config.get("rabbitmq", {}).get("buffer_size", 1000)
+
+    def rabbitmq_outbox(self):
+        """Database of Telegram calls that were not published yet, next to the
+           database of processed ids by default"""
+        return self.config.get("rabbitmq", {}).get(
+            "outbox", os.path.join(self.database_location(), "outbox.db"))
+
+    def crawl_workers(self) -> int:
+        """Number of crawls that may run in parallel (1 means crawl sequentially)"""
+        return self.config.get("crawl", {}).get("workers", 1)
+
+    def crawl_per_portal(self) -> int:
+        """Maximum number of parallel crawls against the same portal"""
+        return self.config.get("crawl", {}).get("per_portal", 1)
+
+    def crawl_incremental(self) -> bool:
+        """Stop paginating once a result page only contains known exposes"""
+        return self.config.get("crawl", {}).get("incremental", False)
+
+    def description_tabs(self) -> int:
+        """Number of expose pages loaded in parallel browser tabs for their descriptions"""
+        return self.config.get("descriptions", {}).get("tabs", 4)
+
+    def description_timeout(self) -> float:
+        """Time in seconds to wait for a batch of expose pages with descriptions"""
+        return self.config.get("descriptions", {}).get("timeout", 20)
+
+    def http_pool_size(self) -> int:
+        """Number of keep-alive connections kept open per portal"""
+        return self.config.get("http", {}).get("pool_size", 10)
+
+    def http_timeout(self) -> float:
+        """Timeout in seconds for HTTP requests made by the crawlers"""
+        return self.config.get("http", {}).get("timeout", 30)
+
+    def http_per_host(self) -> int:
+        """Maximum number of pages fetched at the same time from a single portal"""
+        return self.config.get("http", {}).get("per_host", 4)
+
+    def http_retries(self) -> int:
+        """Number of retries for failed HTTP requests made by the crawlers"""
+        return self.config.get("http", {}).get("retries", 3)
+
+    def http_cache(self) -> bool:
+        """Cache fetched pages on disk, and skip result pages that did not change"""
+        return self.config.get("http_cache", {}).get("enabled", False)
+
+    def http_cache_directory(self):
+        """Directory of the HTTP cache, next to the database by default"""
+        return self.config.get("http_cache", {}).get(
+            "directory", os.path.join(self.database_location(), "http_cache"))
+
+    def http_cache_ttl(self) -> float:
+        """Seconds a cached page is used without revalidating it"""
+        return self.config.get("http_cache", {}).get("ttl", 60)
+
+    def http_cache_max_age(self) -> float:
+        """Seconds after which an unused cache entry is removed"""
+        return self.config.get("http_cache", {}).get("max_age", 7 * 24 * 3600)
 
     def use_proxy(self):
         """Check if proxy is configured"""
         return ("use_proxy_list" in self.config and self.config["use_proxy_list"])
+
+    def block_resources(self) -> bool:
+        """Keep the browser from loading images, fonts and trackers"""
+        return self.config.get("block_resources", {}).get("enabled", True)
+
+    def blocked_urls(self):
+        """Additional URL patterns the browser should not load"""
+        return self.config.get("block_resources", {}).get("urls") or []
+
+    def parse_workers(self) -> int:
+        """Number of worker processes for parsing result pages (0 parses in-process)"""
+        return self.config.get("parsing", {}).get("workers", 0)
+
+    def parse_min_page_size(self) -> int:
+        """Result pages smaller than this many bytes are always parsed in-process"""
+        return self.config.get("parsing", {}).get("min_page_size", 65536)
+
+    def driver_pool_settings(self):
+        """Settings for the browser pool, see DriverPool for the available keys"""
+        return self.config.get("driver_pool") or {}
+
+    def proxy_pool_settings(self):
+        """Settings for the proxy pool, see ProxyPool for the available keys"""
+        return self.config.get("proxy_pool") or {}
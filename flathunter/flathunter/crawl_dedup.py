@@ -0,0 +1,49 @@
+"""Removes exposes that were found by more than one of the configured search URLs"""
+import logging
+from itertools import combinations
+
+class CrawlDeduplicator:
+    """Passes on every expose only once per crawl cycle, keyed on (crawler, id).
+       Also keeps track of the exposes found by each URL, so that the overlap
+       between pairs of searches can be reported"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self):
+        self.seen = set()
+        self.keys_by_url = {}
+        self.duplicates = 0
+
+    def deduplicate(self, results):
+        """Lazily yields the unique exposes from (searcher, url, exposes) crawl results"""
+        for searcher, url, exposes in results:
+            keys = self.keys_by_url.setdefault(url, set())
+            for expose in exposes:
+                key = (searcher.get_name(), str(expose['id']))
+                keys.add(key)
+                if key in self.seen:
+                    self.duplicates += 1
+                    continue
+                self.seen.add(key)
+                yield expose
+        self.log_overlaps()
+
+    def overlaps(self):
+        """Returns (url, other_url, shared, ratio) for every pair of URLs with common
+           exposes. 'ratio' is the share of the smaller search that is also found by
+           the other one - a ratio of 1.0 means that search is redundant"""
+        result = []
+        for (url, keys), (other_url, other_keys) in combinations(self.keys_by_url.items(), 2):
+            shared = len(keys & other_keys)
+            if shared:
+                result.append((url, other_url, shared,
+                               shared / min(len(keys), len(other_keys))))
+        return result
+
+    def log_overlaps(self):
+        """Report the number of duplicates, and the overlap of all URL pairs"""
+        if self.duplicates:
+            self.__log__.info("Skipped %d exposes found by more than one URL", self.duplicates)
+        for url, other_url, shared, ratio in self.overlaps():
+            self.__log__.info("Searches %s and %s share %d exposes (%.0f%%)",
+                              url, other_url, shared, ratio * 100)
@@ -3,7 +3,10 @@ import logging
 import re
 import datetime
 
-from flathunter.abstract_crawler import Crawler
+import soupsieve
+from bs4 import SoupStrainer
+
+from flathunter.abstract_crawler import Crawler, ExposeCollection
 
 class CrawlEbayKleinanzeigen(Crawler):
     """Implementation of Crawler interface for Ebay Kleinanzeigen"""
@@ -11,6 +14,8 @@ class CrawlEbayKleinanzeigen(Crawler):
     __log__ = logging.getLogger('flathunt')
     USER_AGENT = 'Mozilla/5.0 (Windows NT 6.1; Win64; x64; rv:47.0) Gecko/20100101 Firefox/47.0'
     URL_PATTERN = re.compile(r'https://www\.ebay-kleinanzeigen\.de')
+    RESULT_STRAINER = SoupStrainer(id="srchrslt-adtable")
+    TITLE_SELECTOR = soupsieve.compile('.ellipsis')
     MONTHS = {
         "Januar": "01",
         "Februar": "02",
@@ -31,12 +36,8 @@ class CrawlEbayKleinanzeigen(Crawler):
         logging.getLogger("requests").setLevel(logging.WARNING)
         self.config = config
 
-    def get_page(self, search_url, driver=None, page_no=None):
-        """Applies a page number to a formatted search URL and fetches the exposes at that page"""
-        return self.get_soup_from_url(search_url)
-
     def get_expose_details(self, expose):
-        soup = self.get_page(expose['url'])
+        soup = self.get_soup_from_url(expose['url'])
         for detail in soup.find_all('li', {"class": "addetailslist--detail"}):
             if re.match(r'Verfügbar ab', detail.text):
                 date_string = re.match(r'(\w+) (\d{4})', detail.text)
@@ -49,13 +50,12 @@ class CrawlEbayKleinanzeigen(Crawler):
     # pylint: disable=too-many-locals
     def extract_data(self, soup):
         """Extracts all exposes from a provided Soup object"""
-        entries = []
+        entries = ExposeCollection()
         soup = soup.find(id="srchrslt-adtable")
         try:
-            title_elements = soup.find_all(lambda e: e.has_attr('class')
-                                           and 'ellipsis' in e['class'])
+            title_elements = self.TITLE_SELECTOR.select(soup)
         except AttributeError:
-            return entries
+            return entries.to_list()
         expose_ids = soup.find_all("article", class_="aditem")
 
         # soup.find_all(lambda e: e.has_attr('data-adid'))
@@ -101,15 +101,15 @@ class CrawlEbayKleinanzeigen(Crawler):
                 'address': address,
                 'crawler': self.get_name()
             }
-            entries.append(details)
+            entries.add(details)
 
         self.__log__.debug('extracted: %d', len(entries))
 
-        return entries
+        return entries.to_list()
 
     def load_address(self, url):
         """Extract address from expose itself"""
-        expose_soup = self.get_page(url)
+        expose_soup = self.get_soup_from_url(url)
         try:
             street_raw = expose_soup.find(id="street-address").text
         except AttributeError:
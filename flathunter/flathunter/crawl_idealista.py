@@ -2,31 +2,25 @@
 import logging
 import re
 
-from flathunter.abstract_crawler import Crawler
+from bs4 import SoupStrainer
+from flathunter.abstract_crawler import Crawler, ExposeCollection
 
 class CrawlIdealista(Crawler):
     """Implementation of Crawler interface for Idealista"""
 
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = re.compile(r'https://www\.idealista\.it')
+    RESULT_STRAINER = SoupStrainer('article', {"class": "item"})
 
     def __init__(self, config):
         super().__init__(config)
         self.config = config
         logging.getLogger("requests").setLevel(logging.WARNING)
 
-    # pylint: disable=unused-argument
-    def get_page(self, search_url, driver=None, page_no=None):
-        """Applies a page number to a formatted search URL and fetches the exposes at that page"""
-        if self.config.use_proxy():
-            return self.get_soup_with_proxy(search_url)
-
-        return self.get_soup_from_url(search_url)
-
     # pylint: disable=too-many-locals
     def extract_data(self, soup):
         """Extracts all exposes from a provided Soup object"""
-        entries = []
+        entries = ExposeCollection()
 
         findings = soup.find_all('article', {"class": "item"})
 
@@ -63,8 +57,8 @@ class CrawlIdealista(Crawler):
                 'crawler': self.get_name()
             }
 
-            entries.append(details)
+            entries.add(details)
 
         self.__log__.debug('extracted: %d', entries)
 
-        return entries
+        return entries.to_list()
@@ -1,13 +1,18 @@
 """Expose crawler for Immobiliare"""
 import logging
 import re
-from flathunter.abstract_crawler import Crawler
+
+import soupsieve
+from bs4 import SoupStrainer
+from flathunter.abstract_crawler import Crawler, ExposeCollection
 
 class CrawlImmobiliare(Crawler):
     """Implementation of Crawler interface for Immobiliare"""
 
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = re.compile(r'https://www\.immobiliare\.it')
+    RESULT_STRAINER = SoupStrainer(attrs={"class": "listing-item"})
+    FINDINGS_SELECTOR = soupsieve.compile('.listing-item[data-id]')
 
     def __init__(self, config):
         super().__init__(config)
@@ -17,11 +22,9 @@ class CrawlImmobiliare(Crawler):
     # pylint: disable=too-many-locals
     def extract_data(self, soup):
         """Extracts all exposes from a provided Soup object"""
-        entries = []
+        entries = ExposeCollection()
 
-        findings = soup.find_all(lambda e: e.has_attr('data-id') \
-            and e.has_attr('class') \
-            and "listing-item" in e['class'])
+        findings = self.FINDINGS_SELECTOR.select(soup)
 
         for row in findings:
             title_row = row.find('p', {"class": "titolo text-primary"})
@@ -63,8 +66,8 @@ class CrawlImmobiliare(Crawler):
                 'crawler': self.get_name()
             }
 
-            entries.append(details)
+            entries.add(details)
 
         self.__log__.debug('extracted: %s', entries)
 
-        return entries
+        return entries.to_list()
@@ -2,12 +2,27 @@
 import logging
 import re
 import datetime
+import time
 
-from selenium.common.exceptions import JavascriptException
+import soupsieve
+from bs4 import SoupStrainer
+from selenium.common.exceptions import JavascriptException, WebDriverException
+from selenium.webdriver.support.wait import WebDriverWait
 from jsonpath_ng import parse
 from selenium.webdriver.common.by import By
 
-from flathunter.abstract_crawler import Crawler
+from flathunter.abstract_crawler import Crawler, ExposeCollection, UNCHANGED_PAGE
+
+# jsonpath expressions are compiled once, parsing them is expensive
+REAL_ESTATE_PATH = parse("$..['resultlist.realEstate']")
+GALLERY_IMAGE_PATH = parse("$..galleryAttachments..['@xlink.href']")
+
+PLACEHOLDER_IMAGE = ("https://www.static-immobilienscout24.de/statpic/placeholder_house/"
+                     "496c95154de31a357afa978cdb7f15f0_placeholder_medium.png")
+
+def as_list(value):
+    """The IS24 JSON holds a single object where a list has only one element"""
+    return value if isinstance(value, list) else [value]
 
 class CrawlImmobilienscout(Crawler):
     """Implementation of Crawler interface for ImmobilienScout"""
@@ -15,12 +30,25 @@ class CrawlImmobilienscout(Crawler):
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = re.compile(r'https://www\.immobilienscout24\.de')
     RESULT_LIMIT = 50
+    RESULT_STRAINER = SoupStrainer(id="resultListItems")
+    RESULT_COUNT_PATTERN = re.compile(
+        rb'data-is24-qa="resultlist-resultCount"[^>]*>\s*([0-9.]+)')
+    TITLE_SELECTOR = soupsieve.compile('a.result-list-entry__brand-title-container')
+    ATTRIBUTES_SELECTOR = soupsieve.compile('[data-is24-qa="attributes"]')
+    ADDRESS_SELECTOR = soupsieve.compile('.result-list-entry__address')
+    GALLERY_SELECTOR = soupsieve.compile('.result-list-entry__gallery-container')
+    BLOCKED_URL_PATTERNS = Crawler.BLOCKED_URL_PATTERNS + [
+        "*pictures.immobilienscout24.de*", "*ioam.de*", "*adition.com*",
+        "*criteo.com*", "*optimizely.com*", "*usercentrics.eu*",
+    ]
+    DESCRIPTION_SCRIPT = ("let list = []; document.querySelectorAll('pre.text-content')"
+                          ".forEach(el => list.push(el.childNodes[0].textContent)); return list;")
 
     def __init__(self, config):
         super().__init__(config)
         logging.getLogger("requests").setLevel(logging.WARNING)
         self.config = config
-        self.driver = None
+        self.driver_pool = None
         self.checkbox = None
         self.afterlogin_string = None
 
@@ -37,9 +65,10 @@ class CrawlImmobilienscout(Crawler):
             else:
                 self.afterlogin_string = captcha_config.get('afterlogin_string', '')
             if self.captcha_solver:
-                self.driver = self.configure_driver(
+                self.driver_pool = self.create_driver_pool(
                     self.driver_executable_path,
-                    self.driver_arguments
+                    self.driver_arguments,
+                    home_url='https://www.immobilienscout24.de/'
                 )
 
     def get_results(self, search_url, max_pages=None):
@@ -55,44 +84,59 @@ class CrawlImmobilienscout(Crawler):
             search_url = search_url + '&pagenumber={0}'
         self.__log__.debug("Got search URL %s", search_url)
 
-        # load first page to get number of entries
-        page_no = 1
-        soup = self.get_page(search_url, self.driver, page_no)
-
         # If we are using Selenium, just parse the results from the JSON in the page response
-        if self.driver is not None:
-            return self.get_entries_from_javascript()
+        if self.driver_pool is not None:
+            with self.driver_pool.driver() as pooled:
+                self.get_content_from_url(search_url.format(1), pooled.driver,
+                                          self.checkbox, self.afterlogin_string)
+                return self.get_entries_from_javascript(pooled.driver)
 
-        try:
-            no_of_results = int(
-                soup.find_all(lambda e: e.has_attr('data-is24-qa') and \
-                                        e['data-is24-qa'] == 'resultlist-resultCount')[0] \
-                    .text.replace('.', ''))
-        except IndexError:
-            self.__log__.debug('Index Error occurred')
-            no_of_results = 0
-
-        # get data from first page
-        entries = self.extract_data(soup)
-
-        # iterate over all remaining pages
-        while len(entries) < min(no_of_results, self.RESULT_LIMIT) and \
-                (max_pages is None or page_no < max_pages):
-            self.__log__.debug(
-                'Next Page, Number of entries : %d, no of results: %d',
-                len(entries), no_of_results)
-            page_no += 1
-            soup = self.get_page(search_url, self.driver, page_no)
-            cur_entry = self.extract_data(soup)
-            if isinstance(cur_entry, list):
-                break
-            entries.extend(cur_entry)
-        return entries
-
-    def get_entries_from_javascript(self):
+        # load first page to get number of entries - the count is outside of the
+        # result list, so it is read from the raw page
+        content = self.get_content_from_url(search_url.format(1))
+        if self.is_unchanged_page(search_url.format(1), content) and self.id_watch is not None:
+            # in incremental mode, an unchanged first page is a known page: its
+            # offers were processed by an earlier crawl
+            return []
+        no_of_results = self.get_result_count(content)
+
+        # get data from first page. Listings can move to the next page while we
+        # crawl, so exposes found on several pages are only kept once
+        first_page = self.extract_from_content(content)
+        entries = ExposeCollection(first_page)
+        per_page = len(first_page)
+        wanted = min(no_of_results, self.RESULT_LIMIT)
+        if per_page == 0 or per_page >= wanted or self.is_known_page(first_page):
+            return entries.to_list()
+
+        # the URLs of the remaining pages are known now, so fetch them all at once -
+        # or in incremental mode, in waves, until a page has no new exposes
+        last_page = -(-wanted // per_page)
+        if max_pages is not None:
+            last_page = min(last_page, max_pages)
+        self.__log__.debug('Number of entries: %d, no of results: %d, fetching pages 2-%d',
+                           per_page, no_of_results, last_page)
+        urls = [search_url.format(page_no) for page_no in range(2, last_page + 1)]
+        wave = max(1, len(urls) if self.id_watch is None else self.config.http_per_host())
+        for start in range(0, len(urls), wave):
+            for cur_entries in self.get_pages(urls[start:start + wave]):
+                if cur_entries is UNCHANGED_PAGE:
+                    if self.id_watch is not None:
+                        self.__log__.debug('Reached an unchanged page, not fetching older pages')
+                        return entries.to_list()
+                    continue
+                if not cur_entries:
+                    return entries.to_list()
+                entries.extend(cur_entries)
+                if self.is_known_page(cur_entries):
+                    self.__log__.debug('Reached known exposes, not fetching older pages')
+                    return entries.to_list()
+        return entries.to_list()
+
+    def get_entries_from_javascript(self, driver):
         """Get entries from JavaScript"""
         try:
-            result_json = self.driver.execute_script('return window.IS24.resultList;')
+            result_json = driver.execute_script('return window.IS24.resultList;')
         except JavascriptException:
             self.__log__.warning("Unable to find IS24 variable in window")
             return []
@@ -100,22 +144,40 @@ class CrawlImmobilienscout(Crawler):
 
     def get_entries_from_json(self, json):
         """Get entries from JSON"""
-        jsonpath_expr = parse("$..['resultlist.realEstate']")
-        return [
-          self.extract_entry_from_javascript(entry.value) for entry in jsonpath_expr.find(json)
-        ]
+        return ExposeCollection(
+          self.extract_entry_from_javascript(entry) for entry in self.find_real_estates(json)
+        ).to_list()
+
+    @staticmethod
+    def find_real_estates(json):
+        """Returns the 'resultlist.realEstate' objects of the result JSON. The known
+           resultlistEntries structure is walked directly, any other document is
+           searched with jsonpath"""
+        result_list = json.get('resultList', json)
+        try:
+            groups = (result_list['resultListModel']['searchResponseModel']
+                      ['resultlist.resultlist']['resultlistEntries'])
+            return [entry['resultlist.realEstate'] for group in as_list(groups)
+                    for entry in as_list(group['resultlistEntry'])]
+        except (KeyError, TypeError):
+            return [match.value for match in REAL_ESTATE_PATH.find(json)]
+
+    @staticmethod
+    def find_gallery_image(entry):
+        """Returns the first gallery image of a real estate object, or None"""
+        try:
+            attachments = as_list(entry['galleryAttachments']['attachment'])
+            return next((attachment['@xlink.href'] for attachment in attachments
+                         if '@xlink.href' in attachment), None)
+        except (KeyError, TypeError):
+            return next((match.value for match in GALLERY_IMAGE_PATH.find(entry)), None)
 
     def extract_entry_from_javascript(self, entry):
         """Get single entry from JavaScript"""
-        image_path = parse("$..galleryAttachments..['@xlink.href']")
         expose = {
             'id': int(entry["@id"]),
             'url': ("https://www.immobilienscout24.de/expose/" + str(entry["@id"])),
-            'image': next(
-                iter([galleryImage.value for galleryImage in image_path.find(entry)]),
-                ("https://www.static-immobilienscout24.de/"
-                    "statpic/placeholder_house/496c95154de31a357afa978cdb7f15f0_placeholder_medium.png")
-            ),
+            'image': self.find_gallery_image(entry) or PLACEHOLDER_IMAGE,
             'title': entry["title"],
             'address': entry["address"]["description"]["text"],
             'crawler': self.get_name(),
@@ -127,29 +189,82 @@ class CrawlImmobilienscout(Crawler):
         try:
             expose['rent_warm'] = str(entry['calculatedTotalRent']['totalRent']['value'])
         except Exception as e:
-            self.__log__.warning("Unable to find rent warm value: ", e)
+            self.__log__.warning("Unable to find rent warm value: %s", e)
 
         try:
             image_urls = []
 
-            for attachment in entry['galleryAttachments']['attachment']:
-                full_url = attachment['urls'][0]['url']['@href']
+            for attachment in as_list(entry['galleryAttachments']['attachment']):
+                full_url = as_list(attachment['urls'][0]['url'])[0]['@href']
                 image_urls.append(full_url.split("/ORIG")[0])
             expose['images'] = image_urls
         except Exception as e:
-            self.__log__.warning("Unable to find image urls: ", e)
+            self.__log__.warning("Unable to find image urls: %s", e)
             expose['images'] = []
 
-        self.driver.get(expose['url'])
+        return expose
+
+    def load_descriptions(self, exposes, timeout):
+        """Loads the descriptions of the exposes from their expose pages. All pages
+           are opened in browser tabs at once, and are read until the timeout"""
+        if self.driver_pool is None:
+            return exposes
+        with self.driver_pool.driver() as pooled:
+            driver = pooled.driver
+            pooled.pages += len(exposes)
+            main_window = driver.current_window_handle
+            tabs = []
+            try:
+                for expose in exposes:
+                    expose['description'] = None
+                    known_handles = set(driver.window_handles)
+                    driver.execute_script("window.open(arguments[0], '_blank');", expose['url'])
+                    new_handles = set(driver.window_handles) - known_handles
+                    if new_handles:
+                        tabs.append((expose, new_handles.pop()))
+                deadline = time.monotonic() + timeout
+                while tabs:
+                    expose, handle = tabs[0]
+                    self.read_description(driver, expose, handle, deadline)
+                    tabs.pop(0)
+            finally:
+                # whatever failed, no tab is left open and the driver is returned
+                # to the pool on its main window
+                for _, handle in tabs:
+                    self.close_tab(driver, handle)
+                try:
+                    driver.switch_to.window(main_window)
+                except WebDriverException as error:
+                    # a driver that lost its main window fails the pool's health check
+                    self.__log__.warning("Unable to return to the main window: %s", error)
+        return exposes
+
+    def read_description(self, driver, expose, handle, deadline):
+        """Read the description from the tab of an expose, then close the tab"""
         try:
-            description_texts = self.driver.execute_script("let list = []; document.querySelectorAll("
-                                                           "'pre.text-content').forEach(el => "
-                                                           "list.push(el.childNodes[0])); return list;")
-            expose['description'] = "\n".join([description['textContent'] for description in description_texts])
-        except Exception as e:
-            self.__log__.warning("Unable to find description: ", e)
+            driver.switch_to.window(handle)
+        except WebDriverException as error:
+            self.__log__.warning("Unable to switch to the tab of %s: %s", expose['url'], error)
+            return
+        try:
+            WebDriverWait(driver, max(deadline - time.monotonic(), 0.1)).until(
+                lambda driver: driver.execute_script('return document.readyState') \
+                               == 'complete')
+            descriptions = driver.execute_script(self.DESCRIPTION_SCRIPT)
+            expose['description'] = "\n".join(descriptions)
+        except WebDriverException as error:
+            self.__log__.warning("Unable to load description of %s: %s",
+                                 expose['url'], error)
+        finally:
+            self.close_tab(driver, handle)
 
-        return expose
+    def close_tab(self, driver, handle):
+        """Close a tab, if it can still be switched to"""
+        try:
+            driver.switch_to.window(handle)
+            driver.close()
+        except WebDriverException as error:
+            self.__log__.debug("Unable to close tab %s: %s", handle, error)
 
     def get_page(self, search_url, driver=None, page_no=None):
         """Applies a page number to a formatted search URL and fetches the exposes at that page"""
@@ -157,9 +272,20 @@ class CrawlImmobilienscout(Crawler):
             search_url.format(page_no),
             driver=driver,
             checkbox=self.checkbox,
-            afterlogin_string=self.afterlogin_string
+            afterlogin_string=self.afterlogin_string,
+            strainer=self.RESULT_STRAINER
         )
 
+    def get_result_count(self, content):
+        """Reads the total number of results from the raw HTML of a result page"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        match = self.RESULT_COUNT_PATTERN.search(content)
+        if match is None:
+            self.__log__.debug('No result count found')
+            return 0
+        return int(match[1].replace(b'.', b''))
+
     def get_expose_details(self, expose):
         """Loads additional details for an expose by processing the expose detail URL"""
         soup = self.get_soup_from_url(expose['url'])
@@ -174,13 +300,10 @@ class CrawlImmobilienscout(Crawler):
     # pylint: disable=too-many-branches
     def extract_data(self, soup):
         """Extracts all exposes from a provided Soup object"""
-        entries = []
+        entries = ExposeCollection()
 
         results_list = soup.find(id="resultListItems")
-        title_elements = results_list.find_all(
-            lambda e: e.name == 'a' and e.has_attr('class') and \
-                      'result-list-entry__brand-title-container' in e['class']
-        ) if results_list else []
+        title_elements = self.TITLE_SELECTOR.select(results_list) if results_list else []
         expose_ids = []
         expose_urls = []
         for link in title_elements:
@@ -192,18 +315,9 @@ class CrawlImmobilienscout(Crawler):
                 expose_urls.append(link.get('href'))
         self.__log__.debug(expose_ids)
 
-        attr_container_els = soup.find_all(
-          lambda e: e.has_attr('data-is24-qa') and \
-                    e['data-is24-qa'] == "attributes"
-          )
-        address_fields = soup.find_all(
-          lambda e: e.has_attr('class') and \
-                    'result-list-entry__address' in e['class']
-          )
-        gallery_elements = soup.find_all(
-          lambda e: e.has_attr('class') and \
-                    'result-list-entry__gallery-container' in e['class']
-        )
+        attr_container_els = self.ATTRIBUTES_SELECTOR.select(soup)
+        address_fields = self.ADDRESS_SELECTOR.select(soup)
+        gallery_elements = self.GALLERY_SELECTOR.select(soup)
         for idx, title_el in enumerate(title_elements):
             attr_els = attr_container_els[idx].find_all('dd')
             try:
@@ -239,13 +353,7 @@ class CrawlImmobilienscout(Crawler):
                 details['size'] = ''
                 details['rooms'] = ''
 
-            exist = False
-            for expose in entries:
-                if expose_id == expose["id"]:
-                    exist = True
-                    break
-            if not exist:
-                entries.append(details)
+            entries.add(details)
 
         self.__log__.debug('extracted: %d', len(entries))
-        return entries
+        return entries.to_list()
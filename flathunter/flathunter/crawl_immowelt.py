@@ -4,13 +4,16 @@ import re
 import datetime
 import hashlib
 
-from flathunter.abstract_crawler import Crawler
+from bs4 import SoupStrainer
+
+from flathunter.abstract_crawler import Crawler, ExposeCollection
 
 class CrawlImmowelt(Crawler):
     """Implementation of Crawler interface for ImmoWelt"""
 
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = re.compile(r'https://www\.immowelt\.de')
+    RESULT_STRAINER = SoupStrainer("main")
 
     def __init__(self, config):
         super().__init__(config)
@@ -19,7 +22,7 @@ class CrawlImmowelt(Crawler):
 
     def get_expose_details(self, expose):
         """Loads additional details for an expose by processing the expose detail URL"""
-        soup = self.get_page(expose['url'])
+        soup = self.get_soup_from_url(expose['url'])
         date = datetime.datetime.now().strftime("%2d.%2m.%Y")
 
         immo_div = soup.find("app-estate-object-informations")
@@ -45,13 +48,13 @@ class CrawlImmowelt(Crawler):
     # pylint: disable=too-many-locals
     def extract_data(self, soup):
         """Extracts all exposes from a provided Soup object"""
-        entries = []
+        entries = ExposeCollection()
         soup = soup.find("main")
 
         try:
             title_elements = soup.find_all("h2")
         except AttributeError:
-            return entries
+            return entries.to_list()
         expose_ids = soup.find_all("a", id=True)
 
         for idx, title_el in enumerate(title_elements):
@@ -110,8 +113,8 @@ class CrawlImmowelt(Crawler):
                 'address': address,
                 'crawler': self.get_name()
             }
-            entries.append(details)
+            entries.add(details)
 
         self.__log__.debug('extracted: %d', len(entries))
 
-        return entries
+        return entries.to_list()
@@ -0,0 +1,78 @@
+"""Scheduling of crawl jobs, optionally running the crawls of independent portals in parallel"""
+import logging
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class CrawlScheduler:
+    """Runs crawl jobs - (searcher, url) pairs - on a bounded pool of workers.
+       At most 'per_portal' crawls use the same searcher at the same time. A
+       browser-based searcher runs no more crawls than its DriverPool holds
+       browsers, so a browser is never used by two crawls at once. A job that
+       fails is logged and yields no exposes"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self, crawl_func, workers=1, per_portal=1):
+        self.crawl_func = crawl_func
+        self.workers = max(1, workers)
+        self.per_portal = max(1, per_portal)
+
+    def limit(self, searcher):
+        """Number of crawls that may use the searcher at the same time"""
+        if searcher.driver_pool is None:
+            return self.per_portal
+        return min(self.per_portal, searcher.driver_pool.size)
+
+    def timed_crawl(self, searcher, url, max_pages):
+        """Run a single crawl job and report its wall-clock time"""
+        start = time.monotonic()
+        try:
+            exposes = self.crawl_func(searcher, url, max_pages)
+        except Exception:  # pylint: disable=broad-except
+            self.__log__.error("Crawling %s with %s failed:\n%s",
+                               url, searcher.get_name(), traceback.format_exc())
+            return []
+        self.__log__.info("Crawled %s with %s in %.2fs (%d exposes)",
+                          url, searcher.get_name(), time.monotonic() - start, len(exposes))
+        return exposes
+
+    def run(self, jobs, max_pages=None):
+        """Lazily yields (searcher, url, exposes) for every job, in order of completion"""
+        if self.workers == 1:
+            for searcher, url in jobs:
+                yield searcher, url, self.timed_crawl(searcher, url, max_pages)
+            return
+
+        pending = {}
+        for searcher, url in jobs:
+            pending.setdefault(searcher, deque()).append(url)
+        running = {}
+        active = dict.fromkeys(pending, 0)
+
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix='crawl') as executor:
+            while pending or running:
+                # Round-robin over searchers, so one portal with many URLs cannot
+                # occupy all workers while the others wait
+                submitted = True
+                while submitted and len(running) < self.workers:
+                    submitted = False
+                    for searcher in list(pending):
+                        if len(running) >= self.workers:
+                            break
+                        if active[searcher] >= self.limit(searcher):
+                            continue
+                        url = pending[searcher].popleft()
+                        if not pending[searcher]:
+                            del pending[searcher]
+                        future = executor.submit(self.timed_crawl, searcher, url, max_pages)
+                        running[future] = (searcher, url)
+                        active[searcher] += 1
+                        submitted = True
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    searcher, url = running.pop(future)
+                    active[searcher] -= 1
+                    yield searcher, url, future.result()
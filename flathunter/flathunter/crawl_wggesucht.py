@@ -1,17 +1,48 @@
 """Expose crawler for WgGesucht"""
 import logging
 import re
-import requests
-from bs4 import BeautifulSoup
+import threading
 
-from flathunter.abstract_crawler import Crawler
+import soupsieve
+from bs4 import SoupStrainer
+from flathunter.abstract_crawler import Crawler, ExposeCollection
+from flathunter.fetch_strategies import DirectFetchStrategy
 from flathunter.string_utils import remove_prefix
 
+class WgGesuchtFetchStrategy(DirectFetchStrategy):
+    """
+    Direct fetch strategy for wg-gesucht
+
+    We need to reload the page once for all filters to be applied
+    correctly on wg-gesucht. The filters are stored in the session
+    cookies, which all URLs of the portal share, so a URL is loaded
+    twice unless it was also the URL loaded last. Fetches are made one
+    at a time, so no other URL can change the filters in between.
+    """
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.last_url = None
+        self.lock = threading.Lock()
+
+    def fetch_content(self, url, **kwargs):
+        """Load the page, loading it twice if the filters of another URL are set"""
+        with self.lock:
+            if url != self.last_url:
+                # First page load to set filters; response is discarded
+                super().fetch_content(url)
+                self.last_url = url
+            return super().fetch_content(url)
+
 class CrawlWgGesucht(Crawler):
     """Implementation of Crawler interface for WgGesucht"""
 
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = re.compile(r'https://www\.wg-gesucht\.de')
+    DIRECT_FETCH_STRATEGY = WgGesuchtFetchStrategy
+    RESULT_STRAINER = SoupStrainer(id=lambda value: value is not None
+                                   and value.startswith('liste-'))
+    FINDINGS_SELECTOR = soupsieve.compile('[id^="liste-"]:not(.display-none)')
 
     def __init__(self, config):
         super().__init__(config)
@@ -21,11 +52,10 @@ class CrawlWgGesucht(Crawler):
     # pylint: disable=too-many-locals
     def extract_data(self, soup):
         """Extracts all exposes from a provided Soup object"""
-        entries = []
+        entries = ExposeCollection()
 
-        findings = soup.find_all(lambda e: e.has_attr('id') and e['id'].startswith('liste-'))
         existing_findings = [
-          e for e in findings if e.has_attr('class') and not 'display-none' in e['class']
+          e for e in self.FINDINGS_SELECTOR.select(soup) if e.has_attr('class')
         ]
 
         base_url = 'https://www.wg-gesucht.de/'
@@ -71,11 +101,11 @@ class CrawlWgGesucht(Crawler):
             elif len(dates) == 1:
                 details['from'] = dates[0]
 
-            entries.append(details)
+            entries.add(details)
 
         self.__log__.debug('extracted: %s', entries)
 
-        return entries
+        return entries.to_list()
 
     def load_address(self, url):
         """Extract address from expose itself"""
@@ -87,36 +117,3 @@ class CrawlWgGesucht(Crawler):
         except (TypeError, AttributeError):
             self.__log__.debug("No address in response for URL: %s", url)
             return None
-
-    def get_soup_from_url(
-      self,
-      url,
-      driver=None,
-      checkbox=None,
-      afterlogin_string=None):
-        """
-        Creates a Soup object from the HTML at the provided URL
-
-        Overwrites the method inherited from abstract_crawler. This is
-        necessary as we need to reload the page once for all filters to
-        be applied correctly on wg-gesucht.
-        """
-        self.rotate_user_agent()
-        sess = requests.session()
-        # First page load to set filters; response is discarded
-        sess.get(url, headers=self.HEADERS)
-        # Second page load
-        resp = sess.get(url, headers=self.HEADERS)
-
-        if resp.status_code not in (200, 405):
-            self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
-        if self.config.use_proxy():
-            return self.get_soup_with_proxy(url)
-        if driver is not None:
-            driver.get(url)
-            if re.search("initGeetest", driver.page_source):
-                self.resolve_geetest(driver)
-            elif re.search("g-recaptcha", driver.page_source):
-                self.resolve_recaptcha(driver, checkbox, afterlogin_string)
-            return BeautifulSoup(driver.page_source, 'html.parser')
-        return BeautifulSoup(resp.content, 'html.parser')
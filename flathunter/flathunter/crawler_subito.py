@@ -3,13 +3,15 @@ import logging
 import re
 import json
 
-from flathunter.abstract_crawler import Crawler
+from bs4 import SoupStrainer
+from flathunter.abstract_crawler import Crawler, ExposeCollection
 
 class CrawlSubito(Crawler):
     """Implementation of Crawler interface for Subito"""
 
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = re.compile(r'https://www\.subito\.it')
+    RESULT_STRAINER = SoupStrainer("script", id="__NEXT_DATA__")
 
     def __init__(self, config):
         super().__init__(config)
@@ -19,7 +21,7 @@ class CrawlSubito(Crawler):
     # pylint: disable=too-many-locals
     def extract_data(self, soup):
         """Extracts all exposes from a provided Soup object"""
-        entries = []
+        entries = ExposeCollection()
 
         # as of today, subito provides a useful JSON that represents the state
         # of the search. Neat! We don't have to do much.
@@ -70,8 +72,8 @@ class CrawlSubito(Crawler):
                 'crawler': self.get_name()
             }
 
-            entries.append(details)
+            entries.add(details)
 
         self.__log__.debug('extracted: %s', entries)
 
-        return entries
+        return entries.to_list()
@@ -1,7 +1,7 @@
 """Built-in expose processor implementations. Used by the processor pipelines
    in flathunter and in the webservice"""
-import re
 import logging
+from itertools import islice
 from flathunter.abstract_processor import Processor
 
 class Filter(Processor):
@@ -25,11 +25,10 @@ class AddressResolver(Processor):
         """Fetches the expose from the expose URL and extracts the address"""
         if expose['address'].startswith('http'):
             url = expose['address']
-            for searcher in self.config.searchers():
-                if re.search(searcher.URL_PATTERN, url):
-                    expose['address'] = searcher.load_address(url)
-                    self.__log__.debug("Loaded address %s for url %s", expose['address'], url)
-                    break
+            searcher = self.config.searcher_for_url(url)
+            if searcher is not None:
+                expose['address'] = searcher.load_address(url)
+                self.__log__.debug("Loaded address %s for url %s", expose['address'], url)
         return expose
 
 class CrawlExposeDetails(Processor):
@@ -40,11 +39,35 @@ class CrawlExposeDetails(Processor):
 
     def process_expose(self, expose):
         """Fetches the page at exposes['url'] and extracts additional details from it"""
-        for searcher in self.config.searchers():
-            if re.search(searcher.URL_PATTERN, expose['url']):
-                expose = searcher.get_expose_details(expose)
+        searcher = self.config.searcher_for_url(expose['url'])
+        if searcher is not None:
+            expose = searcher.get_expose_details(expose)
         return expose
 
+class DescriptionEnricher(Processor):
+    """Processor to load the descriptions of exposes. Should come after the filters,
+       so only new, interesting exposes are visited. Exposes are handed to their
+       crawler in batches, so the pages can be loaded in parallel"""
+
+    def __init__(self, config):
+        self.config = config
+
+    def process_exposes(self, exposes):
+        """Load the descriptions batch by batch, keeping the order of the exposes"""
+        exposes = iter(exposes)
+        while True:
+            batch = list(islice(exposes, self.config.description_tabs()))
+            if not batch:
+                return
+            by_searcher = {}
+            for expose in batch:
+                searcher = self.config.searcher_for_url(expose['url'])
+                if searcher is not None and 'description' not in expose:
+                    by_searcher.setdefault(searcher, []).append(expose)
+            for searcher, searcher_exposes in by_searcher.items():
+                searcher.load_descriptions(searcher_exposes, self.config.description_timeout())
+            yield from batch
+
 class LambdaProcessor(Processor):
     """Processor to apply arbitrary logic to each expose"""
 
@@ -0,0 +1,127 @@
+"""Strategies for fetching pages from a portal - directly, through a proxy or with a browser.
+   Each page is fetched with exactly one strategy, which records its own metrics"""
+import logging
+import re
+import threading
+import time
+
+from flathunter import proxies
+
+class FetchMetrics:
+    """Number of fetches, total latency and bytes transferred by a fetch strategy"""
+
+    def __init__(self, name):
+        self.name = name
+        self.fetches = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds, size):
+        """Account for a single fetch"""
+        with self.lock:
+            self.fetches += 1
+            self.seconds += seconds
+            self.bytes += size
+
+    def take(self):
+        """Returns the metrics recorded since the last call, and starts counting again"""
+        taken = FetchMetrics(self.name)
+        with self.lock:
+            taken.fetches, taken.seconds, taken.bytes = self.fetches, self.seconds, self.bytes
+            self.fetches, self.seconds, self.bytes = 0, 0.0, 0
+        return taken
+
+    def __repr__(self):
+        return (f"{self.name}: {self.fetches} fetches, {self.seconds:.2f}s, "
+                f"{self.bytes} bytes")
+
+class FetchStrategy:
+    """Fetches the content of a URL for a crawler. Implementations should subclass this"""
+
+    __log__ = logging.getLogger('flathunt')
+    NAME = None
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.metrics = FetchMetrics(self.NAME)
+
+    def fetch(self, url, **kwargs):
+        """Fetch the URL, returning the page content"""
+        start = time.monotonic()
+        content = self.fetch_content(url, **kwargs)
+        elapsed = time.monotonic() - start
+        self.metrics.record(elapsed, len(content))
+        self.__log__.debug("Fetched %s (%s) in %.2fs, %d bytes",
+                           url, self.NAME, elapsed, len(content))
+        return content
+
+    def fetch_content(self, url, **kwargs):
+        """Should be implemented in subclass"""
+        raise NotImplementedError
+
+class DirectFetchStrategy(FetchStrategy):
+    """Fetch pages with the pooled HTTP session of the crawler"""
+
+    NAME = 'direct'
+
+    def fetch_content(self, url, **kwargs):
+        """Load the page with a plain GET request. With the HTTP cache enabled, a
+           recent cached copy is returned as is, and an older one is revalidated
+           with a conditional request"""
+        cache = self.crawler.get_http_cache()
+        cached = cache.get(url) if cache is not None else None
+        self.crawler.rotate_user_agent()
+        headers = self.crawler.HEADERS
+        if cached is not None:
+            meta, content = cached
+            if cache.is_fresh(meta):
+                self.__log__.debug("Using cached copy of %s", url)
+                return content
+            headers = dict(headers, **cache.validators(meta))
+        resp = self.crawler.get_session().get(url, headers=headers,
+                                              timeout=self.crawler.config.http_timeout())
+        if resp.status_code == 304 and cached is not None:
+            self.__log__.debug("%s not modified", url)
+            cache.revalidated(url, meta, content)
+            return content
+        if resp.status_code not in (200, 405):
+            self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
+        elif resp.status_code == 200 and cache is not None:
+            cache.store(url, resp)
+        return resp.content
+
+class ProxyFetchStrategy(FetchStrategy):
+    """Fetch pages through free proxies, to circumvent anti-crawler measures.
+       All crawlers share a single, long-lived proxy pool"""
+
+    NAME = 'proxy'
+    pool = None
+    pool_lock = threading.Lock()
+
+    def get_pool(self):
+        """Returns the shared proxy pool, creating it on first use"""
+        with self.pool_lock:
+            if ProxyFetchStrategy.pool is None:
+                ProxyFetchStrategy.pool = proxies.ProxyPool.from_config(self.crawler.config)
+            return ProxyFetchStrategy.pool
+
+    def fetch_content(self, url, **kwargs):
+        """Fetch the page through the fastest healthy proxies"""
+        self.crawler.rotate_user_agent()
+        return self.get_pool().fetch(url, dict(self.crawler.HEADERS)).content
+
+class BrowserFetchStrategy(FetchStrategy):
+    """Fetch pages with a Selenium driver, solving captchas where necessary"""
+
+    NAME = 'browser'
+
+    # pylint: disable=arguments-differ
+    def fetch_content(self, url, driver=None, checkbox=None, afterlogin_string=None):
+        """Load the page in the browser and return the rendered source"""
+        driver.get(url)
+        if re.search("initGeetest", driver.page_source):
+            self.crawler.resolve_geetest(driver)
+        elif re.search("g-recaptcha", driver.page_source):
+            self.crawler.resolve_recaptcha(driver, checkbox, afterlogin_string)
+        return driver.page_source
@@ -1,147 +1,222 @@
 """Module with implementations of standard expose filters"""
-from functools import reduce
+from functools import lru_cache
+from itertools import islice
+from typing import NamedTuple, Optional
 import re
 
 from flathunter.idmaintainer import AlreadySeenFilter
 
+NUMBER_PATTERN = re.compile(r'\d+([\.,]\d+)?')
+
+class ExposeNumbers(NamedTuple):
+    """The numeric fields of an expose, parsed from its texts. Fields that could
+       not be parsed are None"""
+    price: Optional[float]
+    size: Optional[float]
+    rooms: Optional[float]
+    pps: Optional[float]
+
+def parse_number(text, thousands_separator=None):
+    """Parse the first number in a text, or return None"""
+    if isinstance(text, (int, float)):
+        return float(text)
+    match = NUMBER_PATTERN.search(text) if isinstance(text, str) else None
+    if match is None:
+        return None
+    number = match[0]
+    if thousands_separator is not None:
+        number = number.replace(thousands_separator, "")
+    return float(number.replace(",", "."))
+
+@lru_cache(maxsize=4096)
+def parse_numbers(price, size, rooms):
+    """Parse the numeric fields of an expose. The result is cached on the raw
+       texts, so an expose that is checked against many filters (e.g. those of
+       all users of the web interface) is only parsed once"""
+    price = parse_number(price, thousands_separator=".")
+    size = parse_number(size)
+    pps = price / size if price is not None and size else None
+    return ExposeNumbers(price, size, parse_number(rooms), pps)
+
 class ExposeHelper:
     """Helper functions for extracting data from expose text"""
 
+    @staticmethod
+    def get_numbers(expose):
+        """Returns the parsed numeric fields of an expose"""
+        return parse_numbers(expose.get('price'), expose.get('size'), expose.get('rooms'))
+
     @staticmethod
     def get_price(expose):
         """Extracts the price from a price text"""
-        price_match = re.search(r'\d+([\.,]\d+)?', expose['price'])
-        if price_match is None:
-            return None
-        return float(price_match[0].replace(".", "").replace(",", "."))
+        return ExposeHelper.get_numbers(expose).price
 
     @staticmethod
     def get_size(expose):
         """Extracts the size from a size text"""
-        size_match = re.search(r'\d+([\.,]\d+)?', expose['size'])
-        if size_match is None:
-            return None
-        return float(size_match[0].replace(",", "."))
+        return ExposeHelper.get_numbers(expose).size
 
     @staticmethod
     def get_rooms(expose):
         """Extracts the number of rooms from a room text"""
-        rooms_match = re.search(r'\d+([\.,]\d+)?', expose['rooms'])
-        if rooms_match is None:
-            return None
-        return float(rooms_match[0].replace(",", "."))
+        return ExposeHelper.get_numbers(expose).rooms
 
-class MaxPriceFilter:
-    """Exclude exposes above a given price"""
+class RangeFilter:
+    """Exclude exposes whose numeric field is outside the given bounds. Exposes
+       where the field could not be parsed are kept"""
 
-    def __init__(self, max_price):
-        self.max_price = max_price
+    FIELD = None
+
+    def __init__(self, low=None, high=None):
+        self.low = low
+        self.high = high
 
     def is_interesting(self, expose):
-        """True if expose is below the max price"""
-        price = ExposeHelper.get_price(expose)
-        if price is None:
+        """True if the field is within the bounds"""
+        value = getattr(ExposeHelper.get_numbers(expose), self.FIELD)
+        if value is None:
             return True
-        return price <= self.max_price
+        return (self.low is None or value >= self.low) and \
+               (self.high is None or value <= self.high)
+
+class MaxPriceFilter(RangeFilter):
+    """Exclude exposes above a given price"""
 
-class MinPriceFilter:
+    FIELD = 'price'
+
+    def __init__(self, max_price):
+        super().__init__(high=max_price)
+        self.max_price = max_price
+
+class MinPriceFilter(RangeFilter):
     """Exclude exposes below a given price"""
 
+    FIELD = 'price'
+
     def __init__(self, min_price):
+        super().__init__(low=min_price)
         self.min_price = min_price
 
-    def is_interesting(self, expose):
-        """True if expose is above the min price"""
-        price = ExposeHelper.get_price(expose)
-        if price is None:
-            return True
-        return price >= self.min_price
-
-class MaxSizeFilter:
+class MaxSizeFilter(RangeFilter):
     """Exclude exposes above a given size"""
 
+    FIELD = 'size'
+
     def __init__(self, max_size):
+        super().__init__(high=max_size)
         self.max_size = max_size
 
-    def is_interesting(self, expose):
-        """True if expose is below the max size"""
-        size = ExposeHelper.get_size(expose)
-        if size is None:
-            return True
-        return size <= self.max_size
-
-class MinSizeFilter:
+class MinSizeFilter(RangeFilter):
     """Exclude exposes below a given size"""
 
+    FIELD = 'size'
+
     def __init__(self, min_size):
+        super().__init__(low=min_size)
         self.min_size = min_size
 
-    def is_interesting(self, expose):
-        """True if expose is above the min size"""
-        size = ExposeHelper.get_size(expose)
-        if size is None:
-            return True
-        return size >= self.min_size
-
-class MaxRoomsFilter:
+class MaxRoomsFilter(RangeFilter):
     """Exclude exposes above a given number of rooms"""
 
+    FIELD = 'rooms'
+
     def __init__(self, max_rooms):
+        super().__init__(high=max_rooms)
         self.max_rooms = max_rooms
 
-    def is_interesting(self, expose):
-        """True if expose is below the max number of rooms"""
-        rooms = ExposeHelper.get_rooms(expose)
-        if rooms is None:
-            return True
-        return rooms <= self.max_rooms
-
-class MinRoomsFilter:
+class MinRoomsFilter(RangeFilter):
     """Exclude exposes below a given number of rooms"""
 
+    FIELD = 'rooms'
+
     def __init__(self, min_rooms):
+        super().__init__(low=min_rooms)
         self.min_rooms = min_rooms
 
-    def is_interesting(self, expose):
-        """True if expose is above the min number of rooms"""
-        rooms = ExposeHelper.get_rooms(expose)
-        if rooms is None:
-            return True
-        return rooms >= self.min_rooms
+REGEX_CHARACTERS = set("\\.^$*+?{}[]|()")
+
+def trie_pattern(words):
+    """Regex for a list of literal words, with common prefixes merged into a
+       trie - the regex engine then follows a single path per position in the
+       text, instead of trying every word in turn. A word that starts with
+       another word is dropped, as the shorter word matches first"""
+    trie = {}
+    for word in sorted(set(words), key=len):
+        node = trie
+        for char in word:
+            if '' in node:
+                break
+            node = node.setdefault(char, {})
+        else:
+            node.clear()
+            node[''] = True
+    return trie_regex(trie)
+
+def trie_regex(node):
+    """Regex for the words below a trie node"""
+    if '' in node:
+        return ''
+    alternatives = [re.escape(char) + trie_regex(child) for char, child in sorted(node.items())]
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return '(?:' + '|'.join(alternatives) + ')'
+
+def compile_exclusions(patterns):
+    """Compile a list of exclusion patterns into a single case-insensitive regex.
+       Plain keywords are merged into a trie, regex patterns are kept as they are"""
+    return compile_pattern_tuple(tuple(str(pattern) for pattern in patterns or []))
+
+@lru_cache(maxsize=1024)
+def compile_pattern_tuple(patterns):
+    """Cached on the patterns, as many users of the web interface share the
+       same exclusion lists"""
+    literals = [p.lower() for p in patterns if p and not REGEX_CHARACTERS & set(p)]
+    expressions = ['(?:' + p + ')' for p in patterns if p and REGEX_CHARACTERS & set(p)]
+    if literals:
+        expressions.insert(0, trie_pattern(literals))
+    if not expressions:
+        return None
+    return re.compile('|'.join(expressions), re.IGNORECASE)
 
 class TitleFilter:
-    """Exclude exposes whose titles match the provided terms"""
+    """Exclude exposes whose titles match the provided terms. The terms are
+       compiled into a single regex when the filter is created"""
+
+    COST = 2
+    FIELD = 'title'
 
     def __init__(self, filtered_titles):
         self.filtered_titles = filtered_titles
+        self.pattern = compile_exclusions(filtered_titles)
 
     def is_interesting(self, expose):
-        """True unless title matches the filtered titles"""
-        combined_excludes = "(" + ")|(".join(self.filtered_titles) + ")"
-        found_objects = re.search(combined_excludes, expose['title'], re.IGNORECASE)
-        # send all non matching regex patterns
-        if not found_objects:
+        """True unless the field matches the filtered terms"""
+        text = expose.get(self.FIELD)
+        if self.pattern is None or not text:
             return True
-        return False
+        return self.pattern.search(text) is None
+
+class DescriptionFilter(TitleFilter):
+    """Exclude exposes whose descriptions match the provided terms. Descriptions
+       are only known once they are loaded - exposes without one are kept"""
+
+    COST = 3
+    FIELD = 'description'
 
-class PPSFilter:
+class PPSFilter(RangeFilter):
     """Exclude exposes above a given price per square"""
 
+    FIELD = 'pps'
+
     def __init__(self, max_pps):
+        super().__init__(high=max_pps)
         self.max_pps = max_pps
 
-    def is_interesting(self, expose):
-        """True if price per square is below max price per square"""
-        size = ExposeHelper.get_size(expose)
-        price = ExposeHelper.get_price(expose)
-        if size is None or price is None:
-            return True
-        pps = price / size
-        return pps <= self.max_pps
-
 class PredicateFilter:
     """Include only those exposes satisfying the predicate"""
 
+    COST = 4
+
     def __init__(self, predicate):
         self.predicate = predicate
 
@@ -179,6 +254,14 @@ class FilterBuilder:
                 self.filters.append(PPSFilter(filters_config["max_price_per_square"]))
         return self
 
+    def read_description_config(self, config):
+        """Adds the description filter from a config dictionary. Descriptions are
+           loaded after the other filters ran, so this belongs in a filter of its own"""
+        filters_config = config.get("filters") or {}
+        if "excluded_descriptions" in filters_config:
+            self.filters.append(DescriptionFilter(filters_config["excluded_descriptions"]))
+        return self
+
     def max_size_filter(self, size):
         """Adds a max size filter"""
         self.filters.append(MaxSizeFilter(size))
@@ -198,20 +281,121 @@ class FilterBuilder:
         """Return the compiled filter"""
         return Filter(self.filters)
 
+def merge_ranges(filters):
+    """Combine the bounds of all range filters in a list of filters. Returns a
+       dict from fields to (low, high) bounds, either of which may be None"""
+    ranges = {}
+    for expose_filter in filters:
+        if not isinstance(expose_filter, RangeFilter):
+            continue
+        low, high = ranges.get(expose_filter.FIELD, (None, None))
+        if expose_filter.low is not None:
+            low = expose_filter.low if low is None else max(low, expose_filter.low)
+        if expose_filter.high is not None:
+            high = expose_filter.high if high is None else min(high, expose_filter.high)
+        ranges[expose_filter.FIELD] = (low, high)
+    return ranges
+
+def range_check(ranges):
+    """Fuse the bounds of all range filters into a single check, which parses
+       the expose once. 'ranges' maps fields to (low, high) bounds"""
+    bounds = [(ExposeNumbers._fields.index(field), low, high)
+              for field, (low, high) in ranges.items()]
+
+    def is_interesting(expose):
+        numbers = ExposeHelper.get_numbers(expose)
+        for index, low, high in bounds:
+            value = numbers[index]
+            if value is None:
+                continue
+            if (low is not None and value < low) or (high is not None and value > high):
+                return False
+        return True
+    return is_interesting
+
+class FilterCheck:
+    """A single check of a compiled filter, with the statistics for ordering it"""
+
+    DEFAULT_COST = 4
+
+    def __init__(self, test, cost=DEFAULT_COST):
+        self.test = test
+        self.cost = cost
+        self.checked = 0
+        self.rejected = 0
+
+    def score(self):
+        """Estimated share of exposes rejected, per unit of cost. Checks that
+           reject most exposes cheaply should run first"""
+        return (self.rejected + 1) / (self.checked + 2) / self.cost
+
 class Filter:
-    """Abstract filter object"""
+    """Compiled filter. The numeric range filters are fused into one check on the
+       parsed expose, and the checks run in turn until one rejects the expose.
+       Every REORDER_INTERVAL exposes, the checks are sorted by how many exposes
+       they rejected so far, relative to their cost. Filters that look up state
+       in storage (those with a 'filter_batch' method, like the already-seen
+       filter) run last, and on every expose - the already-seen filter records
+       each expose it sees as processed"""
+
+    CHUNK_SIZE = 50
+    REORDER_INTERVAL = 100
 
     def __init__(self, filters):
         self.filters = filters
+        self.batch_filters = [f for f in filters if hasattr(f, 'filter_batch')]
+        self.checks = self.compile([f for f in filters if not hasattr(f, 'filter_batch')])
+        self.evaluated = 0
+
+    @staticmethod
+    def compile(filters):
+        """Create the checks for a list of stateless filters"""
+        ranges = merge_ranges(filters)
+        checks = [FilterCheck(f.is_interesting, getattr(f, 'COST', FilterCheck.DEFAULT_COST))
+                  for f in filters if not isinstance(f, RangeFilter)]
+        if ranges:
+            checks.insert(0, FilterCheck(range_check(ranges), cost=1))
+        return checks
+
+    def passes_checks(self, expose):
+        """Run the checks on an expose, stopping at the first that rejects it"""
+        interesting = True
+        for check in self.checks:
+            check.checked += 1
+            if not check.test(expose):
+                check.rejected += 1
+                interesting = False
+                break
+        self.evaluated += 1
+        if self.evaluated % self.REORDER_INTERVAL == 0:
+            self.checks = sorted(self.checks, key=FilterCheck.score, reverse=True)
+        return interesting
 
     def is_interesting_expose(self, expose):
         """Apply all filters to this expose"""
-        return reduce((lambda x, y: x and y),
-                      map((lambda x: x.is_interesting(expose)), self.filters), True)
+        interesting = self.passes_checks(expose)
+        for batch_filter in self.batch_filters:
+            interesting = batch_filter.is_interesting(expose) and interesting
+        return interesting
 
     def filter(self, exposes):
         """Apply all filters to every expose in the list"""
-        return filter(self.is_interesting_expose, exposes)
+        if not self.batch_filters:
+            return filter(self.passes_checks, exposes)
+        return self.filter_chunks(exposes)
+
+    def filter_chunks(self, exposes):
+        """Apply all filters to the exposes in chunks. Filters with a 'filter_batch'
+           method check a whole chunk at once, e.g. with a single database query"""
+        exposes = iter(exposes)
+        while True:
+            chunk = list(islice(exposes, self.CHUNK_SIZE))
+            if not chunk:
+                return
+            keep = [self.passes_checks(expose) for expose in chunk]
+            for batch_filter in self.batch_filters:
+                keep = [a and b for a, b in zip(keep, batch_filter.filter_batch(chunk))]
+            yield from (expose for expose, interesting in zip(chunk, keep) if interesting)
 
     @staticmethod
     def builder():
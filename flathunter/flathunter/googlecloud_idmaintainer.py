@@ -12,6 +12,9 @@ class GoogleCloudIdMaintainer:
     """Storage back-end - implementation of IdMaintainer API"""
     __log__ = logging.getLogger('flathunt')
 
+    # Firestore allows at most 500 writes in a batch
+    BATCH_SIZE = 500
+
     def __init__(self):
         project_id = Config().get('google_cloud_project_id')
         if project_id is None:
@@ -26,12 +29,39 @@ class GoogleCloudIdMaintainer:
         self.__log__.debug('mark_processed(%d)', expose_id)
         self.database.collection(u'processed').document(str(expose_id)).set({u'id': expose_id})
 
+    def mark_processed_many(self, expose_ids):
+        """Mark several exposes as processed, in batched writes"""
+        collection = self.database.collection(u'processed')
+        for start in range(0, len(expose_ids), self.BATCH_SIZE):
+            batch = self.database.batch()
+            for expose_id in expose_ids[start:start + self.BATCH_SIZE]:
+                batch.set(collection.document(str(expose_id)), {u'id': expose_id})
+            batch.commit()
+
     def is_processed(self, expose_id):
         """Returns true if an expose has already been marked as processed"""
         self.__log__.debug('is_processed(%d)', expose_id)
         doc = self.database.collection(u'processed').document(str(expose_id))
         return doc.get().exists
 
+    def get_processed_ids(self):
+        """Returns the ids of all processed exposes"""
+        return [doc.id for doc in self.database.collection(u'processed').stream()]
+
+    def filter_unprocessed(self, expose_ids):
+        """Returns those of the given ids that have not been processed yet,
+           reading all documents in a single round trip per batch"""
+        collection = self.database.collection(u'processed')
+        processed = set()
+        for start in range(0, len(expose_ids), self.BATCH_SIZE):
+            refs = [collection.document(str(expose_id))
+                    for expose_id in expose_ids[start:start + self.BATCH_SIZE]]
+            processed.update(doc.id for doc in self.database.get_all(refs) if doc.exists)
+        return [expose_id for expose_id in expose_ids if str(expose_id) not in processed]
+
+    def flush(self):
+        """Writes go straight to Firestore, so there is nothing to flush"""
+
     def save_expose(self, expose):
         """Writes an expose to the storage backend"""
         record = expose.copy()
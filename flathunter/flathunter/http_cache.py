@@ -0,0 +1,127 @@
+"""Disk cache for pages fetched over plain HTTP. Cached pages are revalidated with
+   conditional requests, and the hash of every result page is remembered, so that
+   a page that did not change since the last crawl is not parsed again"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+class HttpCache:
+    """Keeps one entry per URL on disk: the body of the last response, its ETag
+       and Last-Modified validators, the time it was fetched, and the hash of
+       the body the last time exposes were extracted from it. Responses younger
+       than 'ttl' seconds are served without asking the server at all, and
+       entries older than 'max_age' seconds are removed"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    EVICT_INTERVAL = 3600
+
+    def __init__(self, directory, ttl=60, max_age=7 * 24 * 3600):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def from_config(config):
+        """Create a cache with the settings from the 'http_cache' config section"""
+        return HttpCache(config.http_cache_directory(), ttl=config.http_cache_ttl(),
+                         max_age=config.http_cache_max_age())
+
+    def path(self, url):
+        """File that holds the entry for the URL"""
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def get(self, url):
+        """Returns (meta, content) of the cached response for the URL, or None"""
+        try:
+            with open(self.path(url), 'rb') as entry:
+                meta, content = entry.read().split(b'\n', 1)
+            return json.loads(meta), content
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url, meta, content):
+        """Write an entry. The file is replaced atomically, so readers never see
+           a partial entry"""
+        path = self.path(url)
+        with open(path + '.tmp', 'wb') as entry:
+            entry.write(json.dumps(meta).encode('utf-8') + b'\n' + content)
+        os.replace(path + '.tmp', path)
+        if time.time() - self.evicted > self.EVICT_INTERVAL:
+            self.evict()
+
+    def is_fresh(self, meta):
+        """True if the cached response may be used without revalidating it"""
+        return time.time() - meta.get('fetched', 0) < self.ttl
+
+    @staticmethod
+    def validators(meta):
+        """Headers for a conditional request for the cached response"""
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def store(self, url, response):
+        """Cache a successful response, keeping the hash of the last extraction"""
+        with self.lock:
+            cached = self.get(url)
+            meta = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched': time.time(),
+                'extracted': cached[0].get('extracted') if cached else None,
+            }
+            self.put(url, meta, response.content)
+
+    def revalidated(self, url, meta, content):
+        """The server confirmed the cached response is current (304 Not Modified)"""
+        with self.lock:
+            self.put(url, dict(meta, fetched=time.time()), content)
+
+    @staticmethod
+    def digest(content):
+        """Hash of a page body, as remembered for extracted result pages"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return hashlib.sha256(content).hexdigest()
+
+    def is_unchanged(self, url, digest):
+        """Returns true if the exposes of this page were extracted before, from
+           content with exactly this hash"""
+        cached = self.get(url)
+        return cached is not None and cached[0].get('extracted') == digest
+
+    def mark_extracted(self, digests):
+        """Remember the hashes of result pages whose exposes were extracted - only
+           called once the crawl that extracted them succeeded, so a failed crawl
+           never hides a page from the next one"""
+        with self.lock:
+            for url, digest in digests.items():
+                cached = self.get(url)
+                meta = cached[0] if cached else {'fetched': 0}
+                self.put(url, dict(meta, extracted=digest), cached[1] if cached else b'')
+
+    def evict(self):
+        """Remove entries that were not written for 'max_age' seconds - such as
+           expose pages, which are only fetched once"""
+        self.evicted = time.time()
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if self.evicted - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            self.__log__.debug("Evicted %d entries from the HTTP cache", removed)
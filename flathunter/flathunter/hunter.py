@@ -1,12 +1,14 @@
 """Default Flathunter implementation for the command line"""
 import logging
 import traceback
-from itertools import chain
 import requests
 
+from flathunter.abstract_crawler import Crawler
 from flathunter.config import Config
 from flathunter.filter import Filter
 from flathunter.processor import ProcessorChain
+from flathunter.crawl_scheduler import CrawlScheduler
+from flathunter.crawl_dedup import CrawlDeduplicator
 from flathunter.captcha.captcha_solver import CaptchaUnsolvableError
 
 class Hunter:
@@ -20,7 +22,8 @@ class Hunter:
         self.id_watch = id_watch
 
     def crawl_for_exposes(self, max_pages=None):
-        """Trigger a new crawl of the configured URLs"""
+        """Trigger a new crawl of the configured URLs. Exposes found by several
+           URLs are only returned once"""
         def try_crawl(searcher, url, max_pages):
             try:
                 return searcher.crawl(url, max_pages)
@@ -31,9 +34,20 @@ class Hunter:
                 self.__log__.info("Error while scraping url %s:\n%s", url, traceback.format_exc())
                 return []
 
-        return chain(*[try_crawl(searcher,url, max_pages)
-                       for searcher in self.config.searchers()
-                       for url in self.config.get('urls', [])])
+        scheduler = CrawlScheduler(try_crawl,
+                                   workers=self.config.crawl_workers(),
+                                   per_portal=self.config.crawl_per_portal())
+        jobs = self.config.crawl_targets()
+        if self.config.crawl_incremental():
+            for searcher, _ in jobs:
+                searcher.id_watch = self.id_watch
+        return CrawlDeduplicator().deduplicate(scheduler.run(jobs, max_pages))
+
+    def close(self):
+        """Release the resources the crawlers keep between hunts"""
+        for searcher in self.config.searchers():
+            searcher.close()
+        Crawler.close_parse_pool()
 
     def hunt_flats(self, max_pages=None):
         """Crawl, process and filter exposes"""
@@ -41,10 +55,18 @@ class Hunter:
                            .read_config(self.config) \
                            .filter_already_seen(self.id_watch) \
                            .build()
+        description_filter = Filter.builder() \
+                                   .read_description_config(self.config) \
+                                   .build()
 
+        # All crawled exposes are saved, but descriptions are only loaded for the
+        # interesting ones - those are saved again, with their description
         processor_chain = ProcessorChain.builder(self.config) \
                                         .save_all_exposes(self.id_watch) \
                                         .apply_filter(filter_set) \
+                                        .enrich_descriptions() \
+                                        .apply_filter(description_filter) \
+                                        .save_all_exposes(self.id_watch) \
                                         .resolve_addresses() \
                                         .calculate_durations() \
                                         .send_messages() \
@@ -55,5 +77,11 @@ class Hunter:
         for expose in processor_chain.process(self.crawl_for_exposes(max_pages)):
             self.__log__.info('New offer: %s', expose['title'])
             result.append(expose)
+        self.id_watch.flush()
+
+        for searcher in self.config.searchers():
+            for metrics in searcher.get_fetch_metrics():
+                self.__log__.info("Fetch metrics for %s in this run - %s",
+                                  searcher.get_name(), metrics.take())
 
         return result
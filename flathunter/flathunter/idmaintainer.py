@@ -4,6 +4,7 @@ import sqlite3 as lite
 import datetime
 import json
 import logging
+import time
 
 from flathunter.abstract_processor import Processor
 
@@ -38,57 +39,239 @@ class AlreadySeenFilter:
             return True
         return False
 
+    def filter_batch(self, exposes):
+        """Returns a flag for every expose - true if it should be kept in the pipeline.
+           The whole batch is looked up and marked as processed at once"""
+        ids = list(dict.fromkeys(expose['id'] for expose in exposes))
+        unprocessed = set(self.id_watch.filter_unprocessed(ids))
+        self.id_watch.mark_processed_many([expose_id for expose_id in ids
+                                           if expose_id in unprocessed])
+        flags = []
+        for expose in exposes:
+            flags.append(expose['id'] in unprocessed)
+            # Only the first of several exposes with the same id is new
+            unprocessed.discard(expose['id'])
+        return flags
+
+class ProcessedIdCache:
+    """In-memory front cache for the processed ids of an id maintainer (SQLite or
+       Firestore). Unless 'warm' is false, the cache is warmed with all processed
+       ids on creation; otherwise it only learns the ids looked up or marked since.
+       Ids are only looked up in storage if they are not in the cache. All other
+       calls are passed through to the wrapped id maintainer"""
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self, id_watch, warm=True):
+        self.id_watch = id_watch
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.ids = set()
+        if warm:
+            self.ids.update(map(self.key, id_watch.get_processed_ids()))
+            self.__log__.debug("Warmed processed id cache with %d ids", len(self.ids))
+
+    def __getattr__(self, name):
+        return getattr(self.id_watch, name)
+
+    @staticmethod
+    def key(expose_id):
+        """Ids are kept as integers where possible, which also matches numeric
+           strings with the integer ids read from storage"""
+        try:
+            return int(expose_id)
+        except (TypeError, ValueError):
+            return expose_id
+
+    def is_processed(self, expose_id):
+        """Returns true if an expose has already been processed"""
+        if self.key(expose_id) in self.ids:
+            with self.lock:
+                self.hits += 1
+            return True
+        with self.lock:
+            self.misses += 1
+        if self.id_watch.is_processed(expose_id):
+            self.ids.add(self.key(expose_id))
+            return True
+        return False
+
+    def filter_unprocessed(self, expose_ids):
+        """Returns those of the given ids that have not been processed yet"""
+        unknown = [expose_id for expose_id in expose_ids if self.key(expose_id) not in self.ids]
+        with self.lock:
+            self.hits += len(expose_ids) - len(unknown)
+            self.misses += len(unknown)
+        if not unknown:
+            return []
+        unprocessed = self.id_watch.filter_unprocessed(unknown)
+        self.ids.update(set(map(self.key, unknown)) - set(map(self.key, unprocessed)))
+        return unprocessed
+
+    def mark_processed(self, expose_id):
+        """Mark an expose as processed"""
+        self.id_watch.mark_processed(expose_id)
+        self.ids.add(self.key(expose_id))
+
+    def mark_processed_many(self, expose_ids):
+        """Mark several exposes as processed"""
+        self.id_watch.mark_processed_many(expose_ids)
+        self.ids.update(map(self.key, expose_ids))
+
+    def flush(self):
+        """Flush the wrapped id maintainer, and report the cache statistics"""
+        self.id_watch.flush()
+        self.__log__.debug("Processed id cache: %d ids, %d hits, %d misses",
+                           len(self.ids), self.hits, self.misses)
+
 class IdMaintainer:
-    """SQLite back-end for the database"""
+    """SQLite back-end for the database. Processed ids and exposes are buffered,
+       and written in a single transaction once 'batch_size' rows are pending,
+       'flush_interval' seconds have passed, or flush() is called"""
     __log__ = logging.getLogger('flathunt')
 
-    def __init__(self, db_name):
+    # SQLite limits the number of parameters in a single query
+    QUERY_CHUNK_SIZE = 500
+
+    MIGRATIONS = [
+        # 1: initial schema
+        ['CREATE TABLE IF NOT EXISTS processed (ID INTEGER)',
+         'CREATE TABLE IF NOT EXISTS executions (timestamp timestamp)',
+         'CREATE TABLE IF NOT EXISTS exposes (id INTEGER, created TIMESTAMP, \
+                 crawler STRING, details BLOB, PRIMARY KEY (id, crawler))',
+         'CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, settings BLOB)'],
+        # 2: unique, indexed processed ids; index exposes by creation time. NULL
+        # would be given a new rowid, and text is rejected by the primary key,
+        # so only integer ids are kept
+        ['CREATE TABLE processed_unique (id INTEGER PRIMARY KEY)',
+         'INSERT OR IGNORE INTO processed_unique SELECT ID FROM processed '
+         'WHERE typeof(ID) = \'integer\'',
+         'DROP TABLE processed',
+         'ALTER TABLE processed_unique RENAME TO processed',
+         'CREATE INDEX IF NOT EXISTS exposes_created ON exposes (created)'],
+    ]
+
+    def __init__(self, db_name, batch_size=1, flush_interval=None):
         self.db_name = db_name
         self.threadlocal = threading.local()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending_lock = threading.RLock()
+        self.pending_ids = {}
+        self.pending_exposes = []
+        self.last_flush = time.monotonic()
 
     def get_connection(self):
         """Connects to the SQLite database. Connections are thread-local"""
         connection = getattr(self.threadlocal, 'connection', None)
         if connection is None:
             try:
-                self.threadlocal.connection = lite.connect(self.db_name)
-                connection = self.threadlocal.connection
-                cur = self.threadlocal.connection.cursor()
-                cur.execute('CREATE TABLE IF NOT EXISTS processed (ID INTEGER)')
-                cur.execute('CREATE TABLE IF NOT EXISTS executions (timestamp timestamp)')
-                cur.execute('CREATE TABLE IF NOT EXISTS exposes (id INTEGER, created TIMESTAMP, \
-                                    crawler STRING, details BLOB, PRIMARY KEY (id, crawler))')
-                cur.execute('CREATE TABLE IF NOT EXISTS users \
-                                    (id INTEGER PRIMARY KEY, settings BLOB)')
-                self.threadlocal.connection.commit()
+                connection = lite.connect(self.db_name)
+            except lite.Error as error:
+                self.__log__.error("Error %s:", error.args[0])
+                raise error
+            try:
+                cur = connection.cursor()
+                cur.execute('PRAGMA journal_mode=WAL')
+                cur.execute('PRAGMA synchronous=NORMAL')
+                self.migrate(connection)
             except lite.Error as error:
+                # the next call connects again and retries the migration
                 self.__log__.error("Error %s:", error.args[0])
+                connection.close()
                 raise error
+            self.threadlocal.connection = connection
         return connection
 
+    def migrate(self, connection):
+        """Brings the database schema up to date. The schema version is kept in
+           the 'user_version' pragma, so existing databases are upgraded in place"""
+        cur = connection.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            version = cur.execute('PRAGMA user_version').fetchone()[0]
+            for target_version, statements in enumerate(self.MIGRATIONS[version:], version + 1):
+                self.__log__.info("Migrating database to schema version %d", target_version)
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute(f'PRAGMA user_version = {target_version}')
+            connection.commit()
+        except lite.Error:
+            connection.rollback()
+            raise
+
     def is_processed(self, expose_id):
         """Returns true if an expose has already been processed"""
         self.__log__.debug('is_processed(%d)', expose_id)
+        if expose_id in self.pending_ids:
+            return True
         cur = self.get_connection().cursor()
         cur.execute('SELECT id FROM processed WHERE id = ?', (expose_id,))
         row = cur.fetchone()
         return row is not None
 
+    def filter_unprocessed(self, expose_ids):
+        """Returns those of the given ids that have not been processed yet"""
+        expose_ids = [expose_id for expose_id in expose_ids if expose_id not in self.pending_ids]
+        processed = set()
+        cur = self.get_connection().cursor()
+        for start in range(0, len(expose_ids), self.QUERY_CHUNK_SIZE):
+            chunk = expose_ids[start:start + self.QUERY_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            cur.execute(f'SELECT id FROM processed WHERE id IN ({placeholders})', chunk)
+            processed.update(str(row[0]) for row in cur.fetchall())
+        return [expose_id for expose_id in expose_ids if str(expose_id) not in processed]
+
+    def get_processed_ids(self):
+        """Returns all processed ids"""
+        self.flush()
+        cur = self.get_connection().cursor()
+        cur.execute('SELECT id FROM processed')
+        return [row[0] for row in cur.fetchall()]
+
     def mark_processed(self, expose_id):
         """Mark an expose as processed in the database"""
         self.__log__.debug('mark_processed(%d)', expose_id)
-        cur = self.get_connection().cursor()
-        cur.execute('INSERT INTO processed VALUES(?)', (expose_id,))
-        self.get_connection().commit()
+        self.mark_processed_many([expose_id])
+
+    def mark_processed_many(self, expose_ids):
+        """Mark several exposes as processed in the database"""
+        with self.pending_lock:
+            for expose_id in expose_ids:
+                self.pending_ids[expose_id] = None
+        self.flush_if_due()
 
     def save_expose(self, expose):
         """Saves an expose to a database"""
-        cur = self.get_connection().cursor()
-        cur.execute('INSERT OR REPLACE INTO exposes(id, created, crawler, details) \
-                     VALUES (?, ?, ?, ?)',
-                    (int(expose['id']), datetime.datetime.now(),
-                     expose['crawler'], json.dumps(expose)))
-        self.get_connection().commit()
+        with self.pending_lock:
+            self.pending_exposes.append((int(expose['id']), datetime.datetime.now(),
+                                         expose['crawler'], json.dumps(expose)))
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        """Flushes the pending writes if the batch is full or the interval has passed"""
+        pending = len(self.pending_ids) + len(self.pending_exposes)
+        interval_passed = self.flush_interval is not None \
+            and time.monotonic() - self.last_flush >= self.flush_interval
+        if pending >= self.batch_size or (pending > 0 and interval_passed):
+            self.flush()
+
+    def flush(self):
+        """Writes all pending processed ids and exposes in a single transaction"""
+        with self.pending_lock:
+            ids = [(expose_id,) for expose_id in self.pending_ids]
+            exposes = self.pending_exposes
+            if ids or exposes:
+                connection = self.get_connection()
+                with connection:
+                    connection.executemany('INSERT OR IGNORE INTO processed VALUES(?)', ids)
+                    connection.executemany('INSERT OR REPLACE INTO exposes(id, created, crawler, \
+                                            details) VALUES (?, ?, ?, ?)', exposes)
+                self.__log__.debug('Flushed %d processed ids and %d exposes',
+                                   len(ids), len(exposes))
+            self.pending_ids = {}
+            self.pending_exposes = []
+            self.last_flush = time.monotonic()
 
     def get_exposes_since(self, min_datetime):
         """Loads all exposes since the specified date"""
@@ -96,6 +279,7 @@ class IdMaintainer:
             obj = json.loads(row[2])
             obj['created_at'] = row[0]
             return obj
+        self.flush()
         cur = self.get_connection().cursor()
         cur.execute('SELECT created, crawler, details FROM exposes \
                      WHERE created >= ? ORDER BY created DESC', (min_datetime,))
@@ -103,6 +287,7 @@ class IdMaintainer:
 
     def get_recent_exposes(self, count, filter_set=None):
         """Returns up to 'count' recent exposes, filtered by the provided filter"""
+        self.flush()
         cur = self.get_connection().cursor()
         cur.execute('SELECT details FROM exposes ORDER BY created DESC')
         res = []
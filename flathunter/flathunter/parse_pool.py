@@ -0,0 +1,66 @@
+"""Parsing of result pages in worker processes, so extraction is not limited to
+   the one core the interpreter lock allows"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Crawler instances used inside a worker process, one per crawler class
+WORKER_CRAWLERS = {}
+
+def extract_in_worker(crawler_class, content):
+    """Runs in the worker process: parse a raw result page and return the exposes"""
+    crawler = WORKER_CRAWLERS.get(crawler_class)
+    if crawler is None:
+        # The config module imports all crawlers, which import this module
+        # pylint: disable=import-outside-toplevel
+        from flathunter.config import Config
+        # Extraction needs no settings, and an empty config starts no browser
+        crawler = crawler_class(Config(string="urls: []"))
+        WORKER_CRAWLERS[crawler_class] = crawler
+    return crawler.extract_data(crawler.parse(content, crawler.RESULT_STRAINER))
+
+class ParsePool:
+    """Ships raw result pages to a pool of worker processes running the crawler's
+       extract_data, and returns the plain expose dicts. Pages smaller than
+       'min_page_size' bytes are parsed in-process, where the round trip to a
+       worker would cost more than it saves"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self, workers=0, min_page_size=65536):
+        self.workers = workers
+        self.min_page_size = min_page_size
+        self.executor = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def from_config(config):
+        """Create a pool with the settings from the 'parsing' config section"""
+        return ParsePool(workers=config.parse_workers(),
+                         min_page_size=config.parse_min_page_size())
+
+    def get_executor(self):
+        """Returns the process pool, starting it on first use"""
+        with self.lock:
+            if self.executor is None:
+                self.__log__.debug("Starting %d parser processes", self.workers)
+                # Worker processes are spawned, as forking a process with running
+                # crawl threads can leave locks held in the child
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+    def extract(self, crawler, content):
+        """Extract the exposes from a raw result page with the given crawler"""
+        if self.workers <= 0 or len(content) < self.min_page_size:
+            return crawler.extract_data(crawler.parse(content, crawler.RESULT_STRAINER))
+        return self.get_executor().submit(extract_in_worker, type(crawler), content).result()
+
+    def close(self):
+        """Stop the worker processes"""
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
@@ -5,6 +5,7 @@ from flathunter.default_processors import AddressResolver
 from flathunter.default_processors import Filter
 from flathunter.default_processors import LambdaProcessor
 from flathunter.default_processors import CrawlExposeDetails
+from flathunter.default_processors import DescriptionEnricher
 from flathunter.sender_mattermost import SenderMattermost
 from flathunter.sender_telegram import SenderTelegram
 from flathunter.gmaps_duration_processor import GMapsDurationProcessor
@@ -17,9 +18,11 @@ class ProcessorChainBuilder:
         self.processors = []
         self.config = config
 
-    def send_messages(self, receivers=None):
-        """Add processor that sends messages for exposes"""
-        notifiers = self.config.get('notifiers', [])
+    def send_messages(self, receivers=None, notifiers=None):
+        """Add processor that sends messages for exposes, with the configured
+           notifiers unless others are given"""
+        if notifiers is None:
+            notifiers = self.config.get('notifiers', [])
         if 'telegram' in notifiers:
             self.processors.append(SenderTelegram(self.config, receivers=receivers))
         if 'mattermost' in notifiers:
@@ -44,6 +47,11 @@ class ProcessorChainBuilder:
         self.processors.append(CrawlExposeDetails(self.config))
         return self
 
+    def enrich_descriptions(self):
+        """Add processor to load expose descriptions"""
+        self.processors.append(DescriptionEnricher(self.config))
+        return self
+
     def map(self, func):
         """Add processor that applies a lambda to exposes"""
         self.processors.append(LambdaProcessor(self.config, func))
@@ -1,13 +1,19 @@
 """ Gets proxies """
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
+from lxml.etree import LxmlError
 from lxml.html import fromstring
 
-def get_proxies():
+def get_proxies(timeout=30):
     """
     Gets random, free proxies
     """
     url = "https://free-proxy-list.net/"
-    response = requests.get(url)
+    response = requests.get(url, timeout=timeout)
     parser = fromstring(response.text)
     proxies = set()
     for i in parser.xpath('//tbody/tr')[:250]:
@@ -16,3 +22,160 @@ def get_proxies():
             proxy = ":".join([i.xpath('.//td[1]/text()')[0], i.xpath('.//td[2]/text()')[0]])
             proxies.add(proxy)
     return proxies
+
+class ProxyUnavailableError(requests.exceptions.RequestException):
+    """Raised when no proxy could fetch a page"""
+
+class ProxyStats:
+    """Health of a single proxy: success rate and latency as moving averages"""
+
+    def __init__(self, address):
+        self.address = address
+        self.success_rate = 1.0
+        self.latency = None
+        self.failures = 0
+        self.quarantined_until = 0.0
+
+    def score(self, default_latency):
+        """Expected time per successful request - lower is better"""
+        latency = default_latency if self.latency is None else self.latency
+        return latency / max(self.success_rate, 0.01)
+
+class ProxyPool:
+    """Long-lived pool of free proxies. The proxy list is refreshed in the background,
+       every proxy keeps a health score, failing proxies are quarantined, and pages
+       are fetched by racing the best proxies against each other"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, refresh_interval=600, race=4, quarantine=300, max_failures=3,
+                 max_rounds=5, timeout=10, alpha=0.3, source=get_proxies):
+        self.refresh_interval = refresh_interval
+        self.race_size = race
+        self.quarantine = quarantine
+        self.max_failures = max_failures
+        self.max_rounds = max_rounds
+        self.timeout = timeout
+        self.alpha = alpha
+        self.source = source
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.refreshed_at = None
+        self.refresher = None
+        self.stopped = threading.Event()
+
+    @staticmethod
+    def from_config(config):
+        """Create a pool with the settings from the 'proxy_pool' config section"""
+        return ProxyPool(**config.proxy_pool_settings())
+
+    def refresh(self):
+        """Reload the proxy list. Known proxies keep their statistics. If the list
+           cannot be loaded or parsed, the current proxies are kept"""
+        try:
+            addresses = self.source()
+        except (requests.exceptions.RequestException, LxmlError, ValueError, IndexError) as error:
+            self.__log__.warning("Unable to refresh proxy list: %s", error)
+            return
+        if not addresses:
+            self.__log__.warning("Proxy list is empty, keeping the current proxies")
+            return
+        with self.lock:
+            self.stats = {address: self.stats.get(address, ProxyStats(address))
+                          for address in addresses}
+            self.refreshed_at = time.monotonic()
+        self.__log__.debug("Refreshed proxy list: %d proxies", len(addresses))
+
+    def start(self):
+        """Load the proxy list, and keep it fresh in a background thread"""
+        with self.start_lock:
+            if self.refreshed_at is None:
+                self.refresh()
+            if self.refresher is None:
+                self.refresher = threading.Thread(target=self._refresh_loop,
+                                                  name='proxy-refresh', daemon=True)
+                self.refresher.start()
+
+    def stop(self):
+        """Stop the background refresh"""
+        self.stopped.set()
+
+    def _refresh_loop(self):
+        while not self.stopped.wait(self.refresh_interval):
+            self.refresh()
+
+    def best(self, count):
+        """Returns the addresses of the 'count' healthiest, fastest proxies"""
+        now = time.monotonic()
+        with self.lock:
+            healthy = [stats for stats in self.stats.values() if stats.quarantined_until <= now]
+        healthy.sort(key=lambda stats: stats.score(self.timeout))
+        return [stats.address for stats in healthy[:count]]
+
+    def record(self, address, latency=None):
+        """Update the health of a proxy. A latency of None marks a failure"""
+        with self.lock:
+            stats = self.stats.get(address)
+            if stats is None:
+                return
+            success = 0.0 if latency is None else 1.0
+            stats.success_rate += self.alpha * (success - stats.success_rate)
+            if latency is None:
+                stats.failures += 1
+                if stats.failures >= self.max_failures:
+                    self.__log__.debug("Quarantining proxy %s", address)
+                    stats.quarantined_until = time.monotonic() + self.quarantine
+                    stats.failures = 0
+            else:
+                stats.failures = 0
+                stats.latency = latency if stats.latency is None \
+                    else stats.latency + self.alpha * (latency - stats.latency)
+
+    def _try_proxy(self, address, url, headers):
+        start = time.monotonic()
+        try:
+            resp = requests.get(url, headers=headers,
+                                proxies={"http": address, "https": address},
+                                timeout=self.timeout)
+        except requests.exceptions.RequestException as error:
+            self.__log__.debug("Proxy %s failed: %s", address, error)
+            self.record(address)
+            return None
+        if resp.status_code != 200:
+            self.__log__.debug("Proxy %s got response (%i)", address, resp.status_code)
+            self.record(address)
+            return None
+        self.record(address, time.monotonic() - start)
+        return resp
+
+    def race(self, url, headers):
+        """Fetch the URL through several proxies at once, and return the first
+           successful response (or None)"""
+        candidates = self.best(self.race_size)
+        if not candidates:
+            return None
+        executor = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix='proxy')
+        futures = [executor.submit(self._try_proxy, address, url, headers)
+                   for address in candidates]
+        try:
+            for future in as_completed(futures):
+                resp = future.result()
+                if resp is not None:
+                    return resp
+            return None
+        finally:
+            # The losing requests finish in the background and still update the stats
+            executor.shutdown(wait=False)
+
+    def fetch(self, url, headers):
+        """Fetch the URL through the pool, giving up after a bounded number of rounds"""
+        self.start()
+        for _ in range(self.max_rounds):
+            resp = self.race(url, headers)
+            if resp is not None:
+                return resp
+            if not self.best(1):
+                self.refresh()
+        raise ProxyUnavailableError(f"No proxy was able to fetch {url}")
@@ -1,20 +1,317 @@
 """Functions and classes related to sending Telegram messages"""
-import socket
-import urllib.request
-import urllib.parse
-import urllib.error
+import json
 import logging
+import queue
+import sqlite3
+import threading
 import time
 
+import pika
 import requests
-import json
 
 from flathunter.abstract_processor import Processor
-import pika
+
+
+class TelegramOutbox:
+    """Durable store for Telegram API calls that have not been published yet. A
+       call is stored before it is queued, and only removed once the broker has
+       confirmed it, so calls survive a restart of flathunter or of the broker"""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS outbox '
+                                    '(id INTEGER PRIMARY KEY AUTOINCREMENT, body TEXT NOT NULL)')
+            self.connection.commit()
+
+    def add(self, body):
+        """Store a call, returning its id"""
+        with self.lock:
+            cur = self.connection.execute('INSERT INTO outbox (body) VALUES (?)', (body,))
+            self.connection.commit()
+            return cur.lastrowid
+
+    def pending(self):
+        """All stored calls as (id, body), oldest first"""
+        with self.lock:
+            return self.connection.execute('SELECT id, body FROM outbox ORDER BY id').fetchall()
+
+    def remove(self, ids):
+        """Remove delivered calls"""
+        ids = [i for i in ids if i is not None]
+        if not ids:
+            return
+        with self.lock:
+            self.connection.executemany('DELETE FROM outbox WHERE id = ?', [(i,) for i in ids])
+            self.connection.commit()
+
+
+class TelegramBroker:
+    """Connection of the TelegramPublisher to RabbitMQ. The channel is
+       transactional: a batch is published as a whole and then committed, which
+       takes a single round trip; once the commit is acknowledged, the broker
+       has stored every message of the batch"""
+    __log__ = logging.getLogger('flathunt')
+
+    # Earlier versions used the non-durable queue 'telegram'. A queue cannot be
+    # redeclared as durable, so the durable queue has a new name; the message
+    # sender also drains the old queue
+    QUEUE = 'telegram_durable'
+    RECONNECT_INTERVAL = 30
+
+    def __init__(self, config):
+        self.config = config
+        self.connection = None
+        self.channel = None
+        self.failed_at = None
+        self.returned = set()
+
+    def connect(self):
+        """Open a connection and a transactional channel, unless the last attempt
+           failed recently. Returns the channel, or None"""
+        if self.channel is not None:
+            return self.channel
+        if self.failed_at is not None and \
+                time.monotonic() - self.failed_at < self.RECONNECT_INTERVAL:
+            return None
+        try:
+            credentials = pika.PlainCredentials(self.config.get_rabbitmq_user(),
+                                                self.config.get_rabbitmq_password())
+            pika_params = pika.ConnectionParameters(host=self.config.get_rabbitmq_host(),
+                                                    port=self.config.get_rabbitmq_port(),
+                                                    credentials=credentials,
+                                                    connection_attempts=3,
+                                                    retry_delay=1)
+            self.connection = pika.BlockingConnection(pika_params)
+            self.channel = self.connection.channel()
+            self.channel.queue_declare(queue=self.QUEUE, durable=True)
+            self.channel.add_on_return_callback(self.on_return)
+            self.channel.tx_select()
+            self.failed_at = None
+            self.__log__.debug("Connected to RabbitMQ")
+        except Exception as e:  # pylint: disable=broad-except
+            self.__log__.error("Could not connect to RabbitMQ: %s", e)
+            self.fail()
+        return self.channel
+
+    def on_return(self, _channel, _method, properties, _body):
+        """Remember a message the broker could not route to the queue"""
+        self.returned.add(properties.message_id)
+
+    def publish(self, bodies):
+        """Publish the bodies as persistent messages in one transaction. Returns
+           the positions of the bodies that the broker could not route"""
+        self.returned = set()
+        for position, body in enumerate(bodies):
+            properties = pika.BasicProperties(delivery_mode=2, message_id=str(position))
+            self.channel.basic_publish(exchange='', routing_key=self.QUEUE, body=body,
+                                       properties=properties, mandatory=True)
+        self.channel.tx_commit()
+        # the broker returns unroutable messages before it acknowledges the
+        # commit, but the callbacks only run when events are processed
+        self.connection.process_data_events(0)
+        return {int(position) for position in self.returned}
+
+    def keep_alive(self):
+        """Answer heartbeats on an idle connection"""
+        if self.connection is None:
+            return
+        try:
+            self.connection.process_data_events(0)
+        except pika.exceptions.AMQPError:
+            self.reset()
+
+    def fail(self):
+        """Drop the connection, and treat the broker as unreachable for
+           RECONNECT_INTERVAL seconds"""
+        self.reset()
+        self.failed_at = time.monotonic()
+
+    def reset(self):
+        """Drop the connection, closing it if it is still open"""
+        connection, self.connection, self.channel = self.connection, None, None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except pika.exceptions.AMQPError:
+                pass
+
+
+class TelegramPublisher:
+    """Publishes Telegram API calls to the durable 'telegram_durable' RabbitMQ
+       queue, from where the message sender makes them. One publisher is shared
+       by all senders in the process.
+
+       Calls are stored in the outbox and put in a bounded buffer; when the buffer
+       is full, senders wait (backpressure). If the outbox cannot be opened - as
+       on a read-only file system - calls are only kept in the buffer. A
+       background thread publishes the buffered calls in batches of up to
+       'batch_size' through the TelegramBroker, and removes each batch from the
+       outbox once the broker committed it. The thread connects on the first
+       publish, reconnects when the connection was lost, and republishes what
+       was not committed. While RabbitMQ cannot be reached, the calls are made
+       directly, and connecting is retried after RECONNECT_INTERVAL seconds"""
+    __log__ = logging.getLogger('flathunt')
+
+    # Seconds the publishing thread waits for calls before checking whether it
+    # should stop
+    POLL_INTERVAL = 1
+    # Seconds without calls after which the idle connection is serviced, so the
+    # broker does not drop it for missed heartbeats
+    IDLE_INTERVAL = 20
+    instance = None
+    instance_lock = threading.Lock()
+
+    def __init__(self, config):
+        self.config = config
+        self.broker = TelegramBroker(config)
+        self.outbox = None
+        self.buffer = None
+        self.thread = None
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_instance(config):
+        """Returns the publisher of this process, creating it on first use"""
+        with TelegramPublisher.instance_lock:
+            if TelegramPublisher.instance is None:
+                TelegramPublisher.instance = TelegramPublisher(config)
+            return TelegramPublisher.instance
+
+    def start(self):
+        """Open the outbox and start the publishing thread, unless it runs already.
+           Calls left in the outbox by an earlier run are published first"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.outbox = self.open_outbox()
+            self.buffer = queue.Queue(maxsize=self.config.rabbitmq_buffer_size())
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run, name='telegram-publisher',
+                                           daemon=True)
+            self.thread.start()
+            left_over = self.outbox.pending() if self.outbox is not None else []
+        if left_over:
+            self.__log__.info("Publishing %d Telegram calls left in the outbox", len(left_over))
+        for message in left_over:
+            self.buffer.put(message)
+
+    def open_outbox(self):
+        """Returns the outbox, or None if it cannot be opened"""
+        try:
+            return TelegramOutbox(self.config.rabbitmq_outbox())
+        except sqlite3.Error as e:
+            self.__log__.warning("Could not open the Telegram outbox %s, publishing without it: %s",
+                                 self.config.rabbitmq_outbox(), e)
+            return None
+
+    def publish(self, url, params):
+        """Queue a call of the Telegram API, waiting while the buffer is full"""
+        self.start()
+        body = json.dumps({'url': url, 'params': params})
+        message_id = None
+        if self.outbox is not None:
+            try:
+                message_id = self.outbox.add(body)
+            except sqlite3.Error as e:
+                self.__log__.warning("Could not store Telegram call in the outbox: %s", e)
+        self.buffer.put((message_id, body))
+
+    def run(self):
+        """Publishing thread: take batches from the buffer and publish them, until
+           the publisher is closed and the buffer is empty"""
+        batch_size = self.config.rabbitmq_batch_size()
+        idle_since = time.monotonic()
+        while True:
+            try:
+                message = self.buffer.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                if self.stopping.is_set():
+                    self.broker.reset()
+                    return
+                if time.monotonic() - idle_since >= self.IDLE_INTERVAL:
+                    self.broker.keep_alive()
+                    idle_since = time.monotonic()
+                continue
+            batch = [message]
+            while len(batch) < batch_size:
+                try:
+                    batch.append(self.buffer.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.send_batch(batch)
+            except Exception as e:  # pylint: disable=broad-except
+                # the calls stay in the outbox, and are published after a restart
+                self.__log__.error("Could not publish %d Telegram calls: %s", len(batch), e)
+                self.broker.reset()
+            finally:
+                for _ in batch:
+                    self.buffer.task_done()
+            idle_since = time.monotonic()
+
+    def send_batch(self, batch):
+        """Publish a batch, reconnecting until every message was committed by the
+           broker or sent directly"""
+        remaining = list(batch)
+        failures = 0
+        while remaining:
+            if self.broker.connect() is None:
+                for _, body in remaining:
+                    self.send_directly(body)
+                returned = set()
+            else:
+                try:
+                    returned = self.broker.publish([body for _, body in remaining])
+                except pika.exceptions.AMQPError as e:
+                    self.__log__.warning("Publishing to RabbitMQ failed: %s", e)
+                    returned = set(range(len(remaining)))
+                    self.broker.reset()
+                if returned:
+                    # an idle connection dropped by the broker is simply reopened,
+                    # but if publishing fails again, the broker is treated as
+                    # unreachable
+                    failures += 1
+                    if failures > 1:
+                        self.broker.fail()
+            if self.outbox is not None:
+                self.outbox.remove([message_id for position, (message_id, _) in enumerate(remaining)
+                                    if position not in returned])
+            remaining = [message for position, message in enumerate(remaining)
+                         if position in returned]
+
+    def send_directly(self, body):
+        """Make a call of the Telegram API without RabbitMQ"""
+        message = json.loads(body)
+        try:
+            requests.post(message['url'], params=message['params'],
+                          timeout=self.config.http_timeout())
+        except requests.exceptions.RequestException as e:
+            self.__log__.error("Could not send Telegram message: %s", e)
+
+    def flush(self, timeout=None):
+        """Wait until all queued calls have been published. Returns false if they
+           were not within 'timeout' seconds"""
+        buffer = self.buffer
+        if buffer is None:
+            return True
+        with buffer.all_tasks_done:
+            return buffer.all_tasks_done.wait_for(lambda: buffer.unfinished_tasks == 0, timeout)
+
+    def close(self):
+        """Publish the queued calls, then stop the thread and close the connection"""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.stopping.set()
+            thread.join()
 
 
 class SenderTelegram(Processor):
-    """Expose processor that sends Telegram messages"""
+    """Expose processor that sends Telegram messages. All senders publish through
+       the shared TelegramPublisher, so creating one is cheap"""
     __log__ = logging.getLogger('flathunt')
 
     def __init__(self, config, receivers=None):
@@ -27,31 +324,20 @@ class SenderTelegram(Processor):
             self.receiver_ids = self.config.get('telegram', {}).get('receiver_ids', [])
         else:
             self.receiver_ids = receivers
-        try:
-            self.wait_for_connection(self.config.get_rabbitmq_host(), self.config.get_rabbitmq_port())
-            connected = False
-            while not connected:
-                try:
-                    credentials = pika.PlainCredentials(self.config.get_rabbitmq_user(),
-                                                        self.config.get_rabbitmq_password())
-                    pika_params = pika.ConnectionParameters(host=self.config.get_rabbitmq_host(),
-                                                            port=self.config.get_rabbitmq_port(),
-                                                            credentials=credentials)
-                    connection = pika.BlockingConnection(pika_params)
-                    self.channel = connection.channel()
-                    connected = True
-                except Exception as e:
-                    self.__log__.error("Error connecting to RabbitMQ: %s", e)
-                    time.sleep(1)
-
-            self.channel.queue_declare(queue='telegram')
-        except Exception as e:
-            self.__log__.error("Could not connect to RabbitMQ", e)
-            self.channel = None
+        self.publisher = TelegramPublisher.get_instance(config)
 
     def process_expose(self, expose):
-        """Send a message to a user describing the expose"""
-        self.__log__.debug(f"Processing expose: {expose}")
+        """Send a message to all receivers describing the expose"""
+        self.__log__.debug("Processing expose: %s", expose)
+        self.send_expose(expose, self.receiver_ids)
+        return expose
+
+    def deliver(self, receiver, expose):
+        """Send the expose to a single receiver"""
+        self.send_expose(expose, [receiver])
+
+    def send_expose(self, expose, receiver_ids):
+        """Send the message, pictures and description of an expose to the receivers"""
         message = self.config.get('message', "").format(
             title=expose['title'],
             rooms=expose['rooms'],
@@ -61,26 +347,27 @@ class SenderTelegram(Processor):
             url=expose['url'],
             address=expose['address'],
             durations="" if 'durations' not in expose else expose['durations']).strip()
-        self.send_msg(message)
+        self.send_msg(message, receiver_ids=receiver_ids)
 
         image_urls = expose['images']
         if image_urls is not None and len(image_urls) > 0:
-            self.send_pictures(image_urls)
+            self.send_pictures(image_urls, receiver_ids=receiver_ids)
         else:
             self.__log__.debug("No images to send")
 
         if expose['description'] is not None and not expose['description'].isspace():
-            self.send_msg(expose['description'], new_listing=False)
-
-        return expose
+            self.send_msg(expose['description'], new_listing=False, receiver_ids=receiver_ids)
 
-    def send_msg(self, message: str, new_listing=True):
+    def send_msg(self, message: str, new_listing=True, receiver_ids=None):
         """Send messages to each of the receivers in receiver_ids"""
-        if self.receiver_ids is None:
+        if receiver_ids is None:
+            receiver_ids = self.receiver_ids
+        if receiver_ids is None:
             return
-        for chat_id in self.receiver_ids:
+        for chat_id in receiver_ids:
             if new_listing:
-                self.send(self.send_msg_url, {'chat_id': chat_id, 'text': '------------NEW LISTING------------'})
+                self.send(self.send_msg_url,
+                          {'chat_id': chat_id, 'text': '------------NEW LISTING------------'})
 
             max_length = 4095
             if len(message) > max_length:
@@ -95,10 +382,13 @@ class SenderTelegram(Processor):
                 self.__log__.debug(('text', message))
                 self.send(self.send_msg_url, {'chat_id': chat_id, 'text': message})
 
-    def send_pictures(self, image_urls):
-        if self.receiver_ids is None:
+    def send_pictures(self, image_urls, receiver_ids=None):
+        """Send the pictures to each of the receivers, in albums of up to nine"""
+        if receiver_ids is None:
+            receiver_ids = self.receiver_ids
+        if receiver_ids is None:
             return
-        for chat_id in self.receiver_ids:
+        for chat_id in receiver_ids:
             image_urls = [image_url.split("/ORIG")[0] for image_url in image_urls]
             if len(image_urls) == 1:
                 self.__log__.debug("Sending one picture")
@@ -122,10 +412,12 @@ class SenderTelegram(Processor):
                         self.send_one_picture(chat_id, images_to_send[0])
 
     def send_one_picture(self, chat_id, image_url):
+        """Send a single picture to a receiver"""
         self.__log__.debug("Sending image %s", image_url)
         self.send(self.send_image_url, {'chat_id': chat_id, 'photo': image_url})
 
     def send_multiple_pictures(self, chat_id, image_urls):
+        """Send the pictures to a receiver as one album"""
         params = {
             "chat_id": chat_id,
             "media": []
@@ -139,20 +431,5 @@ class SenderTelegram(Processor):
         self.send(self.send_media_group_url, params)
 
     def send(self, url, params):
-        if self.channel is not None:
-            rabbit_msg = {'url': url, 'params': params}
-            self.channel.basic_publish(exchange='', routing_key='telegram', body=json.dumps(rabbit_msg))
-        else:
-            requests.post(url, params=params)
-
-    def wait_for_connection(self, host: str, port=5672, timeout=3):
-        is_reachable = False
-        while not is_reachable:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            try:
-                s.connect((host, port))
-                print("Connected to RabbitMQ")
-                is_reachable = True
-            except socket.error as e:
-                self.__log__.debug("Waiting for RabbitMQ to be reachable: %s", e)
-                time.sleep(timeout)
+        """Queue a call of the Telegram API with the shared publisher"""
+        self.publisher.publish(url, params)
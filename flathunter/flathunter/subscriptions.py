@@ -0,0 +1,90 @@
+"""Matching of new exposes against the filters of all users of the web interface"""
+import logging
+from bisect import bisect_left, bisect_right
+
+from flathunter.filter import Filter, ExposeHelper, merge_ranges
+
+class SubscriptionIndex:
+    """Compiles the filters of all users once, and indexes their price, size and
+       rooms bounds in sorted lists. Subscription sets are bitmasks (bit i for
+       subscription i), and the set of users admitted by the first k entries of
+       a sorted list is stored for every CHUNK entries. For a new expose, the
+       users admitted by each bound are found by bisection and at most CHUNK
+       bit operations, without visiting the other users; only users admitted
+       by all bounds are checked against the full user filters"""
+
+    __log__ = logging.getLogger('flathunt')
+    FIELDS = ('price', 'size', 'rooms')
+    CHUNK = 64
+
+    def __init__(self, user_settings):
+        self.subscriptions = []
+        lows = {field: [] for field in self.FIELDS}
+        highs = {field: [] for field in self.FIELDS}
+        for user_id, settings in user_settings:
+            if 'mute_notifications' in settings:
+                continue
+            filter_set = Filter.builder().read_config(settings).build()
+            ranges = merge_ranges(filter_set.filters)
+            number = len(self.subscriptions)
+            self.subscriptions.append((user_id, filter_set))
+            for field in self.FIELDS:
+                low, high = ranges.get(field, (None, None))
+                lows[field].append((float('-inf') if low is None else low, number))
+                highs[field].append((float('inf') if high is None else high, number))
+        self.everyone = (1 << len(self.subscriptions)) - 1
+        self.lows = {field: self.sorted_bounds(bounds) for field, bounds in lows.items()}
+        self.highs = {field: self.sorted_bounds(bounds) for field, bounds in highs.items()}
+        self.__log__.debug("Indexed the filters of %d users", len(self.subscriptions))
+
+    def sorted_bounds(self, bounds):
+        """Split (bound, subscription) pairs into the sorted bounds, the subscriptions
+           in that order, and the masks of the first 0, CHUNK, 2 * CHUNK, ...
+           subscriptions in that order"""
+        bounds.sort()
+        numbers = [number for _, number in bounds]
+        masks = [0]
+        mask = 0
+        for count, number in enumerate(numbers, 1):
+            mask |= 1 << number
+            if count % self.CHUNK == 0:
+                masks.append(mask)
+        return [bound for bound, _ in bounds], numbers, masks
+
+    def first(self, sorted_bounds, count):
+        """Mask of the first 'count' subscriptions in the order of a bound"""
+        _, numbers, masks = sorted_bounds
+        chunk = count // self.CHUNK
+        mask = masks[chunk]
+        for number in numbers[chunk * self.CHUNK:count]:
+            mask |= 1 << number
+        return mask
+
+    def candidates(self, expose):
+        """Returns the subscriptions whose numeric bounds all admit the expose,
+           in ascending order"""
+        numbers = ExposeHelper.get_numbers(expose)
+        admitted = self.everyone
+        for field in self.FIELDS:
+            value = getattr(numbers, field)
+            if value is None:
+                continue
+            lows, highs = self.lows[field], self.highs[field]
+            admitted &= self.first(lows, bisect_right(lows[0], value))
+            admitted &= ~self.first(highs, bisect_left(highs[0], value))
+        return [number for number, bit in enumerate(reversed(bin(admitted)[2:])) if bit == '1']
+
+    def matches(self, expose):
+        """Returns the ids of all users whose filters match the expose"""
+        return [self.subscriptions[number][0] for number in sorted(self.candidates(expose))
+                if self.subscriptions[number][1].is_interesting_expose(expose)]
+
+    def deliveries(self, exposes):
+        """Returns a dict from user ids to the exposes they should receive, in the
+           order of the users and of the exposes"""
+        matched = {}
+        for expose in exposes:
+            for number in self.candidates(expose):
+                if self.subscriptions[number][1].is_interesting_expose(expose):
+                    matched.setdefault(number, []).append(expose)
+        return {self.subscriptions[number][0]: matched[number] for number in sorted(matched)}
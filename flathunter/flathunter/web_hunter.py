@@ -1,9 +1,12 @@
 """Flathunter implementation for website"""
+import json
 import logging
 
 from flathunter.hunter import Hunter
 from flathunter.filter import Filter
 from flathunter.processor import ProcessorChain
+from flathunter.sender_telegram import SenderTelegram
+from flathunter.subscriptions import SubscriptionIndex
 
 class WebHunter(Hunter):
     """Flathunter implementation for website. Designed to hunt all exposes from
@@ -11,6 +14,20 @@ class WebHunter(Hunter):
        with individual filters implemented in-app"""
 
     __log__ = logging.getLogger('flathunt')
+    # The index of the user filters, and the settings it was built from
+    subscriptions = None
+    subscription_settings = None
+
+    def get_subscriptions(self):
+        """Returns the index of the filters of all users. It is only rebuilt when
+           the settings of a user changed - possibly on another instance, so the
+           settings are compared rather than tracking changes made here"""
+        user_settings = self.id_watch.get_user_settings()
+        settings = json.dumps(user_settings, sort_keys=True, default=str)
+        if self.subscriptions is None or settings != self.subscription_settings:
+            self.subscriptions = SubscriptionIndex(user_settings)
+            self.subscription_settings = settings
+        return self.subscriptions
 
     def hunt_flats(self, max_pages=1):
         """Crawl all URLs, and send notifications to users of new flats"""
@@ -18,10 +35,15 @@ class WebHunter(Hunter):
                        .read_config(self.config) \
                        .filter_already_seen(self.id_watch) \
                        .build()
+        description_filter = Filter.builder() \
+                                   .read_description_config(self.config) \
+                                   .build()
 
         processor_chain = ProcessorChain.builder(self.config) \
                                         .apply_filter(filter_set) \
                                         .crawl_expose_details() \
+                                        .enrich_descriptions() \
+                                        .apply_filter(description_filter) \
                                         .save_all_exposes(self.id_watch) \
                                         .resolve_addresses() \
                                         .calculate_durations() \
@@ -31,17 +53,28 @@ class WebHunter(Hunter):
         new_exposes = []
         for expose in processor_chain.process(self.crawl_for_exposes(max_pages=max_pages)):
             new_exposes.append(expose)
-
-        for (user_id, settings) in self.id_watch.get_user_settings():
-            if 'mute_notifications' in settings:
-                continue
-            filter_set = Filter.builder().read_config(settings).build()
-            processor_chain = ProcessorChain.builder(self.config) \
-                                            .apply_filter(filter_set) \
-                                            .send_messages([user_id]) \
-                                            .build()
-            for message in processor_chain.process(new_exposes):
-                self.__log__.debug("Sent expose %d to user %d", message['id'], user_id)
+        self.id_watch.flush()
+
+        # Users are identified by their Telegram chat id, so one Telegram sender
+        # serves all of them; the other notifiers get a chain per user
+        notifiers = self.config.get('notifiers', [])
+        other_notifiers = [notifier for notifier in notifiers if notifier != 'telegram']
+        sender = SenderTelegram(self.config, receivers=[]) if 'telegram' in notifiers else None
+        for (user_id, exposes) in self.get_subscriptions().deliveries(new_exposes).items():
+            if sender is not None:
+                for expose in exposes:
+                    sender.deliver(user_id, expose)
+            if other_notifiers:
+                processor_chain = ProcessorChain.builder(self.config) \
+                                                .send_messages([user_id], other_notifiers) \
+                                                .build()
+                exposes = list(processor_chain.process(exposes))
+            for expose in exposes:
+                self.__log__.debug("Sent expose %d to user %d", expose['id'], user_id)
+        if sender is not None:
+            # the instance may be frozen once the request returns, so the calls
+            # must not wait in the buffer of the publishing thread
+            sender.publisher.flush()
 
         self.id_watch.update_last_run_time()
         return list(new_exposes)
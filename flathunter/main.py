@@ -1,5 +1,7 @@
 """ Startup file for Google Cloud deployment or local webserver"""
-from flathunter.idmaintainer import IdMaintainer
+import atexit
+
+from flathunter.idmaintainer import IdMaintainer, ProcessedIdCache
 from flathunter.googlecloud_idmaintainer import GoogleCloudIdMaintainer
 from flathunter.web_hunter import WebHunter
 from flathunter.config import Config
@@ -10,12 +12,21 @@ config = Config()
 
 if __name__ == '__main__':
     # Use the SQLite DB file if we are running locally
-    id_watch = IdMaintainer(f'{config.database_location()}/processed_ids.db')
+    id_watch = IdMaintainer(f'{config.database_location()}/processed_ids.db',
+                            batch_size=config.database_batch_size(),
+                            flush_interval=config.database_flush_interval())
+    if config.cache_processed_ids():
+        id_watch = ProcessedIdCache(id_watch)
 else:
-    # Use Google Cloud DB if we run on the cloud
+    # Use Google Cloud DB if we run on the cloud. Reading every processed id from
+    # Firestore on each cold start is slow and costly, so the cache is only warmed
+    # by the ids looked up per batch
     id_watch = GoogleCloudIdMaintainer()
+    if config.cache_processed_ids():
+        id_watch = ProcessedIdCache(id_watch, warm=False)
 
 hunter = WebHunter(config, id_watch)
+atexit.register(hunter.close)
 
 app.config["HUNTER"] = hunter
 if 'website' in config:
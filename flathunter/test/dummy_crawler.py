@@ -39,4 +39,15 @@ class DummyCrawler(Crawler):
 
     @staticmethod
     def load_address(url):
-        return "1600 Pennsylvania Ave"
\ No newline at end of file
+        return "1600 Pennsylvania Ave"
+
+class NamedCrawler:
+    """Stand-in for a crawler where only its name matters"""
+
+    driver_pool = None
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
@@ -0,0 +1,170 @@
+import os
+import threading
+from types import SimpleNamespace
+import pytest
+import requests_mock
+from selenium.common.exceptions import WebDriverException
+
+from flathunter.abstract_crawler import Crawler, SessionPool, DriverPool, ExposeCollection
+from flathunter.config import Config
+from flathunter.fetch_strategies import ProxyFetchStrategy
+from flathunter.proxies import ProxyPool
+
+DUMMY_CONFIG = """
+urls:
+  - https://www.example.com/search/flats-in-berlin
+
+http:
+  pool_size: 2
+  timeout: 5
+"""
+
+class ExampleCrawler(Crawler):
+
+    def extract_data(self, soup):
+        return [ { 'id': int(el['data-id']) } for el in soup.find_all('div') ]
+
+def test_expose_collection_drops_duplicates_in_order():
+    entries = ExposeCollection([ { 'id': 3 }, { 'id': 1 } ])
+    assert entries.add({ 'id': 2 })
+    assert not entries.add({ 'id': 3, 'title': 'again' })
+    entries.extend([ { 'id': 1 }, { 'id': 4 } ])
+    assert entries.to_list() == [ { 'id': 3 }, { 'id': 1 }, { 'id': 2 }, { 'id': 4 } ]
+    assert 4 in entries
+    assert len(entries) == 4
+
+def test_session_is_shared_per_portal():
+    pool = SessionPool()
+    assert pool.get_session("A") is pool.get_session("A")
+    assert pool.get_session("A") is not pool.get_session("B")
+    pool.close()
+    assert pool.sessions == {}
+
+@requests_mock.Mocker(kw='m')
+def test_get_soup_uses_pooled_session(**kwargs):
+    m = kwargs['m']
+    m.get('https://www.example.com/search/flats-in-berlin', text='<div data-id="1"></div>')
+    crawler = ExampleCrawler(Config(string=DUMMY_CONFIG))
+    session = crawler.get_session()
+    assert crawler.get_session() is session
+    entries = crawler.get_results('https://www.example.com/search/flats-in-berlin')
+    assert entries == [ { 'id': 1 } ]
+    assert m.call_count == 1
+    assert m.last_request.timeout == 5
+
+@requests_mock.Mocker(kw='m')
+def test_page_is_fetched_once_with_proxy(mocker, **kwargs):
+    m = kwargs['m']
+    m.get('https://www.example.com/search/flats-in-berlin', text='<div data-id="2"></div>')
+    mocker.patch.object(ProxyFetchStrategy, 'pool', ProxyPool(race=1, source=lambda: { '127.0.0.1:3128' }))
+    config = Config(string=DUMMY_CONFIG + "\nuse_proxy_list: True\n")
+    crawler = ExampleCrawler(config)
+    assert crawler.get_fetch_strategy().NAME == 'proxy'
+    assert crawler.get_results('https://www.example.com/search/flats-in-berlin') == [ { 'id': 2 } ]
+    assert m.call_count == 1
+    assert m.last_request.proxies['https'] == '127.0.0.1:3128'
+    metrics = crawler.get_fetch_metrics()
+    assert [ (metric.name, metric.fetches) for metric in metrics ] == [ ('proxy', 1) ]
+    assert metrics[0].bytes == len('<div data-id="2"></div>')
+    assert metrics[0].take().fetches == 1
+    assert metrics[0].fetches == 0
+
+class FakeDriver:
+
+    def __init__(self, pid=None):
+        self.service = SimpleNamespace(process=SimpleNamespace(pid=pid))
+        self.crashed = False
+        self.quit_called = False
+        self.cookies = []
+        self.visited = []
+
+    def execute_script(self, script):
+        if self.crashed:
+            raise WebDriverException("chrome not reachable")
+        if script == 'return 1;':
+            return 1
+        return None
+
+    def get(self, url):
+        self.visited.append(url)
+
+    def add_cookie(self, cookie):
+        self.cookies.append(cookie)
+
+    def get_cookies(self):
+        return self.cookies
+
+    def quit(self):
+        self.quit_called = True
+
+def test_driver_pool_reuses_warm_drivers():
+    pool = DriverPool(FakeDriver, size=2)
+    with pool.driver() as pooled:
+        first = pooled.driver
+    with pool.driver() as pooled:
+        assert pooled.driver is first
+        assert pooled.pages == 2
+
+def test_driver_pool_recycles_and_keeps_cookies():
+    pool = DriverPool(FakeDriver, max_pages=2, home_url='https://www.example.com/')
+    with pool.driver() as pooled:
+        first = pooled.driver
+        first.cookies = [ { 'name': 'session', 'value': 'solved' } ]
+    with pool.driver() as pooled:
+        assert pooled.driver is first
+    assert first.quit_called
+    with pool.driver() as pooled:
+        assert pooled.driver is not first
+        assert pooled.driver.visited == [ 'https://www.example.com/' ]
+        assert pooled.driver.cookies == first.cookies
+
+def test_driver_pool_recycles_on_memory_threshold(monkeypatch):
+    monkeypatch.setattr(DriverPool, 'process_memory',
+                        staticmethod(lambda pid: 600 * 1024 * 1024 if pid == 42 else 0))
+    pool = DriverPool(lambda: FakeDriver(pid=42), max_memory_mb=500)
+    with pool.driver() as pooled:
+        driver = pooled.driver
+    assert driver.quit_called
+    assert pool.idle == []
+    pool = DriverPool(lambda: FakeDriver(pid=43), max_memory_mb=500)
+    with pool.driver() as pooled:
+        driver = pooled.driver
+    assert not driver.quit_called
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason="memory is read from /proc")
+def test_process_memory_includes_children():
+    assert DriverPool.process_memory(os.getppid()) > DriverPool.process_memory(os.getpid()) > 0
+
+def test_driver_pool_replaces_crashed_driver():
+    pool = DriverPool(FakeDriver)
+    with pool.driver() as pooled:
+        crashed = pooled.driver
+    crashed.crashed = True
+    with pool.driver() as pooled:
+        assert pooled.driver is not crashed
+    assert crashed.quit_called
+
+def test_driver_pool_blocks_when_exhausted():
+    pool = DriverPool(FakeDriver, size=1)
+    pooled = pool.checkout()
+    checked_out = []
+    thread = threading.Thread(target=lambda: checked_out.append(pool.checkout()))
+    thread.start()
+    thread.join(0.1)
+    assert checked_out == []
+    pool.checkin(pooled)
+    thread.join(1)
+    assert checked_out[0].driver is pooled.driver
+
+def test_blocked_urls_can_be_configured():
+    crawler = ExampleCrawler(Config(string=DUMMY_CONFIG + """
+block_resources:
+  urls:
+    - "*.mp3"
+"""))
+    blocked = crawler.get_blocked_urls()
+    assert "https://api.geetest.com/get.*" in blocked
+    assert "*.jpg" in blocked
+    assert blocked[-1] == "*.mp3"
+    crawler = ExampleCrawler(Config(string=DUMMY_CONFIG + "\nblock_resources:\n  enabled: false\n"))
+    assert crawler.get_blocked_urls() == [ "https://api.geetest.com/get.*" ]
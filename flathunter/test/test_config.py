@@ -85,3 +85,11 @@ filters:
        config = Config(string=self.FILTERS_CONFIG)
        self.assertIsNotNone(config)
        self.assertEqual(config.database_location(), os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/.."))
+
+    def test_only_creates_searchers_for_configured_portals(self):
+       config = Config(string=self.DUMMY_CONFIG)
+       searchers = config.searchers()
+       self.assertEqual([searcher.get_name() for searcher in searchers], ["CrawlImmowelt"])
+       self.assertIs(config.searcher_for_url("https://www.immowelt.de/expose/abc"), searchers[0])
+       self.assertIsNone(config.searcher_for_url("https://www.immobilienscout24.de/expose/1"))
+       self.assertEqual(config.crawl_targets(), [(searchers[0], config.get('urls')[0])])
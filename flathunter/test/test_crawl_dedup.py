@@ -0,0 +1,39 @@
+from flathunter.crawl_dedup import CrawlDeduplicator
+from flathunter.config import Config
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from dummy_crawler import DummyCrawler, NamedCrawler
+
+OVERLAPPING_CONFIG = """
+urls:
+  - https://www.example.com/search/flats-in-berlin
+  - https://www.example.com/search/flats-in-berlin-mitte
+"""
+
+def exposes(*ids):
+    return [{ 'id': expose_id } for expose_id in ids]
+
+def test_exposes_are_deduplicated_per_crawler():
+    first, second = NamedCrawler("A"), NamedCrawler("B")
+    dedup = CrawlDeduplicator()
+    results = [(first, "a1", exposes(1, 2, 3)),
+               (first, "a2", exposes(2, 3, 4)),
+               (second, "b1", exposes(1, 2))]
+    assert [expose['id'] for expose in dedup.deduplicate(results)] == [1, 2, 3, 4, 1, 2]
+    assert dedup.duplicates == 2
+
+def test_overlap_is_reported_per_url_pair():
+    crawler = NamedCrawler("A")
+    dedup = CrawlDeduplicator()
+    results = [(crawler, "a1", exposes(1, 2, 3, 4)),
+               (crawler, "a2", exposes(3, 4)),
+               (crawler, "a3", exposes(5))]
+    list(dedup.deduplicate(results))
+    assert dedup.overlaps() == [("a1", "a2", 2, 1.0)]
+
+def test_overlapping_urls_are_processed_once():
+    config = Config(string=OVERLAPPING_CONFIG)
+    config.set_searchers([DummyCrawler()])
+    found = list(Hunter(config, IdMaintainer(":memory:")).crawl_for_exposes())
+    ids = [expose['id'] for expose in found]
+    assert len(ids) == len(set(ids))
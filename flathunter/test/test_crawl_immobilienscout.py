@@ -1,9 +1,16 @@
 import pytest
 import json
 import os
+import re
+import requests_mock
 
-from flathunter.crawl_immobilienscout import CrawlImmobilienscout
+from flathunter.crawl_immobilienscout import CrawlImmobilienscout, REAL_ESTATE_PATH, GALLERY_IMAGE_PATH
+from flathunter.abstract_crawler import DriverPool
 from flathunter.config import Config
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.parse_pool import ParsePool
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import NoSuchWindowException, WebDriverException
 
 DUMMY_CONFIG = """
 urls:
@@ -22,6 +29,58 @@ def test_parse_exposes_from_json(crawler):
         data = json.load(fixture)
     entries = crawler.get_entries_from_json(data)
     assert len(entries) > 0
+    assert entries[0]['images'][0].startswith("https://pictures.immobilienscout24.de/listings/")
+
+@pytest.mark.parametrize("path", [ ("..", "result.json"), ("fixtures", "immo-scout-IS24-object.json") ])
+def test_json_fast_path_matches_jsonpath(path):
+    with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), *path)) as fixture:
+        data = json.load(fixture)
+    real_estates = CrawlImmobilienscout.find_real_estates(data)
+    assert len(real_estates) > 0
+    assert real_estates == [ match.value for match in REAL_ESTATE_PATH.find(data) ]
+    for entry in real_estates:
+        assert CrawlImmobilienscout.find_gallery_image(entry) == next((match.value for match in GALLERY_IMAGE_PATH.find(entry)), None)
+
+def test_unknown_json_structure_falls_back_to_jsonpath(crawler):
+    data = { 'other': [ { 'resultlist.realEstate': { '@id': '42', 'title': 'Flat', 'address': { 'description': { 'text': 'Berlin' } },
+                                                     'price': { 'value': 800 }, 'livingSpace': 60, 'numberOfRooms': 2 } } ] }
+    entries = crawler.get_entries_from_json(data)
+    assert [ entry['id'] for entry in entries ] == [ 42 ]
+    assert entries[0]['image'].endswith("placeholder_medium.png")
+
+def read_result_list_fixture():
+    with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", "immo-scout-resultlist.html"), "rb") as fixture:
+        return fixture.read()
+
+def test_parse_exposes_from_result_list(crawler):
+    content = read_result_list_fixture()
+    assert crawler.get_result_count(content) == 1234
+    entries = crawler.extract_data(crawler.parse(content, crawler.RESULT_STRAINER))
+    assert len(entries) == 20
+    assert entries[0]['url'] == "https://www.immobilienscout24.de/expose/%d" % entries[0]['id']
+    assert entries[0]['image'].startswith("https://pictures.immobilienscout24.de/")
+    for attr in [ 'title', 'price', 'size', 'rooms', 'address' ]:
+        assert entries[0][attr]
+
+def test_scoped_parsing_finds_same_exposes(crawler):
+    content = read_result_list_fixture()
+    scoped = crawler.extract_data(crawler.parse(content, crawler.RESULT_STRAINER))
+    full = crawler.extract_data(BeautifulSoup(content, 'html.parser'))
+    assert scoped == full
+
+def test_result_pages_are_parsed_in_worker_processes(crawler):
+    content = read_result_list_fixture()
+    pool = ParsePool(workers=2, min_page_size=1024)
+    try:
+        assert pool.extract(crawler, content) == crawler.extract_data(crawler.parse(content, crawler.RESULT_STRAINER))
+        assert pool.executor is not None
+    finally:
+        pool.close()
+
+def test_small_pages_are_parsed_in_process(crawler):
+    pool = ParsePool(workers=2, min_page_size=len(read_result_list_fixture()) + 1)
+    assert len(pool.extract(crawler, read_result_list_fixture())) == 20
+    assert pool.executor is None
 
 def test_crawl_works(crawler):
     soup = crawler.get_page(TEST_URL, page_no=1)
@@ -44,3 +103,135 @@ def test_process_expose_fetches_details(crawler):
     for expose in updated_entries:
         for attr in [ 'title', 'price', 'size', 'rooms', 'address', 'from' ]:
             assert expose[attr] is not None
+
+PAGED_URL = 'https://www.immobilienscout24.de/Suche/de/berlin/berlin/wohnung-mieten?sorting=2&pagenumber={0}'
+
+def result_page(result_count, expose_ids):
+    entries = "".join(f"""
+<li>
+  <a class="result-list-entry__brand-title-container" href="/expose/{expose_id}">Flat {expose_id}</a>
+  <div class="result-list-entry__address">Street {expose_id}</div>
+  <div class="result-list-entry__gallery-container"></div>
+  <dl data-is24-qa="attributes"><dd>1.000 €</dd><dd>50 m²</dd><dd>2 Zi.</dd></dl>
+</li>""" for expose_id in expose_ids)
+    return f"""<html><body>
+<span data-is24-qa="resultlist-resultCount">{result_count}</span>
+<ul id="resultListItems">{entries}</ul>
+</body></html>"""
+
+@requests_mock.Mocker(kw='m')
+def test_remaining_pages_are_fetched_in_order(crawler, **kwargs):
+    m = kwargs['m']
+    for page_no in range(1, 6):
+        ids = range(100000 * page_no, 100000 * page_no + 20)
+        m.get(PAGED_URL.format(page_no), text=result_page(95, ids))
+    entries = crawler.get_results(PAGED_URL.format(1))
+    assert [entry['id'] for entry in entries] == \
+        [100000 * page_no + idx for page_no in range(1, 4) for idx in range(20)]
+    assert sorted(int(re.search(r'pagenumber=(\d)', request.url)[1])
+                  for request in m.request_history) == [1, 2, 3]
+
+@requests_mock.Mocker(kw='m')
+def test_pagination_honours_max_pages(crawler, **kwargs):
+    m = kwargs['m']
+    for page_no in range(1, 4):
+        m.get(PAGED_URL.format(page_no), text=result_page(60, range(page_no * 100000, page_no * 100000 + 20)))
+    entries = crawler.get_results(PAGED_URL.format(1), max_pages=2)
+    assert len(entries) == 40
+    assert m.call_count == 2
+
+@requests_mock.Mocker(kw='m')
+def test_exposes_on_several_pages_are_kept_once(crawler, **kwargs):
+    m = kwargs['m']
+    # two new listings push the last two of page 1 onto page 2 during the crawl,
+    # and page 3 shows one listing twice
+    m.get(PAGED_URL.format(1), text=result_page(60, range(100000, 100020)))
+    m.get(PAGED_URL.format(2), text=result_page(60, range(100018, 100038)))
+    m.get(PAGED_URL.format(3), text=result_page(60, [ 100038 ] + list(range(100038, 100057))))
+    ids = [ entry['id'] for entry in crawler.get_results(PAGED_URL.format(1)) ]
+    assert ids == list(range(100000, 100057))
+
+@requests_mock.Mocker(kw='m')
+def test_incremental_crawl_stops_at_known_page(**kwargs):
+    m = kwargs['m']
+    for page_no in range(1, 4):
+        m.get(PAGED_URL.format(page_no), text=result_page(60, range(page_no * 100000, page_no * 100000 + 20)))
+    crawler = CrawlImmobilienscout(Config(string=DUMMY_CONFIG + "\nhttp:\n  per_host: 1\n"))
+    crawler.id_watch = IdMaintainer(":memory:")
+    crawler.id_watch.mark_processed_many(range(200000, 200020))
+    entries = crawler.get_results(PAGED_URL.format(1))
+    assert len(entries) == 40
+    assert m.call_count == 2
+    crawler.id_watch.mark_processed_many(range(100000, 100020))
+    assert len(crawler.get_results(PAGED_URL.format(1))) == 20
+    assert m.call_count == 3
+
+class FakeSwitchTo:
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        if handle in self.driver.broken_handles or handle not in self.driver.window_handles:
+            raise NoSuchWindowException("no such window: " + handle)
+        self.driver.current_window_handle = handle
+
+class FakeDriver:
+
+    def __init__(self):
+        self.window_handles = [ "main" ]
+        self.current_window_handle = "main"
+        self.urls = { "main": None }
+        self.switch_to = FakeSwitchTo(self)
+        self.broken_handles = set()
+        self.max_tabs = None
+
+    def execute_script(self, script, *args):
+        if script.startswith("window.open"):
+            if self.max_tabs is not None and len(self.window_handles) > self.max_tabs:
+                raise WebDriverException("unable to open window")
+            handle = "tab%d" % len(self.urls)
+            self.window_handles.append(handle)
+            self.urls[handle] = args[0]
+            return None
+        if script == 'return document.readyState':
+            return 'complete'
+        if script == 'return 1;':
+            return 1
+        return [ "Nice flat at", self.urls[self.current_window_handle] ]
+
+    def close(self):
+        self.window_handles.remove(self.current_window_handle)
+
+    def get_cookies(self):
+        return []
+
+def test_descriptions_are_loaded_in_tabs(crawler):
+    driver = FakeDriver()
+    crawler.driver_pool = DriverPool(lambda: driver)
+    exposes = [ { 'url': "https://www.immobilienscout24.de/expose/%d" % expose_id } for expose_id in range(3) ]
+    crawler.load_descriptions(exposes, 5)
+    assert [ expose['description'] for expose in exposes ] == \
+        [ "Nice flat at\nhttps://www.immobilienscout24.de/expose/%d" % expose_id for expose_id in range(3) ]
+    assert driver.window_handles == [ "main" ]
+    assert driver.current_window_handle == "main"
+
+def test_tab_that_cannot_be_switched_to_is_skipped(crawler):
+    driver = FakeDriver()
+    driver.broken_handles = { "tab2" }
+    crawler.driver_pool = DriverPool(lambda: driver)
+    exposes = [ { 'url': "https://www.immobilienscout24.de/expose/%d" % expose_id } for expose_id in range(3) ]
+    crawler.load_descriptions(exposes, 5)
+    assert [ expose['description'] is not None for expose in exposes ] == [ True, False, True ]
+    assert "main" in driver.window_handles
+    assert driver.current_window_handle == "main"
+
+def test_tabs_are_closed_when_opening_fails(crawler):
+    driver = FakeDriver()
+    driver.max_tabs = 2
+    crawler.driver_pool = DriverPool(lambda: driver)
+    exposes = [ { 'url': "https://www.immobilienscout24.de/expose/%d" % expose_id } for expose_id in range(3) ]
+    with pytest.raises(WebDriverException):
+        crawler.load_descriptions(exposes, 5)
+    assert driver.window_handles == [ "main" ]
+    assert driver.current_window_handle == "main"
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from flathunter.abstract_crawler import DriverPool
+from flathunter.crawl_scheduler import CrawlScheduler
+from flathunter.config import Config
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from dummy_crawler import DummyCrawler, NamedCrawler
+from test_util import count
+
+PARALLEL_CONFIG = """
+urls:
+  - https://www.example.com/search/flats-in-berlin
+  - https://www.example.com/search/flats-in-hamburg
+
+crawl:
+  workers: 4
+  per_portal: 2
+"""
+
+def test_sequential_scheduler_keeps_order():
+    crawler = NamedCrawler("A")
+    scheduler = CrawlScheduler(lambda searcher, url, max_pages: [url])
+    results = list(scheduler.run([(crawler, "1"), (crawler, "2"), (crawler, "3")]))
+    assert [exposes for _, _, exposes in results] == [["1"], ["2"], ["3"]]
+
+def test_parallel_scheduler_respects_portal_limit():
+    lock = threading.Lock()
+    active = {}
+    peak = {}
+    def crawl(searcher, url, max_pages):
+        with lock:
+            active[searcher.get_name()] = active.get(searcher.get_name(), 0) + 1
+            peak[searcher.get_name()] = max(peak.get(searcher.get_name(), 0),
+                                            active[searcher.get_name()])
+        time.sleep(0.02)
+        with lock:
+            active[searcher.get_name()] -= 1
+        return [url]
+    slow, fast = NamedCrawler("slow"), NamedCrawler("fast")
+    jobs = [(slow, "s%d" % i) for i in range(4)] + [(fast, "f%d" % i) for i in range(4)]
+    scheduler = CrawlScheduler(crawl, workers=4, per_portal=1)
+    results = list(scheduler.run(jobs))
+    assert sorted(url for _, url, _ in results) == sorted(url for _, url in jobs)
+    assert peak == { "slow": 1, "fast": 1 }
+
+def test_browser_crawler_runs_no_more_crawls_than_it_has_browsers():
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+    def crawl(searcher, url, max_pages):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return [url]
+    browser = NamedCrawler("browser")
+    browser.driver_pool = DriverPool(lambda: None, size=2)
+    scheduler = CrawlScheduler(crawl, workers=4, per_portal=3)
+    results = list(scheduler.run([(browser, "b%d" % i) for i in range(6)]))
+    assert len(results) == 6
+    assert peak[0] == 2
+
+def test_failed_job_does_not_stop_the_others():
+    def crawl(searcher, url, max_pages):
+        if url == "2":
+            raise ValueError("unexpected page layout")
+        return [url]
+    crawler = NamedCrawler("A")
+    jobs = [(crawler, "1"), (crawler, "2"), (crawler, "3")]
+    for workers in [1, 2]:
+        scheduler = CrawlScheduler(crawl, workers=workers, per_portal=2)
+        results = sorted((url, exposes) for _, url, exposes in scheduler.run(jobs))
+        assert results == [("1", ["1"]), ("2", []), ("3", ["3"])]
+
+def test_parallel_hunt_finds_exposes():
+    config = Config(string=PARALLEL_CONFIG)
+    config.set_searchers([DummyCrawler()])
+    hunter = Hunter(config, IdMaintainer(":memory:"))
+    exposes = hunter.hunt_flats()
+    assert count(exposes) > 4
@@ -1,4 +1,5 @@
 import unittest
+import requests_mock
 from functools import reduce
 from flathunter.crawl_wggesucht import CrawlWgGesucht
 from flathunter.config import Config
@@ -27,3 +28,13 @@ class WgGesuchtCrawlerTest(unittest.TestCase):
             found = reduce(lambda i, e: attr in e or i, entries, False)
             self.assertTrue(found, "Expected " + attr + " to sometimes be set")
 
+    def test_filters_are_set_again_for_another_url(self):
+        first = 'https://www.wg-gesucht.de/wohnungen-in-Berlin.8.2.1.0.html'
+        second = 'https://www.wg-gesucht.de/wohnungen-in-Munchen.90.2.1.0.html'
+        with requests_mock.Mocker() as mock:
+            mock.get(first, text='<html></html>')
+            mock.get(second, text='<html></html>')
+            for url in [ first, first, second, first ]:
+                self.crawler.get_content_from_url(url)
+            self.assertEqual([ r.url for r in mock.request_history ],
+                             [ first, first, first, second, second, first, first ])
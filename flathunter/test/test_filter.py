@@ -0,0 +1,95 @@
+import re
+
+from flathunter.filter import Filter, ExposeHelper, TitleFilter, compile_exclusions, parse_numbers
+from flathunter.idmaintainer import IdMaintainer
+
+FILTER_CONFIG = {
+    'filters': {
+        'min_price': 500,
+        'max_price': 1200,
+        'min_size': 50,
+        'max_rooms': 3,
+        'max_price_per_square': 20,
+        'excluded_titles': [ 'wg', 'tausch' ]
+    }
+}
+
+def expose(expose_id, price, size, rooms, title="Schöne Wohnung"):
+    return { 'id': expose_id, 'price': price, 'size': size, 'rooms': rooms, 'title': title }
+
+def test_numbers_are_parsed_once():
+    parse_numbers.cache_clear()
+    flat = expose(1, "1.100 €", "60,5 m²", "2,5")
+    numbers = ExposeHelper.get_numbers(flat)
+    assert (numbers.price, numbers.size, numbers.rooms) == (1100.0, 60.5, 2.5)
+    assert numbers.pps == 1100 / 60.5
+    ExposeHelper.get_price(flat)
+    ExposeHelper.get_rooms(flat)
+    assert parse_numbers.cache_info().misses == 1
+
+def test_compiled_filter_applies_all_bounds():
+    filter_set = Filter.builder().read_config(FILTER_CONFIG).build()
+    exposes = [ expose(1, "900 €", "60 m²", "2"),
+                expose(2, "1.300 €", "80 m²", "3"),
+                expose(3, "400 €", "55 m²", "2"),
+                expose(4, "900 €", "40 m²", "1"),
+                expose(5, "900 €", "60 m²", "4"),
+                expose(6, "1.100 €", "50 m²", "2"),
+                expose(7, "900 €", "60 m²", "2", title="WG-Zimmer"),
+                expose(8, "auf Anfrage", "60 m²", "2") ]
+    assert [ e['id'] for e in filter_set.filter(exposes) ] == [ 1, 8 ]
+
+def test_filter_stops_at_first_rejection():
+    called = []
+    filter_set = Filter.builder() \
+                       .read_config({ 'filters': { 'max_price': 1000 } }) \
+                       .predicate_filter(lambda e: called.append(e['id']) or True) \
+                       .build()
+    assert not filter_set.is_interesting_expose(expose(1, "1.500 €", "60 m²", "2"))
+    assert filter_set.is_interesting_expose(expose(2, "900 €", "60 m²", "2"))
+    assert called == [ 2 ]
+
+def test_selective_checks_move_to_the_front():
+    filter_set = Filter.builder() \
+                       .read_config({ 'filters': { 'max_price': 1000 } }) \
+                       .predicate_filter(lambda e: e['id'] > 1000) \
+                       .build()
+    list(filter_set.filter([ expose(i, "900 €", "60 m²", "2") for i in range(Filter.REORDER_INTERVAL) ]))
+    assert filter_set.checks[0].cost == 4
+    assert filter_set.checks[0].rejected == Filter.REORDER_INTERVAL
+
+def test_rejected_exposes_are_still_marked_as_seen():
+    id_watch = IdMaintainer(":memory:")
+    filter_set = Filter.builder() \
+                       .read_config({ 'filters': { 'max_price': 1000 } }) \
+                       .filter_already_seen(id_watch) \
+                       .build()
+    exposes = [ expose(1, "1.500 €", "60 m²", "2"), expose(2, "900 €", "60 m²", "2") ]
+    assert [ e['id'] for e in filter_set.filter(exposes) ] == [ 2 ]
+    assert not filter_set.is_interesting_expose(expose(3, "1.500 €", "60 m²", "2"))
+    assert id_watch.filter_unprocessed([ 1, 2, 3 ]) == []
+
+def test_exclusions_are_compiled_once():
+    title_filter = TitleFilter([ 'wg', 'wg-zimmer', 'Tausch', r'zwischen\s*miete', 42 ])
+    assert title_filter.pattern.flags & re.IGNORECASE
+    assert not title_filter.is_interesting({ 'title': 'Zimmer in netter WG' })
+    assert not title_filter.is_interesting({ 'title': 'Wohnungstausch gesucht' })
+    assert not title_filter.is_interesting({ 'title': 'Zwischen Miete ab Mai' })
+    assert not title_filter.is_interesting({ 'title': 'Nr. 42' })
+    assert title_filter.is_interesting({ 'title': 'Schöne Altbauwohnung' })
+    assert TitleFilter([]).is_interesting({ 'title': 'WG' })
+
+def test_combined_pattern_matches_like_the_single_patterns():
+    patterns = [ 'wg', 'wohngemeinschaft', 'wohnung', 'tausch', 'untermiete', r'\bzimmer\b', 'möbliert' ]
+    pattern = compile_exclusions(patterns)
+    for title in [ 'WG-Zimmer', 'Wohnungstausch', 'Untermiete', 'Zimmerei', 'Zimmer frei', 'Haus', 'Möbliertes Apartment' ]:
+        assert bool(pattern.search(title)) == any(re.search(p, title, re.IGNORECASE) for p in patterns)
+
+def test_descriptions_are_filtered_after_loading():
+    config = { 'filters': { 'excluded_titles': [ 'wg' ], 'excluded_descriptions': [ 'tausch' ] } }
+    assert len(Filter.builder().read_config(config).build().filters) == 1
+    description_filter = Filter.builder().read_description_config(config).build()
+    exposes = [ { 'id': 1, 'title': 'Wohnung', 'description': 'Nur im Tausch' },
+                { 'id': 2, 'title': 'Wohnung', 'description': 'Frisch saniert' },
+                { 'id': 3, 'title': 'Wohnung', 'description': None } ]
+    assert [ e['id'] for e in description_filter.filter(exposes) ] == [ 2, 3 ]
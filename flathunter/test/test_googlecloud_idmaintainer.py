@@ -11,10 +11,27 @@ from flathunter.filter import Filter
 from dummy_crawler import DummyCrawler
 from test_util import count
 
+class MockWriteBatch:
+
+    def __init__(self):
+        self.writes = []
+
+    def set(self, reference, data):
+        self.writes.append((reference, data))
+
+    def commit(self):
+        for reference, data in self.writes:
+            reference.set(data)
+
+class MockFirestoreWithBatches(MockFirestore):
+
+    def batch(self):
+        return MockWriteBatch()
+
 class MockGoogleCloudIdMaintainer(GoogleCloudIdMaintainer):
 
     def __init__(self):
-        self.database = MockFirestore()
+        self.database = MockFirestoreWithBatches()
 
 CONFIG_WITH_FILTERS = """
 urls:
@@ -32,6 +49,10 @@ def test_read_after_write(id_watch):
     id_watch.mark_processed(12345)
     assert id_watch.is_processed(12345)
 
+def test_filter_unprocessed(id_watch):
+    id_watch.mark_processed_many([1, 2])
+    assert id_watch.filter_unprocessed([3, 2, 1, 4]) == [3, 4]
+
 def test_get_last_run_time_none_by_default(id_watch):
     assert id_watch.get_last_run_time() == None
 
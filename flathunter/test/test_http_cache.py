@@ -0,0 +1,96 @@
+import os
+import pytest
+import requests_mock
+
+from flathunter.abstract_crawler import Crawler, UNCHANGED_PAGE
+from flathunter.config import Config
+from flathunter.crawl_immobilienscout import CrawlImmobilienscout
+from flathunter.http_cache import HttpCache
+from flathunter.idmaintainer import IdMaintainer
+
+URL = 'https://www.immobilienscout24.de/Suche/de/berlin/berlin/wohnung-mieten?sorting=2&pagenumber=1'
+
+CACHE_CONFIG = """
+urls:
+  - https://www.immobilienscout24.de/Suche/de/berlin/berlin/wohnung-mieten?sorting=2
+http_cache:
+  enabled: true
+  directory: {directory}
+  ttl: {ttl}
+"""
+
+def crawler_with_cache(directory, ttl=0):
+    return CrawlImmobilienscout(Config(string=CACHE_CONFIG.format(directory=directory, ttl=ttl)))
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(Crawler, 'http_cache', None)
+
+def read_result_list_fixture():
+    with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", "immo-scout-resultlist.html"), "rb") as fixture:
+        return fixture.read()
+
+def test_cached_page_is_revalidated(tmp_path):
+    crawler = crawler_with_cache(tmp_path)
+    with requests_mock.Mocker() as mock:
+        mock.get(URL, [ { 'content': b'<html>page</html>', 'headers': { 'ETag': '"v1"' } },
+                        { 'status_code': 304 } ])
+        assert crawler.get_content_from_url(URL) == b'<html>page</html>'
+        assert crawler.get_content_from_url(URL) == b'<html>page</html>'
+        assert mock.call_count == 2
+        assert mock.request_history[1].headers['If-None-Match'] == '"v1"'
+
+def test_fresh_page_is_served_from_cache(tmp_path):
+    crawler = crawler_with_cache(tmp_path, ttl=600)
+    with requests_mock.Mocker() as mock:
+        mock.get(URL, content=b'<html>page</html>', headers={ 'Last-Modified': 'Sat, 17 Oct 2026 10:00:00 GMT' })
+        crawler.get_content_from_url(URL)
+        assert crawler.get_content_from_url(URL) == b'<html>page</html>'
+        assert mock.call_count == 1
+
+def test_unchanged_result_page_is_not_extracted(tmp_path, monkeypatch):
+    crawler = crawler_with_cache(tmp_path)
+    crawler.id_watch = IdMaintainer(":memory:")
+    extracted = []
+    extract_data = crawler.extract_data
+    monkeypatch.setattr(crawler, 'extract_data', lambda soup: extracted.append(soup) or extract_data(soup))
+    with requests_mock.Mocker() as mock:
+        mock.get(URL, content=read_result_list_fixture())
+        assert len(crawler.crawl(URL, max_pages=1)) == 20
+        assert crawler.crawl(URL, max_pages=1) == []
+    assert len(extracted) == 1
+
+def test_unchanged_page_is_not_an_empty_page(tmp_path):
+    crawler = crawler_with_cache(tmp_path)
+    with requests_mock.Mocker() as mock:
+        mock.get(URL, content=read_result_list_fixture())
+        with crawler.remember_extracted_pages():
+            assert len(crawler.get_result_entries(URL)) == 20
+        assert crawler.get_result_entries(URL) is UNCHANGED_PAGE
+
+def test_pages_of_a_failed_crawl_are_extracted_again(tmp_path):
+    crawler = crawler_with_cache(tmp_path)
+    with requests_mock.Mocker() as mock:
+        mock.get(URL, content=read_result_list_fixture())
+        with pytest.raises(ValueError):
+            with crawler.remember_extracted_pages():
+                crawler.get_result_entries(URL)
+                raise ValueError("a later page failed")
+        assert len(crawler.get_result_entries(URL)) == 20
+
+def test_unchanged_check_remembers_extracted_content(tmp_path):
+    cache = HttpCache(str(tmp_path))
+    assert not cache.is_unchanged(URL, cache.digest(b'first'))
+    cache.mark_extracted({ URL: cache.digest(b'first') })
+    assert cache.is_unchanged(URL, cache.digest(b'first'))
+    assert not cache.is_unchanged(URL, cache.digest(b'second'))
+    assert cache.get('https://www.example.com/') is None
+
+def test_old_entries_are_evicted(tmp_path):
+    cache = HttpCache(str(tmp_path), max_age=60)
+    cache.put(URL, { 'fetched': 0 }, b'old')
+    cache.put('https://www.example.com/', { 'fetched': 0 }, b'new')
+    os.utime(cache.path(URL), (0, 0))
+    cache.evict()
+    assert cache.get(URL) is None
+    assert cache.get('https://www.example.com/') is not None
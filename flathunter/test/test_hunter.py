@@ -1,6 +1,7 @@
 import unittest
 import yaml
 import re
+from flathunter.abstract_crawler import Crawler
 from flathunter.crawl_immowelt import CrawlImmowelt
 from flathunter.hunter import Hunter 
 from flathunter.config import Config
@@ -212,3 +213,17 @@ excluded_titles:
             for expose in unfiltered:
                 print("Got unfiltered expose: ", expose)
         self.assertTrue(len(unfiltered) == 0, "Expected flats with too few rooms to be filtered")
+
+def test_close_stops_the_parse_pool(monkeypatch):
+    closed = []
+    class FakeParsePool:
+        def close(self):
+            closed.append(self)
+    monkeypatch.setattr(Crawler, 'parse_pool', FakeParsePool())
+    config = Config(string=HunterTest.DUMMY_CONFIG)
+    config.set_searchers([DummyCrawler()])
+    hunter = Hunter(config, IdMaintainer(":memory:"))
+    hunter.close()
+    hunter.close()
+    assert len(closed) == 1
+    assert Crawler.parse_pool is None
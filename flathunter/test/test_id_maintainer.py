@@ -1,8 +1,11 @@
 import unittest
 import datetime
 import re
+import sqlite3
+import tempfile
+import pytest
 
-from flathunter.idmaintainer import IdMaintainer
+from flathunter.idmaintainer import IdMaintainer, ProcessedIdCache
 from flathunter.config import Config
 from flathunter.hunter import Hunter
 from flathunter.web_hunter import WebHunter
@@ -42,6 +45,128 @@ filters:
         self.assertIsNotNone(time, "Expected time not to be none")
         self.assertEqual(time, self.maintainer.get_last_run_time(), "Expected last run time to be updated")
 
+def test_legacy_database_is_migrated():
+    with tempfile.NamedTemporaryFile(suffix='.db') as temp_db:
+        connection = sqlite3.connect(temp_db.name)
+        connection.execute('CREATE TABLE processed (ID INTEGER)')
+        connection.execute('CREATE TABLE exposes (id INTEGER, created TIMESTAMP, \
+                            crawler STRING, details BLOB, PRIMARY KEY (id, crawler))')
+        connection.executemany('INSERT INTO processed VALUES(?)',
+                               [(1,), (2,), (2,), (None,), ('abc',), ('3',), (4.5,)])
+        connection.commit()
+        connection.close()
+        id_watch = IdMaintainer(temp_db.name)
+        cur = id_watch.get_connection().cursor()
+        assert cur.execute('PRAGMA user_version').fetchone()[0] == len(IdMaintainer.MIGRATIONS)
+        assert cur.execute('SELECT id FROM processed ORDER BY id').fetchall() == [(1,), (2,), (3,)]
+        indexes = [row[1] for row in cur.execute("PRAGMA index_list('exposes')")]
+        assert 'exposes_created' in indexes
+        id_watch.mark_processed(2)
+        assert cur.execute('SELECT COUNT(*) FROM processed').fetchone()[0] == 3
+        assert id_watch.is_processed(1)
+
+def test_failed_migration_is_retried(monkeypatch):
+    migrate, failures = IdMaintainer.migrate, []
+    def fail_once(self, connection):
+        if not failures:
+            failures.append(connection)
+            raise sqlite3.OperationalError("database is locked")
+        migrate(self, connection)
+    monkeypatch.setattr(IdMaintainer, 'migrate', fail_once)
+    with tempfile.NamedTemporaryFile(suffix='.db') as temp_db:
+        id_watch = IdMaintainer(temp_db.name)
+        with pytest.raises(sqlite3.OperationalError):
+            id_watch.get_connection()
+        with pytest.raises(sqlite3.ProgrammingError):
+            failures[0].cursor()
+        cur = id_watch.get_connection().cursor()
+        assert cur.execute('PRAGMA user_version').fetchone()[0] == len(IdMaintainer.MIGRATIONS)
+
+def test_filter_unprocessed():
+    id_watch = IdMaintainer(":memory:", batch_size=2)
+    id_watch.mark_processed_many([1, 2, 3])
+    id_watch.mark_processed(4)
+    assert id_watch.filter_unprocessed([5, 4, 3, 2, 1, 6]) == [5, 6]
+
+def test_cache_is_warmed_with_processed_ids(mocker):
+    id_watch = IdMaintainer(":memory:")
+    id_watch.mark_processed_many([1, 2, 3])
+    cache = ProcessedIdCache(id_watch)
+    spy = mocker.spy(id_watch, "filter_unprocessed")
+    assert cache.filter_unprocessed(["1", 2, 3]) == []
+    assert spy.call_count == 0
+    assert cache.is_processed("3")
+    assert cache.hits == 4
+    assert cache.misses == 0
+
+def test_cache_looks_up_unknown_ids(mocker):
+    id_watch = IdMaintainer(":memory:")
+    cache = ProcessedIdCache(id_watch)
+    id_watch.mark_processed(5)
+    spy = mocker.spy(id_watch, "filter_unprocessed")
+    assert cache.filter_unprocessed([5, 6]) == [6]
+    assert spy.call_args[0][0] == [5, 6]
+    cache.mark_processed_many([6])
+    assert cache.filter_unprocessed([5, 6]) == []
+    assert spy.call_count == 1
+    assert id_watch.is_processed(6)
+
+def test_cold_cache_learns_ids_per_batch(mocker):
+    id_watch = IdMaintainer(":memory:")
+    id_watch.mark_processed(5)
+    spy = mocker.spy(id_watch, "get_processed_ids")
+    cache = ProcessedIdCache(id_watch, warm=False)
+    assert spy.call_count == 0
+    assert cache.filter_unprocessed([5, 6]) == [6]
+    assert cache.filter_unprocessed([5]) == []
+    assert cache.hits == 1
+
+def test_already_seen_filter_checks_chunks(mocker):
+    config = Config(string=IdMaintainerTest.DUMMY_CONFIG)
+    config.set_searchers([DummyCrawler()])
+    id_watch = IdMaintainer(":memory:")
+    spy = mocker.spy(id_watch, "filter_unprocessed")
+    exposes = list(Hunter(config, id_watch).crawl_for_exposes())
+    filter_set = Filter.builder().filter_already_seen(id_watch).build()
+    new_exposes = list(filter_set.filter(exposes))
+    assert spy.call_count == -(-len(exposes) // Filter.CHUNK_SIZE)
+    assert len(new_exposes) == len(set(expose['id'] for expose in exposes))
+    assert list(filter_set.filter(exposes)) == []
+
+def test_writes_are_batched_until_flush():
+    id_watch = IdMaintainer(":memory:", batch_size=100)
+    id_watch.mark_processed(12345)
+    id_watch.save_expose({ 'id': 12345, 'crawler': 'dummy', 'title': 'flat' })
+    cur = id_watch.get_connection().cursor()
+    cur.execute('SELECT COUNT(*) FROM processed')
+    assert cur.fetchone()[0] == 0
+    assert id_watch.is_processed(12345)
+    id_watch.flush()
+    cur.execute('SELECT COUNT(*) FROM processed')
+    assert cur.fetchone()[0] == 1
+    cur.execute('SELECT COUNT(*) FROM exposes')
+    assert cur.fetchone()[0] == 1
+
+def test_writes_are_flushed_when_batch_is_full():
+    id_watch = IdMaintainer(":memory:", batch_size=3)
+    for expose_id in range(3):
+        id_watch.mark_processed(expose_id)
+    assert id_watch.pending_ids == {}
+    cur = id_watch.get_connection().cursor()
+    cur.execute('SELECT COUNT(*) FROM processed')
+    assert cur.fetchone()[0] == 3
+
+def test_batched_hunt_saves_everything():
+    config = Config(string=IdMaintainerTest.DUMMY_CONFIG)
+    config.set_searchers([DummyCrawler()])
+    id_watch = IdMaintainer(":memory:", batch_size=1000)
+    exposes = Hunter(config, id_watch).hunt_flats()
+    assert count(exposes) > 4
+    assert id_watch.pending_ids == {}
+    assert id_watch.pending_exposes == []
+    for expose in exposes:
+        assert id_watch.is_processed(expose['id'])
+
 def test_is_processed_works(mocker):
     config = Config(string=IdMaintainerTest.DUMMY_CONFIG)
     config.set_searchers([DummyCrawler()])
@@ -56,11 +181,11 @@ def test_ids_are_added_to_maintainer(mocker):
     config = Config(string=IdMaintainerTest.DUMMY_CONFIG)
     config.set_searchers([DummyCrawler()])
     id_watch = IdMaintainer(":memory:")
-    spy = mocker.spy(id_watch, "mark_processed")
+    spy = mocker.spy(id_watch, "mark_processed_many")
     hunter = Hunter(config, id_watch)
     exposes = hunter.hunt_flats()
     assert count(exposes) > 4
-    assert spy.call_count == 24
+    assert sum(len(call.args[0]) for call in spy.call_args_list) == 24
 
 def test_exposes_are_saved_to_maintainer():
     config = Config(string=IdMaintainerTest.CONFIG_WITH_FILTERS)
@@ -85,6 +210,20 @@ def test_exposes_are_returned_as_dictionaries():
     assert expose['title'] is not None
     assert expose['created_at'] is not None
 
+def test_exposes_are_saved_with_descriptions():
+    class DescribingCrawler(DummyCrawler):
+        def load_descriptions(self, exposes, timeout):
+            for expose in exposes:
+                expose['description'] = "Description of %s" % expose['id']
+            return exposes
+    config = Config(string=IdMaintainerTest.DUMMY_CONFIG)
+    config.set_searchers([DescribingCrawler()])
+    id_watch = IdMaintainer(":memory:")
+    exposes = Hunter(config, id_watch).hunt_flats()
+    saved = { expose['id']: expose for expose in id_watch.get_recent_exposes(1000) }
+    for expose in exposes:
+        assert saved[expose['id']]['description'] == "Description of %s" % expose['id']
+
 def test_exposes_are_returned_with_limit():
     config = Config(string=IdMaintainerTest.CONFIG_WITH_FILTERS)
     config.set_searchers([DummyCrawler()])
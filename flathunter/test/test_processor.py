@@ -43,3 +43,25 @@ google_maps_api:
         exposes = chain.process(exposes)
         for expose in exposes:
             self.assertFalse(expose['address'].startswith('http'), "Expected addresses to be processed")
+
+    def test_descriptions_are_loaded_in_batches(self):
+        batches = []
+        class DescribingCrawler(DummyCrawler):
+            def load_descriptions(self, exposes, timeout):
+                batches.append(len(exposes))
+                for expose in exposes:
+                    expose['description'] = "Description of %s" % expose['id']
+                return exposes
+        crawler = DescribingCrawler()
+        config = Config(string=self.DUMMY_CONFIG + "\ndescriptions:\n  tabs: 3\n")
+        config.set_searchers([crawler])
+        exposes = crawler.get_results("https://www.example.com/search")[:7]
+        chain = ProcessorChain.builder(config) \
+            .enrich_descriptions() \
+            .build()
+        result = list(chain.process(iter(exposes)))
+        self.assertEqual(result, exposes)
+        self.assertEqual(batches, [3, 3, 1])
+        for expose in result:
+            self.assertEqual(expose['description'], "Description of %s" % expose['id'])
+
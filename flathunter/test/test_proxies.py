@@ -0,0 +1,54 @@
+import pytest
+import requests_mock
+
+from flathunter.proxies import ProxyPool, ProxyUnavailableError, get_proxies
+
+URL = 'https://www.example.com/search'
+
+def respond_by_proxy(request, context):
+    if request.proxies['https'] == 'bad:1':
+        context.status_code = 503
+        return 'unavailable'
+    return 'page via ' + request.proxies['https']
+
+@pytest.fixture
+def pool():
+    pool = ProxyPool(race=1, max_failures=2, source=lambda: { 'bad:1', 'good:2' })
+    yield pool
+    pool.stop()
+
+@requests_mock.Mocker(kw='m')
+def test_fetch_skips_failing_proxies(pool, **kwargs):
+    kwargs['m'].get(URL, text=respond_by_proxy)
+    for _ in range(3):
+        assert pool.fetch(URL, {}).text == 'page via good:2'
+
+def test_failing_proxies_are_quarantined(pool):
+    pool.refresh()
+    pool.record('bad:1')
+    assert pool.best(2) == [ 'good:2', 'bad:1' ]
+    pool.record('bad:1')
+    assert pool.best(2) == [ 'good:2' ]
+
+def test_faster_proxies_are_preferred(pool):
+    pool.refresh()
+    pool.record('bad:1', 0.5)
+    pool.record('good:2', 2.0)
+    assert pool.best(2) == [ 'bad:1', 'good:2' ]
+
+@requests_mock.Mocker(kw='m')
+def test_fetch_gives_up_after_max_rounds(**kwargs):
+    kwargs['m'].get(URL, status_code=500)
+    pool = ProxyPool(max_rounds=2, source=lambda: { 'bad:1' })
+    with pytest.raises(ProxyUnavailableError):
+        pool.fetch(URL, {})
+    pool.stop()
+
+@requests_mock.Mocker(kw='m')
+def test_malformed_proxy_list_keeps_current_proxies(**kwargs):
+    kwargs['m'].get('https://free-proxy-list.net/', text='')
+    pool = ProxyPool(source=get_proxies)
+    pool.stats = { 'good:2': None }
+    pool.refresh()
+    assert list(pool.stats) == [ 'good:2' ]
+    assert kwargs['m'].last_request.timeout == 30
@@ -1,6 +1,11 @@
+import json
+import sqlite3
+import pika
+import pytest
 import requests_mock
 import unittest
-from flathunter.sender_telegram import SenderTelegram 
+from flathunter.config import Config
+from flathunter.sender_telegram import SenderTelegram, TelegramPublisher, TelegramOutbox, TelegramBroker
 
 class SenderTelegramTest(unittest.TestCase):
 
@@ -15,3 +20,179 @@ class SenderTelegramTest(unittest.TestCase):
     def test_send_no_message_if_no_receivers(self, m):
       sender = SenderTelegram({ "telegram": { "bot_token": "dummy_token", "receiver_ids": None }})
       self.assertEqual(None, sender.send_msg("result"), "Expected no message to be sent")
+
+PUBLISHER_CONFIG = """
+telegram:
+  bot_token: dummy_token
+  receiver_ids:
+    - 123
+rabbitmq:
+  outbox: {outbox}
+"""
+
+class FakeChannel:
+
+    def __init__(self, fail=False):
+        self.published = []
+        self.uncommitted = []
+        self.commits = 0
+        self.fail = fail
+        self.unroutable = set()
+        self.queue = None
+        self.durable = None
+        self.transactional = False
+        self.on_return = None
+
+    def queue_declare(self, queue, durable=False):
+        self.queue = queue
+        self.durable = durable
+
+    def add_on_return_callback(self, callback):
+        self.on_return = callback
+
+    def tx_select(self):
+        self.transactional = True
+
+    def tx_commit(self):
+        for properties, body in self.uncommitted:
+            if body in self.unroutable:
+                self.unroutable.discard(body)
+                self.on_return(self, None, properties, body)
+            else:
+                self.published.append(json.loads(body))
+        self.uncommitted = []
+        self.commits += 1
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if self.fail:
+            raise pika.exceptions.StreamLostError("connection reset")
+        assert properties.delivery_mode == 2
+        self.uncommitted.append((properties, body))
+
+class FakeConnection:
+
+    opened = []
+    failing = set()
+
+    def __init__(self, params):
+        self.is_open = True
+        self.fake_channel = FakeChannel(fail=len(FakeConnection.opened) in FakeConnection.failing)
+        FakeConnection.opened.append(self)
+
+    def channel(self):
+        return self.fake_channel
+
+    def process_data_events(self, time_limit):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    monkeypatch.setattr(TelegramPublisher, 'instance', None)
+    config = Config(string=PUBLISHER_CONFIG.format(outbox=tmp_path / "outbox.db"))
+    yield config
+    TelegramPublisher.get_instance(config).close()
+
+@pytest.fixture
+def connections(monkeypatch):
+    FakeConnection.opened = []
+    FakeConnection.failing = set()
+    monkeypatch.setattr(pika, 'BlockingConnection', FakeConnection)
+    return FakeConnection
+
+def test_senders_share_one_lazy_connection(config, connections):
+    first, second = SenderTelegram(config), SenderTelegram(config, receivers=[ 456 ])
+    assert connections.opened == []
+    first.send_msg("hello", new_listing=False)
+    second.send_msg("hello", new_listing=False)
+    assert first.publisher.flush(timeout=10)
+    assert len(connections.opened) == 1
+    channel = connections.opened[0].fake_channel
+    assert channel.queue == 'telegram_durable'
+    assert channel.durable and channel.transactional
+    assert [ call['params']['chat_id'] for call in channel.published ] == [ 123, 456 ]
+    assert first.publisher.outbox.pending() == []
+
+def test_publisher_reconnects_after_lost_connection(config, connections):
+    connections.failing = { 0 }
+    sender = SenderTelegram(config)
+    sender.send_msg("hello", new_listing=False)
+    assert sender.publisher.flush(timeout=10)
+    assert len(connections.opened) == 2
+    assert not connections.opened[0].is_open
+    assert connections.opened[1].fake_channel.published[0]['params']['text'] == "hello"
+
+def test_outbox_is_published_after_restart(config, connections):
+    outbox = TelegramOutbox(config.rabbitmq_outbox())
+    outbox.add(json.dumps({ 'url': 'https://api.telegram.org/botdummy_token/sendMessage', 'params': { 'chat_id': 1, 'text': 'left over' } }))
+    sender = SenderTelegram(config)
+    sender.send_msg("hello", new_listing=False)
+    assert sender.publisher.flush(timeout=10)
+    published = connections.opened[0].fake_channel.published
+    assert [ call['params']['text'] for call in published ] == [ 'left over', 'hello' ]
+    assert outbox.pending() == []
+
+def test_messages_are_sent_directly_without_rabbitmq(config, monkeypatch):
+    def refuse(params):
+        raise pika.exceptions.AMQPConnectionError("refused")
+    monkeypatch.setattr(pika, 'BlockingConnection', refuse)
+    sender = SenderTelegram(config)
+    with requests_mock.Mocker() as mock:
+        mock.post('https://api.telegram.org/botdummy_token/sendMessage', text='{"ok":true}')
+        sender.deliver(789, { 'title': 'Flat', 'rooms': '2', 'size': '60', 'price': '900', 'rent_warm': '1100',
+                              'url': 'https://example.com/1', 'address': 'Berlin', 'images': [], 'description': None })
+        assert sender.publisher.flush(timeout=10)
+        assert mock.call_count == 2
+        assert mock.request_history[0].qs['chat_id'] == [ '789' ]
+
+def test_publisher_works_without_outbox(tmp_path, monkeypatch, connections):
+    monkeypatch.setattr(TelegramPublisher, 'instance', None)
+    config = Config(string=PUBLISHER_CONFIG.format(outbox=tmp_path / "read-only" / "outbox.db"))
+    sender = SenderTelegram(config)
+    sender.send_msg("hello", new_listing=False)
+    assert sender.publisher.flush(timeout=10)
+    assert sender.publisher.outbox is None
+    assert connections.opened[0].fake_channel.published[0]['params']['text'] == "hello"
+    sender.publisher.close()
+
+def test_failed_batch_does_not_stop_publishing(config, connections, monkeypatch):
+    sender = SenderTelegram(config)
+    sender.send_msg("first", new_listing=False)
+    assert sender.publisher.flush(timeout=10)
+    remove, failures = sender.publisher.outbox.remove, []
+    def fail_once(ids):
+        if not failures:
+            failures.append(ids)
+            raise sqlite3.OperationalError("disk I/O error")
+        remove(ids)
+    monkeypatch.setattr(sender.publisher.outbox, 'remove', fail_once)
+    sender.send_msg("second", new_listing=False)
+    assert sender.publisher.flush(timeout=10)
+    assert failures
+    sender.send_msg("third", new_listing=False)
+    assert sender.publisher.flush(timeout=10)
+    published = [ call['params']['text'] for connection in connections.opened
+                  for call in connection.fake_channel.published ]
+    assert published[-1] == "third"
+
+def test_broker_commits_a_batch_at_once(config, connections):
+    broker = TelegramBroker(config)
+    channel = broker.connect()
+    bodies = [ json.dumps({ 'url': 'u', 'params': { 'text': text } }) for text in [ 'a', 'b', 'c' ] ]
+    channel.unroutable = { bodies[1] }
+    assert broker.publish(bodies) == { 1 }
+    assert channel.commits == 1
+    assert [ call['params']['text'] for call in channel.published ] == [ 'a', 'c' ]
+    broker.reset()
+
+def test_returned_messages_are_published_again(config, connections):
+    sender = SenderTelegram(config)
+    channel = sender.publisher.broker.connect()
+    channel.unroutable = { json.dumps({ 'url': sender.send_msg_url, 'params': { 'chat_id': 123, 'text': 'hello' } }) }
+    sender.send_msg("hello", new_listing=False)
+    assert sender.publisher.flush(timeout=10)
+    assert channel.commits == 2
+    assert channel.published[0]['params']['text'] == "hello"
+    assert sender.publisher.outbox.pending() == []
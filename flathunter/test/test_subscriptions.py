@@ -0,0 +1,76 @@
+import random
+
+from flathunter.config import Config
+from flathunter.filter import Filter
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.sender_mattermost import SenderMattermost
+from flathunter.subscriptions import SubscriptionIndex
+from flathunter.web_hunter import WebHunter
+from dummy_crawler import DummyCrawler
+
+def expose(expose_id, price, size, rooms, title="Wohnung"):
+    return { 'id': expose_id, 'price': price, 'size': size, 'rooms': rooms, 'title': title }
+
+USERS = [
+    (1, { 'filters': { 'max_price': 1000, 'min_size': 50 } }),
+    (2, { 'filters': { 'min_price': 800, 'max_rooms': 2 } }),
+    (3, { 'filters': { 'max_price': 2000, 'excluded_titles': [ 'wg' ] } }),
+    (4, { 'filters': { 'max_price': 5000 }, 'mute_notifications': True }),
+    (5, {}),
+]
+
+def test_exposes_are_delivered_to_matching_users():
+    index = SubscriptionIndex(USERS)
+    assert index.matches(expose(1, "900 €", "60 m²", "2")) == [ 1, 2, 3, 5 ]
+    assert index.matches(expose(2, "1.500 €", "40 m²", "3")) == [ 3, 5 ]
+    assert index.matches(expose(3, "700 €", "40 m²", "1", title="WG-Zimmer")) == [ 5 ]
+    assert index.matches(expose(4, "auf Anfrage", "70 m²", "4")) == [ 1, 3, 5 ]
+
+def test_deliveries_are_grouped_by_user():
+    index = SubscriptionIndex(USERS)
+    first, second = expose(1, "900 €", "60 m²", "2"), expose(2, "1.500 €", "40 m²", "3")
+    assert index.deliveries([ first, second ]) == { 1: [ first ], 2: [ first ], 3: [ first, second ], 5: [ first, second ] }
+
+def test_index_matches_like_the_user_filters():
+    rng = random.Random(0)
+    users = []
+    for user_id in range(300):
+        filters = {}
+        for field, low, high in [ ('price', 300, 3000), ('size', 20, 150), ('rooms', 1, 6) ]:
+            if rng.random() < 0.6:
+                filters['min_' + field] = rng.randint(low, high)
+            if rng.random() < 0.6:
+                filters['max_' + field] = rng.randint(low, high)
+        users.append((user_id, { 'filters': filters }))
+    index = SubscriptionIndex(users)
+    for expose_id in range(200):
+        flat = expose(expose_id, f"{rng.randint(300, 3000)} €", f"{rng.randint(20, 150)} m²", str(rng.randint(1, 6)))
+        expected = [ user_id for user_id, settings in users
+                     if Filter.builder().read_config(settings).build().is_interesting_expose(flat) ]
+        assert index.matches(flat) == expected
+
+def test_index_is_rebuilt_only_when_settings_change():
+    id_watch = IdMaintainer(":memory:")
+    hunter = WebHunter(Config(string="urls: []"), id_watch)
+    hunter.set_filters_for_user(1, { 'max_price': 1000 })
+    index = hunter.get_subscriptions()
+    assert hunter.get_subscriptions() is index
+    hunter.set_filters_for_user(1, { 'max_price': 500 })
+    assert hunter.get_subscriptions() is not index
+    assert hunter.get_subscriptions().matches(expose(1, "700 €", "60 m²", "2")) == []
+
+def test_users_are_notified_without_telegram(monkeypatch):
+    sent = []
+    monkeypatch.setattr(SenderMattermost, 'send_msg', lambda self, message: sent.append(message))
+    config = Config(string="""
+urls:
+  - https://www.example.com/search/flats-in-berlin
+notifiers:
+  - mattermost
+""")
+    config.set_searchers([DummyCrawler()])
+    id_watch = IdMaintainer(":memory:")
+    id_watch.save_settings_for_user(1, {})
+    exposes = WebHunter(config, id_watch).hunt_flats()
+    assert len(exposes) > 0
+    assert len(sent) == 2 * len(exposes)
@@ -13,6 +13,12 @@ log = logging.getLogger('rabbit_receiver')
 log.setLevel(logging.DEBUG)
 logging.basicConfig()
 
+# Durable queue the publisher sends to. Earlier versions used the non-durable
+# queue 'telegram', which cannot be redeclared as durable - messages still in
+# it are delivered as well
+QUEUE = 'telegram_durable'
+LEGACY_QUEUE = 'telegram'
+
 
 def callback(ch: BlockingChannel, method, properties, body):
     log.debug("Received message: %s", body)
@@ -47,6 +53,17 @@ def callback(ch: BlockingChannel, method, properties, body):
         time.sleep(1.5)
 
 
+def legacy_queue_exists(connection) -> bool:
+    # a passive declare of a missing queue closes the channel, so use a separate one
+    legacy_channel = connection.channel()
+    try:
+        legacy_channel.queue_declare(queue=LEGACY_QUEUE, passive=True)
+    except pika.exceptions.ChannelClosedByBroker:
+        return False
+    legacy_channel.close()
+    return True
+
+
 def wait_for_rabbitmq(host: str, port: int, timeout=3):
     is_reachable = False
     while not is_reachable:
@@ -76,8 +93,12 @@ if __name__ == '__main__':
     log.debug("Connecting to RabbitMQ on url %s", url)
     connection = pika.BlockingConnection(params)
     channel = connection.channel()
-    channel.queue_declare(queue='telegram')
-    channel.basic_consume(queue='telegram', auto_ack=False, on_message_callback=callback)
+    # durable, like the publisher's queue, so queued messages survive a broker restart
+    channel.queue_declare(queue=QUEUE, durable=True)
+    channel.basic_consume(queue=QUEUE, auto_ack=False, on_message_callback=callback)
+    if legacy_queue_exists(connection):
+        log.info("Also delivering the messages left in the old '%s' queue", LEGACY_QUEUE)
+        channel.basic_consume(queue=LEGACY_QUEUE, auto_ack=False, on_message_callback=callback)
     try:
         log.debug("Waiting for messages...")
         channel.start_consuming()